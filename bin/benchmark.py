@@ -0,0 +1,548 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Benchmark image comparison, notebook instrumentation and grouping of image changes on synthetic data."""
+
+import argparse
+import collections.abc
+import contextlib
+import importlib.metadata
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+
+import git_diff_unique
+import imagehash
+import nbformat
+import numpy as np
+import numpy.typing as npt
+import PIL.Image
+
+import image_cache_tester.compare_arrays
+import image_cache_tester.compare_images
+import image_cache_tester.decoded_image_cache
+import image_cache_tester.image_cache_manifest
+import image_cache_tester.image_pyramid
+
+suites = ("compare", "instrument", "group", "git")
+
+_conftest = """import image_cache_tester.pytest_hooks_notebooks
+
+pytest_addoption = image_cache_tester.pytest_hooks_notebooks.addoption
+pytest_collect_file = image_cache_tester.pytest_hooks_notebooks.collect_file
+pytest_collection_modifyitems = image_cache_tester.pytest_hooks_notebooks.collection_modifyitems
+pytest_runtest_makereport = image_cache_tester.pytest_hooks_notebooks.runtest_makereport
+pytest_sessionstart = image_cache_tester.pytest_hooks_notebooks.sessionstart
+pytest_sessionfinish = image_cache_tester.pytest_hooks_notebooks.sessionfinish
+pytest_terminal_summary = image_cache_tester.pytest_hooks_notebooks.terminal_summary
+pytest_xdist_auto_num_workers = image_cache_tester.pytest_hooks_notebooks.xdist_auto_num_workers
+"""
+
+
+def synthetic_image(size: int, seed: int) -> npt.NDArray[np.uint8]:
+    """
+    Generate an image resembling a rendered scene: a smooth background with a few flat shapes.
+
+    Parameters
+    ----------
+    size : int
+        Width and height of the image.
+    seed : int
+        Seed of the random number generator, so that the same image is generated on every run.
+
+    Returns
+    -------
+    npt.NDArray[np.uint8]
+        The image content, stored as a uint8 array of shape (size, size, 3).
+    """
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, 255, size, dtype=np.float64)
+    image_array = np.empty((size, size, 3), dtype=np.uint8)
+    image_array[..., 0] = gradient[np.newaxis, :]
+    image_array[..., 1] = gradient[:, np.newaxis]
+    image_array[..., 2] = 128
+    for _ in range(8):
+        left, upper = rng.integers(0, size, 2)
+        extent = rng.integers(size // 16, size // 4 + 1)
+        image_array[upper:upper + extent, left:left + extent] = rng.integers(0, 256, 3, dtype=np.uint8)
+    return image_array
+
+
+def perturb_image(image_array: npt.NDArray[np.uint8], density: float, seed: int) -> npt.NDArray[np.uint8]:
+    """
+    Perturb a fraction of the pixels of an image, as antialiasing differences between two renderings would do.
+
+    Parameters
+    ----------
+    image_array : npt.NDArray[np.uint8]
+        The image content.
+    density : float
+        Fraction of pixels to be perturbed.
+    seed : int
+        Seed of the random number generator.
+
+    Returns
+    -------
+    npt.NDArray[np.uint8]
+        A perturbed copy of the image, whose perturbed channels differ by at most 8 from the original ones.
+    """
+    rng = np.random.default_rng(seed)
+    perturbed_array = image_array.copy()
+    num_pixels = image_array.shape[0] * image_array.shape[1]
+    pixels = rng.choice(num_pixels, int(density * num_pixels), replace=False)
+    rows, columns = np.divmod(pixels, image_array.shape[1])
+    perturbed_array[rows, columns] ^= rng.integers(1, 8, (len(pixels), 3), dtype=np.uint8)
+    return perturbed_array
+
+
+def synthetic_notebook(num_cells: int, seed: int) -> nbformat.NotebookNode:
+    """
+    Generate a notebook with markdown cells, plain code cells and cells showing a pyvista plotter.
+
+    Parameters
+    ----------
+    num_cells : int
+        Number of cells of the notebook.
+    seed : int
+        Seed of the random number generator, which determines the kind of each cell and the cell ids.
+
+    Returns
+    -------
+    nbformat.NotebookNode
+        The notebook.
+    """
+    rng = np.random.default_rng(seed)
+    cells = [nbformat.v4.new_code_cell("import pyvista")]  # type: ignore[no-untyped-call]
+    for cell_index in range(1, num_cells):
+        kind = rng.integers(0, 3)
+        if kind == 0:
+            cell = nbformat.v4.new_markdown_cell(f"## Section {cell_index}")  # type: ignore[no-untyped-call]
+        elif kind == 1:
+            cell = nbformat.v4.new_code_cell(f"value_{cell_index} = {cell_index} ** 2")  # type: ignore[no-untyped-call]
+        else:
+            cell = nbformat.v4.new_code_cell(  # type: ignore[no-untyped-call]
+                f"plotter_{cell_index} = pyvista.Plotter(off_screen=True)\n"
+                f"_ = plotter_{cell_index}.add_mesh(pyvista.Sphere())\n"
+                f"plotter_{cell_index}.show()")
+        cells.append(cell)
+    for cell in cells:
+        cell.id = f"{rng.integers(0, 2**32):08x}"
+    return typing.cast(nbformat.NotebookNode, nbformat.v4.new_notebook(cells=cells))  # type: ignore[no-untyped-call]
+
+
+def synthetic_git_history(
+    root: str, num_images: int, num_groups: int, size: int, seed: int
+) -> str:
+    """
+    Generate a git repository whose last commit changes images in a few groups of similar changes.
+
+    Parameters
+    ----------
+    root : str
+        Directory in which the repository is created.
+    num_images : int
+        Number of images, all of which are changed by the last commit.
+    num_groups : int
+        Number of distinct changes applied to the images.
+    size : int
+        Width and height of the images.
+    seed : int
+        Seed of the random number generator.
+
+    Returns
+    -------
+    str
+        The git range spanning the last commit.
+    """
+    def git(*args: str) -> None:
+        subprocess.run(
+            ["git", "-c", "user.name=benchmark", "-c", "user.email=benchmark@localhost", *args], cwd=root,
+            check=True, capture_output=True)
+
+    git("init", "-q")
+    images = [synthetic_image(size, seed + image_index) for image_index in range(num_images)]
+    for (image_index, image_array) in enumerate(images):
+        PIL.Image.fromarray(image_array).save(os.path.join(root, f"image_{image_index}.png"))
+    git("add", ".")
+    git("commit", "-q", "-m", "Old images")
+    colors = np.random.default_rng(seed).integers(0, 256, (num_groups, 3), dtype=np.uint8)
+    for (image_index, image_array) in enumerate(images):
+        # Each group paints a band of a different color at a different position
+        group = image_index % num_groups
+        changed_array = image_array.copy()
+        changed_array[group * size // num_groups:(group + 1) * size // num_groups, :size // 2] = colors[group]
+        PIL.Image.fromarray(changed_array).save(os.path.join(root, f"image_{image_index}.png"))
+    git("commit", "-q", "-a", "-m", "New images")
+    return "HEAD~1..HEAD"
+
+
+def measure(function: collections.abc.Callable[[], typing.Any], repeat: int) -> list[float]:
+    """
+    Measure the wall clock time of repeated calls of a function.
+
+    Parameters
+    ----------
+    function : collections.abc.Callable[[], typing.Any]
+        The function to be timed.
+    repeat : int
+        Number of calls.
+
+    Returns
+    -------
+    list[float]
+        The time of each call, in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def benchmark_compare(root: str, quick: bool, repeat: int) -> dict[str, dict[str, typing.Any]]:
+    """
+    Benchmark the comparison of an actual image stored on disk to an expected image in the image cache.
+
+    Each size and density of differing pixels is compared with every comparison mode, both requiring identical
+    images, which exits at the first differing block, and with tolerances accepting the differences, which
+    processes the whole image.
+
+    Parameters
+    ----------
+    root : str
+        Directory in which the images are generated.
+    quick : bool
+        If True, only use small images.
+    repeat : int
+        Number of timed comparisons of each pair of images.
+
+    Returns
+    -------
+    dict[str, dict[str, typing.Any]]
+        Dictionary from the name of each benchmark to its parameters and times.
+    """
+    sizes = (256, 512) if quick else (512, 2048)
+    densities = (0.0, 0.001, 0.1)
+    modes: dict[str, dict[str, typing.Any]] = {
+        "full": {}, "digests": {"use_digests": True}, "tiles": {"tile_size": 64},
+        "strips": {"memory_limit": 16 * 2**20}}
+    tolerances = {
+        "exact": image_cache_tester.compare_arrays.Tolerances(),
+        "lenient": image_cache_tester.compare_arrays.Tolerances(channel_threshold=8, max_differing_fraction=0.2)
+    }
+    results = {}
+    for size in sizes:
+        expected_array = synthetic_image(size, seed=size)
+        expected_image_path = os.path.join(root, f"expected_{size}.png")
+        PIL.Image.fromarray(expected_array).save(expected_image_path)
+        image_cache_tester.image_cache_manifest.record(expected_image_path, expected_array)
+        image_cache_tester.image_pyramid.save_pyramid(expected_image_path, expected_array, 64)
+        for density in densities:
+            actual_image_path = os.path.join(root, f"actual_{size}_{density}.png")
+            PIL.Image.fromarray(perturb_image(expected_array, density, seed=size)).save(actual_image_path)
+            for (mode, mode_kwargs) in modes.items():
+                for (tolerances_name, mode_tolerances) in tolerances.items():
+                    def compare(
+                        actual_image_path: str = actual_image_path, mode_kwargs: dict[str, typing.Any] = mode_kwargs,
+                        mode_tolerances: image_cache_tester.compare_arrays.Tolerances = mode_tolerances
+                    ) -> None:
+                        # Expected images are decoded on every call, as in the first comparison of a session
+                        image_cache_tester.decoded_image_cache.expected_images.clear()
+                        image_cache_tester.compare_images._compare_images(
+                            actual_image_path, expected_image_path, False, tolerances=mode_tolerances,
+                            **mode_kwargs)
+
+                    results[f"compare/{mode}/{tolerances_name}/size={size}/density={density}"] = {
+                        "size": size, "density": density, "mode": mode, "tolerances": tolerances_name,
+                        "times": measure(compare, repeat)}
+    return results
+
+
+def benchmark_instrument(root: str, quick: bool, repeat: int) -> dict[str, dict[str, typing.Any]]:
+    """
+    Benchmark the instrumentation of notebooks carried out when the pytest session starts.
+
+    Each run is a separate pytest process which only creates the notebooks in the work directory.
+    The time spent by nbvalx alone is measured too, so that it can be subtracted from the other runs.
+
+    Parameters
+    ----------
+    root : str
+        Directory in which the notebook tree is generated.
+    quick : bool
+        If True, only generate a few small notebooks.
+    repeat : int
+        Number of timed pytest runs of each kind.
+
+    Returns
+    -------
+    dict[str, dict[str, typing.Any]]
+        Dictionary from the name of each benchmark to its parameters and times.
+    """
+    num_notebooks, num_cells = (4, 20) if quick else (40, 60)
+    tree = os.path.join(root, "notebooks")
+    for notebook_index in range(num_notebooks):
+        notebook_dir = os.path.join(tree, f"directory_{notebook_index % 4}")
+        os.makedirs(notebook_dir, exist_ok=True)
+        with open(os.path.join(notebook_dir, f"notebook_{notebook_index}.ipynb"), "w") as f:
+            nbformat.write(synthetic_notebook(num_cells, seed=notebook_index), f)  # type: ignore[no-untyped-call]
+    with open(os.path.join(tree, "conftest.py"), "w") as f:
+        f.write(_conftest)
+    cache_dir = os.path.join(root, "pytest_cache")
+    runs = {
+        "nbvalx": ["-p", "no:cacheprovider"],
+        "cold": ["-p", "no:cacheprovider", "--verify-images"],
+        "warm": ["-o", f"cache_dir={cache_dir}", "--verify-images"]
+    }
+
+    def run_pytest(arguments: list[str]) -> None:
+        result = subprocess.run(
+            [sys.executable, "-m", "pytest", "-q", "--ipynb-action=create-notebooks", *arguments, tree],
+            cwd=root, capture_output=True, text=True)
+        # No tests are collected when only creating notebooks
+        if result.returncode not in (0, 5):
+            raise RuntimeError(f"pytest failed:\n{result.stdout}\n{result.stderr}")
+
+    # Fill the cache of instrumented notebooks before timing warm runs
+    run_pytest(runs["warm"])
+    return {
+        f"instrument/{run}/notebooks={num_notebooks}/cells={num_cells}": {
+            "notebooks": num_notebooks, "cells": num_cells, "run": run,
+            "times": measure(lambda arguments=arguments: run_pytest(arguments), repeat)}  # type: ignore[misc]
+        for (run, arguments) in runs.items()
+    }
+
+
+def benchmark_group(quick: bool, repeat: int) -> dict[str, dict[str, typing.Any]]:
+    """
+    Benchmark grouping of image changes on synthetic perceptual hashes.
+
+    Hashes are random perturbations of a few centers, so that changes form clusters as in real histories.
+
+    Parameters
+    ----------
+    quick : bool
+        If True, only group a few changes.
+    repeat : int
+        Number of timed groupings.
+
+    Returns
+    -------
+    dict[str, dict[str, typing.Any]]
+        Dictionary from the name of each benchmark to its parameters and times.
+    """
+    rng = np.random.default_rng(0)
+    results = {}
+    for num_changes in ((1000, ) if quick else (1000, 20000)):
+        num_clusters = max(num_changes // 50, 1)
+        old_centers = rng.integers(0, 2, (num_clusters, 8, 8), dtype=bool)
+        new_centers = rng.integers(0, 2, (num_clusters, 8, 8), dtype=bool)
+        images_info = []
+        for change_index in range(num_changes):
+            cluster = rng.integers(0, num_clusters)
+            old_hash = imagehash.ImageHash(old_centers[cluster] ^ (rng.random((8, 8)) < 0.02))
+            new_hash = imagehash.ImageHash(new_centers[cluster] ^ (rng.random((8, 8)) < 0.02))
+            images_info.append((f"image_{change_index}.png", old_hash, new_hash, new_hash - old_hash))
+
+        def group(images_info: list[tuple[str, typing.Any, typing.Any, int]] = images_info) -> None:
+            with contextlib.redirect_stdout(io.StringIO()):
+                git_diff_unique.group_similar_changes(images_info)
+
+        results[f"group/changes={num_changes}"] = {"changes": num_changes, "times": measure(group, repeat)}
+    return results
+
+
+def benchmark_git(root: str, quick: bool, repeat: int) -> dict[str, dict[str, typing.Any]]:
+    """
+    Benchmark the whole analysis of image changes in a synthetic git history.
+
+    Parameters
+    ----------
+    root : str
+        Directory in which the git repository is generated.
+    quick : bool
+        If True, only change a few small images.
+    repeat : int
+        Number of timed analyses in each mode.
+
+    Returns
+    -------
+    dict[str, dict[str, typing.Any]]
+        Dictionary from the name of each benchmark to its parameters and times.
+    """
+    num_images, size = (20, 128) if quick else (200, 512)
+    repository = os.path.join(root, "repository")
+    os.makedirs(repository)
+    git_range = synthetic_git_history(repository, num_images, num_groups=5, size=size, seed=0)
+    results = {}
+    current_dir = os.getcwd()
+    os.chdir(repository)
+    try:
+        for mode in ("cat-file", "checkout"):
+            def analyze(mode: str = mode) -> None:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    git_diff_unique.analyze_git_image_changes(git_range, 5, mode=mode)
+
+            results[f"git/{mode}/images={num_images}/size={size}"] = {
+                "images": num_images, "size": size, "mode": mode, "times": measure(analyze, repeat)}
+    finally:
+        os.chdir(current_dir)
+    return results
+
+
+def run_benchmarks(selected_suites: list[str], quick: bool, repeat: int) -> dict[str, typing.Any]:
+    """
+    Run the selected benchmark suites.
+
+    Parameters
+    ----------
+    selected_suites : list[str]
+        Names of the suites to be run.
+    quick : bool
+        If True, use small synthetic data, e.g. to check that the benchmarks still run.
+    repeat : int
+        Number of timed repetitions of each benchmark.
+
+    Returns
+    -------
+    dict[str, typing.Any]
+        Dictionary containing the environment in which benchmarks were run and, for each benchmark, its
+        parameters, the time of each repetition and their minimum and median.
+    """
+    benchmarks: dict[str, dict[str, typing.Any]] = {}
+    with tempfile.TemporaryDirectory() as root:
+        for suite in selected_suites:
+            print(f"Running {suite} benchmarks...", file=sys.stderr)
+            suite_root = os.path.join(root, suite)
+            os.makedirs(suite_root)
+            if suite == "compare":
+                benchmarks.update(benchmark_compare(suite_root, quick, repeat))
+            elif suite == "instrument":
+                benchmarks.update(benchmark_instrument(suite_root, quick, repeat))
+            elif suite == "group":
+                benchmarks.update(benchmark_group(quick, repeat))
+            else:
+                assert suite == "git"
+                benchmarks.update(benchmark_git(suite_root, quick, repeat))
+    for benchmark in benchmarks.values():
+        benchmark["min"] = min(benchmark["times"])
+        benchmark["median"] = statistics.median(benchmark["times"])
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "environment": {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "commit": commit,
+            "image_cache_tester": importlib.metadata.version("image_cache_tester"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pillow": PIL.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "quick": quick,
+            "repeat": repeat
+        },
+        "benchmarks": benchmarks
+    }
+
+
+def compare_results(
+    baseline: dict[str, typing.Any], current: dict[str, typing.Any], threshold: float, statistic: str = "min"
+) -> tuple[list[tuple[str, float, float, float]], list[str]]:
+    """
+    Compare the results of two benchmark runs.
+
+    Parameters
+    ----------
+    baseline : dict[str, typing.Any]
+        Results of the reference run, as returned by run_benchmarks.
+    current : dict[str, typing.Any]
+        Results of the run to be checked.
+    threshold : float
+        Relative slowdown above which a benchmark is considered as a regression, e.g. 0.1 for 10%.
+    statistic : str, optional
+        Statistic of the repetitions to be compared, either "min" or "median" (default is "min").
+
+    Returns
+    -------
+    tuple[list[tuple[str, float, float, float]], list[str]]
+        A pair containing, for each benchmark of both runs, its name, baseline time, current time and ratio
+        between them, and the names of the benchmarks which regressed.
+    """
+    rows = []
+    regressions = []
+    for (name, current_benchmark) in current["benchmarks"].items():
+        baseline_benchmark = baseline["benchmarks"].get(name)
+        if baseline_benchmark is None:
+            continue
+        ratio = current_benchmark[statistic] / baseline_benchmark[statistic]
+        rows.append((name, baseline_benchmark[statistic], current_benchmark[statistic], ratio))
+        if ratio > 1 + threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main() -> None:
+    """Run the main entry point of the script."""
+    parser = argparse.ArgumentParser(description="Benchmark image cache tester on synthetic data.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="Run benchmarks and record their results as JSON.")
+    run_parser.add_argument(
+        "--suite", choices=suites, action="append", default=None,
+        help="Suite to be run, which may be passed multiple times (default: all suites)")
+    run_parser.add_argument(
+        "--quick", action="store_true", help="Use small synthetic data, to check that benchmarks still run")
+    run_parser.add_argument("--repeat", type=int, default=5, help="Number of timed repetitions (default: 5)")
+    run_parser.add_argument(
+        "--output", type=str, default="-", help="File where results are written (default: stdout)")
+    compare_parser = subparsers.add_parser(
+        "compare", help="Compare recorded results, failing if any benchmark regressed.")
+    compare_parser.add_argument("baseline", help="Results of the reference run")
+    compare_parser.add_argument("current", help="Results of the run to be checked")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=0.1,
+        help="Relative slowdown above which a benchmark is considered as a regression (default: 0.1)")
+    compare_parser.add_argument(
+        "--statistic", choices=["min", "median"], default="min",
+        help="Statistic of the repetitions to be compared (default: min)")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run_benchmarks(args.suite or list(suites), args.quick, args.repeat)
+        if args.output == "-":
+            json.dump(results, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows, regressions = compare_results(baseline, current, args.threshold, args.statistic)
+    width = max((len(name) for (name, _, _, _) in rows), default=0)
+    for (name, baseline_time, current_time, ratio) in rows:
+        marker = " (regression)" if name in regressions else ""
+        print(f"{name:<{width}}  {baseline_time:10.4f}s  {current_time:10.4f}s  {ratio:6.2f}x{marker}")
+    print(f"{len(regressions)} regressions out of {len(rows)} benchmarks.")
+    sys.exit(1 if len(regressions) > 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
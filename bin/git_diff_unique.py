@@ -6,13 +6,26 @@
 """Analyze image changes between two Git commits, grouping similar images."""
 
 import argparse
+import base64
+import collections
+import collections.abc
+import concurrent.futures
+import contextlib
+import hashlib
+import html
+import io
+import json
 import os
+import sqlite3
 import subprocess
+import sys
 import tempfile
+import types
 import typing
 
 import imagehash
 import PIL.Image
+import PIL.ImageChops
 
 
 def run_git_command(cmd: list[str]) -> str:
@@ -98,11 +111,110 @@ def checkout_tree(commit: str, destination: str) -> None:
     print("Checkout done.")
 
 
+class BlobReader:
+    """
+    Read the content of files at a given revision from a single long-lived `git cat-file --batch` process.
+
+    The reader must be used as a context manager, so that the process is terminated when it is not needed
+    anymore.
+
+    Parameters
+    ----------
+    batch_check : bool, optional
+        If True, run `git cat-file --batch-check` instead, so that only the ids of blobs are read, without
+        their content (default is False).
+    """
+
+    def __init__(self, batch_check: bool = False) -> None:
+        self._batch_check = batch_check
+        self._process: subprocess.Popen[bytes] | None = None
+
+    def __enter__(self) -> "BlobReader":
+        """Start the `git cat-file --batch` process."""
+        self._process = subprocess.Popen(
+            ["git", "cat-file", "--batch-check" if self._batch_check else "--batch"], stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE)
+        return self
+
+    def __exit__(
+        self, exception_type: type[BaseException] | None, exception_value: BaseException | None,
+        traceback: types.TracebackType | None
+    ) -> None:
+        """Terminate the `git cat-file --batch` process."""
+        assert self._process is not None
+        assert self._process.stdin is not None
+        self._process.stdin.close()
+        self._process.wait()
+        self._process = None
+
+    def read(self, revision_path: str) -> bytes | None:
+        """
+        Read the content of a file at a given revision.
+
+        Parameters
+        ----------
+        revision_path : str
+            The revision and the path of the file, separated by a colon, e.g. 'HEAD:images/image.png'.
+
+        Returns
+        -------
+        bytes or None
+            The content of the file, or None if the file does not exist at the given revision.
+        """
+        assert not self._batch_check, "The content of blobs is not read in batch check mode"
+        header = self._request(revision_path)
+        if header is None:
+            return None
+        _, object_type, size = header
+        assert self._process is not None
+        assert self._process.stdout is not None
+        content = self._process.stdout.read(size)
+        self._process.stdout.read(1)  # drop the newline following the content
+        if object_type != "blob":
+            return None
+        return content
+
+    def blob_id(self, revision_path: str) -> str | None:
+        """
+        Read the id of a file at a given revision, without reading its content.
+
+        Parameters
+        ----------
+        revision_path : str
+            The revision and the path of the file, separated by a colon, e.g. 'HEAD:images/image.png'.
+
+        Returns
+        -------
+        str or None
+            The id of the blob, or None if the file does not exist at the given revision.
+        """
+        assert self._batch_check, "The id of blobs is only read in batch check mode"
+        header = self._request(revision_path)
+        if header is None or header[1] != "blob":
+            return None
+        return header[0]
+
+    def _request(self, revision_path: str) -> tuple[str, str, int] | None:
+        """Request an object, and return the id, type and size from its header, or None if it is missing."""
+        assert self._process is not None
+        assert self._process.stdin is not None
+        assert self._process.stdout is not None
+        self._process.stdin.write(revision_path.encode() + b"\n")
+        self._process.stdin.flush()
+        header = self._process.stdout.readline().decode().split()
+        if len(header) != 3:
+            # The object is missing or ambiguous, and git only prints a header line
+            return None
+        object_id, object_type, size = header
+        return object_id, object_type, int(size)
+
+
 def compute_hash(
     image_path: str,
     hashfunc: typing.Callable[
         [PIL.Image.Image, int, int], imagehash.ImageHash
-    ] = imagehash.phash
+    ] = imagehash.phash,
+    image_data: bytes | None = None
 ) -> imagehash.ImageHash | None:
     """
     Compute the perceptual hash of an image file.
@@ -113,6 +225,9 @@ def compute_hash(
         Path to the image file.
     hashfunc : callable, optional
         Hash function from imagehash library (default is phash).
+    image_data : bytes, optional
+        Content of the image file. If provided, the image is decoded from memory, and the path is only used
+        in messages.
 
     Returns
     -------
@@ -120,20 +235,291 @@ def compute_hash(
         The computed perceptual hash or None if hashing fails.
     """
     try:
-        img = PIL.Image.open(image_path)
+        img = PIL.Image.open(image_path if image_data is None else io.BytesIO(image_data))
         return hashfunc(img)  # type: ignore[call-arg]
     except Exception as e:
         print(f"  Error hashing image '{image_path}': {e}")
         return None
 
 
+def compute_hash_job(job: tuple[str, bytes]) -> imagehash.ImageHash | None:
+    """
+    Compute the perceptual hash of an image file decoded from memory, in a worker process.
+
+    Parameters
+    ----------
+    job : tuple[str, bytes]
+        Path to the image file, only used in messages, and content of the image file.
+
+    Returns
+    -------
+    imagehash.ImageHash or None
+        The computed perceptual hash or None if hashing fails.
+    """
+    image_path, image_data = job
+    return compute_hash(image_path, image_data=image_data)
+
+
+def map_bounded(
+    executor: concurrent.futures.Executor, function: typing.Callable[[typing.Any], typing.Any],
+    iterable: collections.abc.Iterable[typing.Any], max_in_flight: int
+) -> collections.abc.Iterator[typing.Any]:
+    """
+    Map a function over an iterable in an executor, bounding the number of items submitted at any time.
+
+    Unlike `executor.map`, which submits all items at once, the iterable is consumed lazily, so that only
+    the items in flight are held in memory.
+
+    Parameters
+    ----------
+    executor : concurrent.futures.Executor
+        The executor in which the function is run.
+    function : callable
+        The function to be mapped.
+    iterable : collections.abc.Iterable
+        The items to which the function is applied.
+    max_in_flight : int
+        Maximum number of items which were submitted, but whose result was not yet returned.
+
+    Returns
+    -------
+    collections.abc.Iterator
+        The results of the function, in the same order as the items.
+    """
+    pending: collections.deque[concurrent.futures.Future[typing.Any]] = collections.deque()
+    for item in iterable:
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+        pending.append(executor.submit(function, item))
+    while len(pending) > 0:
+        yield pending.popleft().result()
+
+
+def git_blob_id_of_file(path: str) -> str:
+    """
+    Compute the id that git assigns to a blob with the content of a file, without reading it at once.
+
+    Parameters
+    ----------
+    path : str
+        Path to the file.
+
+    Returns
+    -------
+    str
+        The SHA-1 id of the blob.
+    """
+    blob_id = hashlib.sha1(b"blob " + str(os.path.getsize(path)).encode() + b"\0")
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            blob_id.update(block)
+    return blob_id.hexdigest()
+
+
+def hash_function_name(
+    hashfunc: typing.Callable[
+        [PIL.Image.Image, int, int], imagehash.ImageHash
+    ]
+) -> str:
+    """
+    Return the name which identifies a hash function in the hash store.
+
+    Parameters
+    ----------
+    hashfunc : callable
+        Hash function from imagehash library.
+
+    Returns
+    -------
+    str
+        The fully qualified name of the hash function.
+    """
+    return f"{hashfunc.__module__}.{hashfunc.__qualname__}"
+
+
+class HashStore:
+    """
+    Persistent SQLite store of perceptual hashes, keyed by git blob id and hash function.
+
+    Since the content of a blob never changes, its perceptual hash can be reused across runs. The store
+    must be used as a context manager, so that new hashes are committed when it is not needed anymore.
+
+    Parameters
+    ----------
+    path : str
+        Path to the SQLite database, which is created if it does not exist.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._connection: sqlite3.Connection | None = None
+
+    def __enter__(self) -> "HashStore":
+        """Open the SQLite database."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._connection = sqlite3.connect(self.path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            "blob_id TEXT NOT NULL, hash_function TEXT NOT NULL, hash TEXT NOT NULL, "
+            "PRIMARY KEY (blob_id, hash_function))")
+        return self
+
+    def __exit__(
+        self, exception_type: type[BaseException] | None, exception_value: BaseException | None,
+        traceback: types.TracebackType | None
+    ) -> None:
+        """Commit new hashes and close the SQLite database."""
+        assert self._connection is not None
+        self._connection.commit()
+        self._connection.close()
+        self._connection = None
+
+    def get(self, blob_id: str, hash_function: str) -> imagehash.ImageHash | None:
+        """
+        Get the perceptual hash of a blob.
+
+        Parameters
+        ----------
+        blob_id : str
+            The git blob id.
+        hash_function : str
+            The name of the hash function.
+
+        Returns
+        -------
+        imagehash.ImageHash or None
+            The stored perceptual hash, or None if the blob has not been hashed yet.
+        """
+        assert self._connection is not None
+        row = self._connection.execute(
+            "SELECT hash FROM hashes WHERE blob_id = ? AND hash_function = ?", (blob_id, hash_function)).fetchone()
+        return imagehash.hex_to_hash(row[0]) if row is not None else None
+
+    def put(self, blob_id: str, hash_function: str, image_hash: imagehash.ImageHash) -> None:
+        """
+        Store the perceptual hash of a blob.
+
+        Parameters
+        ----------
+        blob_id : str
+            The git blob id.
+        hash_function : str
+            The name of the hash function.
+        image_hash : imagehash.ImageHash
+            The perceptual hash.
+        """
+        assert self._connection is not None
+        self._connection.execute(
+            "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?)", (blob_id, hash_function, str(image_hash)))
+
+
+def default_hash_store_path() -> str:
+    """
+    Return the default location of the hash store, inside the git directory of the current repository.
+
+    Returns
+    -------
+    str
+        Path to the SQLite database.
+    """
+    return os.path.join(run_git_command(["git", "rev-parse", "--git-common-dir"]), "git_diff_unique_hashes.sqlite")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree of integer hashes, indexed by Hamming distance.
+
+    Each node stores a hash, the position of the corresponding item and its children, keyed by their distance
+    from the node. Since the Hamming distance is a metric, a query with a given radius only needs to visit
+    the children whose key differs by at most the radius from the distance between the query and the node.
+    """
+
+    def __init__(self) -> None:
+        self._root: list[typing.Any] | None = None
+
+    def add(self, value: int, position: int) -> None:
+        """
+        Add a hash to the tree.
+
+        Parameters
+        ----------
+        value : int
+            The hash, stored as an integer.
+        position : int
+            The position of the item associated to the hash.
+        """
+        node = [value, position, {}]
+        if self._root is None:
+            self._root = node
+            return
+        current = self._root
+        while True:
+            distance = (value ^ current[0]).bit_count()
+            children = current[2]
+            if distance not in children:
+                children[distance] = node
+                return
+            current = children[distance]
+
+    def query(self, value: int, radius: int) -> list[int]:
+        """
+        Find all hashes within a given Hamming distance.
+
+        Parameters
+        ----------
+        value : int
+            The hash to be queried, stored as an integer.
+        radius : int
+            Maximum Hamming distance.
+
+        Returns
+        -------
+        list[int]
+            Positions of the items whose hash is within the given distance, in no particular order.
+        """
+        positions = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node_value, node_position, children = stack.pop()
+            distance = (value ^ node_value).bit_count()
+            if distance <= radius:
+                positions.append(node_position)
+            for child_distance, child in children.items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return positions
+
+
+def hash_to_int(image_hash: imagehash.ImageHash) -> int:
+    """
+    Convert a perceptual hash to an integer, so that Hamming distances can be computed with bit operations.
+
+    Parameters
+    ----------
+    image_hash : imagehash.ImageHash
+        The perceptual hash.
+
+    Returns
+    -------
+    int
+        The bits of the hash, stored as an integer.
+    """
+    return int(str(image_hash), 16)
+
+
 def group_similar_changes(
     images_info: list[tuple[str, typing.Any, typing.Any, int]],
-    threshold: int = 5
+    threshold: int = 5,
+    on_group: typing.Callable[[list[str]], None] | None = None
 ) -> list[list[str]]:
     """
     Group images that are similar based on old, new, and delta perceptual hashes.
 
+    Images are processed in order: each image which does not belong to a group yet starts a new group,
+    which contains all the following ungrouped images whose old hash, new hash and delta are all within the
+    threshold from the ones of the first image. Candidates are searched for in a BK-tree of the old hashes,
+    rather than by comparing all pairs of images.
+
     Parameters
     ----------
     images_info : list[tuple[str, imagehash.ImageHash, imagehash.ImageHash, int]]
@@ -141,6 +527,8 @@ def group_similar_changes(
         (image path, old hash, new hash, delta hash difference).
     threshold : int, optional
         Maximum Hamming distance allowed to consider images similar (default is 5).
+    on_group : callable, optional
+        Function called with each group as soon as it is finalized, e.g. to report it incrementally.
 
     Returns
     -------
@@ -148,29 +536,228 @@ def group_similar_changes(
         List of groups, each group is a list of image file paths.
     """
     print("Grouping images based on similarity...")
+    old_hashes = [hash_to_int(old) for (_, old, _, _) in images_info]
+    new_hashes = [hash_to_int(new) for (_, _, new, _) in images_info]
+    old_tree = BKTree()
+    for (i, old) in enumerate(old_hashes):
+        old_tree.add(old, i)
     groups = []
     used = set()
 
-    for i, (path1, old1, new1, delta1) in enumerate(images_info):
+    for i, (path1, _, _, delta1) in enumerate(images_info):
         if path1 in used:
             continue
         group = [path1]
         used.add(path1)
-        for j in range(i + 1, len(images_info)):
-            path2, old2, new2, delta2 = images_info[j]
-            if path2 in used:
+        for j in sorted(old_tree.query(old_hashes[i], threshold)):
+            path2, _, _, delta2 = images_info[j]
+            if j <= i or path2 in used:
                 continue
-            if abs(old1 - old2) <= threshold and abs(new1 - new2) <= threshold and abs(delta1 - delta2) <= threshold:
+            if (new_hashes[i] ^ new_hashes[j]).bit_count() <= threshold and abs(delta1 - delta2) <= threshold:
                 group.append(path2)
                 used.add(path2)
         groups.append(group)
+        if on_group is not None:
+            on_group(group)
 
     print(f"Grouping done. {len(groups)} groups formed.")
     return groups
 
 
+def make_thumbnails(
+    old_data: bytes, new_data: bytes, size: int = 256
+) -> tuple[str | None, str | None, str | None]:
+    """
+    Create thumbnails of the old and new versions of an image and of their difference.
+
+    Parameters
+    ----------
+    old_data : bytes
+        Content of the old image file.
+    new_data : bytes
+        Content of the new image file.
+    size : int, optional
+        Maximum width and height of the thumbnails (default is 256).
+
+    Returns
+    -------
+    tuple[str or None, str or None, str or None]
+        Data URIs of the PNG thumbnails of the old image, the new image and their difference. Each thumbnail
+        is None if it cannot be created, e.g. the difference of images with different sizes.
+    """
+    def to_data_uri(image: PIL.Image.Image) -> str:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((size, size))
+        buffer = io.BytesIO()
+        thumbnail.save(buffer, format="PNG")
+        return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+    images: list[PIL.Image.Image | None] = []
+    for data in (old_data, new_data):
+        try:
+            images.append(PIL.Image.open(io.BytesIO(data)).convert("RGB"))
+        except Exception:
+            images.append(None)
+    old_image, new_image = images
+    if old_image is not None and new_image is not None and old_image.size == new_image.size:
+        images.append(PIL.ImageChops.difference(old_image, new_image))
+    else:
+        images.append(None)
+    old_uri, new_uri, difference_uri = [to_data_uri(image) if image is not None else None for image in images]
+    return old_uri, new_uri, difference_uri
+
+
+class JSONReport:
+    """
+    Write a report as JSON lines, so that each group can be parsed as soon as it is written.
+
+    The report contains one object per group, followed by one object per unhashable image and by a summary
+    object. Each object has a "type" key, equal to "group", "unhashable" or "summary" respectively.
+
+    Parameters
+    ----------
+    stream : typing.TextIO
+        The stream where the report is written.
+    """
+
+    def __init__(self, stream: typing.TextIO) -> None:
+        self._stream = stream
+        self._groups = 0
+
+    def _write(self, record: dict[str, typing.Any]) -> None:
+        """Write a record to the report."""
+        self._stream.write(json.dumps(record) + "\n")
+        self._stream.flush()
+
+    def add_group(self, group: list[str], old_data: bytes, new_data: bytes) -> None:
+        """
+        Add a group to the report.
+
+        Parameters
+        ----------
+        group : list[str]
+            The paths of the images in the group. The first image is the example of the group.
+        old_data : bytes
+            Content of the old version of the example image, unused.
+        new_data : bytes
+            Content of the new version of the example image, unused.
+        """
+        self._groups += 1
+        self._write({"type": "group", "number": self._groups, "example": group[0], "images": group})
+
+    def finish(self, results: dict[str, typing.Any]) -> None:
+        """
+        Complete the report with unhashable images and the summary.
+
+        Parameters
+        ----------
+        results : dict[str, typing.Any]
+            The results returned by analyze_git_image_changes.
+        """
+        for img, reason in results["unhashable"]:
+            self._write({"type": "unhashable", "path": img, "reason": reason})
+        self._write({
+            "type": "summary",
+            "total_changed": results["total_changed"],
+            "unique_change_groups": results["unique_change_groups"],
+            "unhashable": len(results["unhashable"])
+        })
+
+
+class HTMLReport:
+    """
+    Write a report as an HTML page, with side-by-side thumbnails of the example image of each group.
+
+    Thumbnails are generated in a process pool. Groups are written in order as soon as their thumbnails
+    are available, so that the page can be inspected while the analysis is still running. At most a couple
+    of groups per worker wait for their thumbnails, so that the content of at most that many images is held
+    in memory.
+
+    Parameters
+    ----------
+    stream : typing.TextIO
+        The stream where the report is written.
+    max_workers : int, optional
+        Number of processes used to generate thumbnails (default is the number of available cores).
+    """
+
+    def __init__(self, stream: typing.TextIO, max_workers: int | None = None) -> None:
+        self._stream = stream
+        self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+        self._max_pending = 2 * (max_workers if max_workers is not None else os.cpu_count() or 1)
+        self._pending: collections.deque[
+            tuple[int, list[str], concurrent.futures.Future[tuple[str | None, str | None, str | None]]]
+        ] = collections.deque()
+        self._groups = 0
+        self._stream.write(
+            '<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n<title>Image changes</title>\n'
+            "<style>figure { display: inline-block; margin: 0.5em; } "
+            "figcaption { text-align: center; }</style>\n</head>\n<body>\n<h1>Image changes</h1>\n")
+        self._stream.flush()
+
+    def add_group(self, group: list[str], old_data: bytes, new_data: bytes) -> None:
+        """
+        Add a group to the report.
+
+        Parameters
+        ----------
+        group : list[str]
+            The paths of the images in the group. The first image is the example of the group.
+        old_data : bytes
+            Content of the old version of the example image.
+        new_data : bytes
+            Content of the new version of the example image.
+        """
+        self._groups += 1
+        self._pending.append((self._groups, group, self._executor.submit(make_thumbnails, old_data, new_data)))
+        self._write_completed_groups(wait=False)
+
+    def _write_completed_groups(self, wait: bool) -> None:
+        """
+        Write groups whose thumbnails are available, in order, optionally waiting for all of them.
+
+        Groups are waited for also if more than the allowed number of them are pending, until they are not.
+        """
+        while len(self._pending) > 0 and (
+            wait or self._pending[0][2].done() or len(self._pending) > self._max_pending
+        ):
+            number, group, future = self._pending.popleft()
+            figures = []
+            for caption, uri in zip(("Old", "New", "Difference"), future.result()):
+                content = f'<img src="{uri}">' if uri is not None else "not available"
+                figures.append(f"<figure>{content}<figcaption>{caption}</figcaption></figure>")
+            images = "".join(f"<li>{html.escape(path)}</li>" for path in group)
+            self._stream.write(
+                f"<section>\n<h2>Group {number}: {len(group)} images</h2>\n"
+                f"<p>Example: {html.escape(group[0])}</p>\n{''.join(figures)}\n"
+                f"<details><summary>All images</summary><ul>{images}</ul></details>\n</section>\n")
+        self._stream.flush()
+
+    def finish(self, results: dict[str, typing.Any]) -> None:
+        """
+        Complete the report with unhashable images and the summary.
+
+        Parameters
+        ----------
+        results : dict[str, typing.Any]
+            The results returned by analyze_git_image_changes.
+        """
+        self._write_completed_groups(wait=True)
+        self._executor.shutdown()
+        if results["unhashable"]:
+            unhashable = "".join(
+                f"<li>{html.escape(img)}: {html.escape(reason)}</li>" for img, reason in results["unhashable"])
+            self._stream.write(f"<h2>Images missing or unhashable</h2>\n<ul>{unhashable}</ul>\n")
+        self._stream.write(
+            f"<h2>Summary</h2>\n<p>Changed image files: {results['total_changed']}<br>"
+            f"Unique change groups: {results['unique_change_groups']}<br>"
+            f"Images missing or unhashable: {len(results['unhashable'])}</p>\n</body>\n</html>\n")
+        self._stream.flush()
+
+
 def analyze_git_image_changes(
-    git_range: str, threshold: int
+    git_range: str, threshold: int, max_workers: int | None = None, mode: str = "cat-file",
+    hash_store_path: str | None = None, report: JSONReport | HTMLReport | None = None
 ) -> dict[str, typing.Any]:
     """
     Analyze image changes between two Git commits, grouping similar images.
@@ -181,6 +768,17 @@ def analyze_git_image_changes(
         Git commit range, e.g., 'origin/main..HEAD'.
     threshold : int
         Hamming distance threshold to consider images similar.
+    max_workers : int, optional
+        Number of processes used to hash images (default is the number of available cores).
+    mode : str, optional
+        How old images are read: either "cat-file", to stream only the needed blobs from a single
+        `git cat-file --batch` process, or "checkout", to check out the base commit in a temporary
+        directory (default is "cat-file").
+    hash_store_path : str, optional
+        Path to the persistent store of perceptual hashes, so that only blobs which were never hashed before
+        are decoded. If not provided, all images are hashed.
+    report : JSONReport or HTMLReport, optional
+        Structured report to which each group is added as soon as it is finalized.
 
     Returns
     -------
@@ -191,46 +789,119 @@ def analyze_git_image_changes(
         - groups: list[list[str]], groups of image paths
         - unhashable: list[tuple[str, str]], images missing old/new file or with failed hash and reason
     """
+    if mode not in ("cat-file", "checkout"):
+        raise ValueError(f"Invalid mode {mode}: expected either cat-file or checkout")
     changed_files = get_changed_images(git_range)
     base_commit = get_commit_before_range(git_range)
 
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        checkout_tree(base_commit, tmp_dir)
+    with contextlib.ExitStack() as stack:
+        if mode == "checkout":
+            tmp_dir = stack.enter_context(tempfile.TemporaryDirectory())
+            checkout_tree(base_commit, tmp_dir)
+        else:
+            blob_reader = stack.enter_context(BlobReader())
+            blob_id_reader = stack.enter_context(BlobReader(batch_check=True))
+        hash_store = stack.enter_context(HashStore(hash_store_path)) if hash_store_path is not None else None
+        hash_function = hash_function_name(imagehash.phash)
 
         images_info = []
         unhashable_images = []
+        hashable_files = []
+        old_paths = dict()
+        # Images whose hash is not available in the hash store, in the same order as the changed files, stored
+        # as their path and whether they are read from git. Their content is only read when they are hashed.
+        jobs: list[tuple[str, bool]] = []
         print(f"Processing {len(changed_files)} changed images...")
         for idx, rel_path in enumerate(changed_files, 1):
-            old_path = os.path.join(tmp_dir, rel_path)
             new_path = rel_path
 
             if not os.path.exists(new_path):
                 unhashable_images.append((rel_path, "New file missing"))
                 print(f"[{idx}/{len(changed_files)}] Skipping '{rel_path}' (new file missing)")
                 continue
-            if not os.path.exists(old_path):
+            old_blob_id: str | None
+            if mode == "checkout":
+                old_path = os.path.join(tmp_dir, rel_path)
+                old_blob_id = None
+                if os.path.exists(old_path):
+                    old_blob_id = git_blob_id_of_file(old_path)
+            else:
+                old_path = f"{base_commit}:{rel_path}"
+                old_blob_id = blob_id_reader.blob_id(old_path)
+            if old_blob_id is None:
                 unhashable_images.append((rel_path, "Old file missing"))
                 print(f"[{idx}/{len(changed_files)}] Skipping '{rel_path}' (old file missing)")
                 continue
-
-            print(f"[{idx}/{len(changed_files)}] Hashing '{rel_path}'...")
-            old_hash = compute_hash(old_path)
-            new_hash = compute_hash(new_path)
-
-            if old_hash is None:
-                unhashable_images.append((rel_path, "Failed to hash old file"))
-                print(f"  Warning: Could not hash old '{rel_path}'.")
-                continue
-            if new_hash is None:
-                unhashable_images.append((rel_path, "Failed to hash new file"))
-                print(f"  Warning: Could not hash new '{rel_path}'.")
-                continue
-
-            delta = new_hash - old_hash
-            images_info.append((rel_path, old_hash, new_hash, delta))
-
+            blob_ids = (old_blob_id, git_blob_id_of_file(new_path))
+            stored_hashes = tuple(
+                hash_store.get(blob_id, hash_function) if hash_store is not None else None for blob_id in blob_ids)
+            for (path, from_git, stored_hash) in zip((old_path, new_path), (mode == "cat-file", False), stored_hashes):
+                if stored_hash is None:
+                    jobs.append((path, from_git))
+            hashable_files.append((idx, rel_path, blob_ids, stored_hashes))
+            old_paths[rel_path] = old_path
+        print(f"{len(jobs)} images to be hashed, {2 * len(hashable_files) - len(jobs)} found in the hash store.")
+
+        def read_jobs() -> collections.abc.Iterator[tuple[str, bytes]]:
+            for (path, from_git) in jobs:
+                data: bytes | None
+                if from_git:
+                    data = blob_reader.read(path)
+                else:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                assert data is not None
+                yield path, data
+
+        # Keep a couple of jobs per worker in flight, so that workers are never idle while the content of at most
+        # that many images is held in memory
+        num_workers = max_workers if max_workers is not None else os.cpu_count() or 1
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            computed_hashes: collections.abc.Iterator[imagehash.ImageHash | None] = map_bounded(
+                executor, compute_hash_job, read_jobs(), 2 * num_workers)
+            for (idx, rel_path, blob_ids, stored_hashes) in hashable_files:
+                old_hash, new_hash = [
+                    stored_hash if stored_hash is not None else next(computed_hashes)
+                    for stored_hash in stored_hashes]
+                print(f"[{idx}/{len(changed_files)}] Hashed '{rel_path}'")
+                if hash_store is not None:
+                    for (blob_id, stored_hash, image_hash) in zip(blob_ids, stored_hashes, (old_hash, new_hash)):
+                        if stored_hash is None and image_hash is not None:
+                            hash_store.put(blob_id, hash_function, image_hash)
+
+                if old_hash is None:
+                    unhashable_images.append((rel_path, "Failed to hash old file"))
+                    print(f"  Warning: Could not hash old '{rel_path}'.")
+                    continue
+                if new_hash is None:
+                    unhashable_images.append((rel_path, "Failed to hash new file"))
+                    print(f"  Warning: Could not hash new '{rel_path}'.")
+                    continue
+
+                delta = new_hash - old_hash
+                images_info.append((rel_path, old_hash, new_hash, delta))
+
+        # Report unhashable images in the same order as the changed files
+        positions = {rel_path: idx for (idx, rel_path) in enumerate(changed_files)}
+        unhashable_images.sort(key=lambda unhashable_image: positions[unhashable_image[0]])
         print(f"Hashing done. {len(images_info)} images with valid hashes.")
-        groups = group_similar_changes(images_info, threshold=threshold)
+
+        def add_group_to_report(group: list[str]) -> None:
+            assert report is not None
+            example = group[0]
+            example_old_data: bytes | None
+            if mode == "checkout":
+                with open(old_paths[example], "rb") as f:
+                    example_old_data = f.read()
+            else:
+                example_old_data = blob_reader.read(old_paths[example])
+            assert example_old_data is not None
+            with open(example, "rb") as f:
+                example_new_data = f.read()
+            report.add_group(group, example_old_data, example_new_data)
+
+        groups = group_similar_changes(
+            images_info, threshold=threshold, on_group=add_group_to_report if report is not None else None)
 
     return {
         "total_changed": len(images_info),
@@ -245,9 +916,48 @@ def main() -> None:
     parser = argparse.ArgumentParser(description="Group visually similar image changes in a Git diff.")
     parser.add_argument("git_range", help="Git commit range, e.g. origin/main..HEAD")
     parser.add_argument("--threshold", type=int, default=5, help="Hamming distance threshold (default: 5)")
+    parser.add_argument(
+        "--jobs", type=int, default=None, help="Number of processes used to hash images (default: all cores)")
+    parser.add_argument(
+        "--mode", choices=["cat-file", "checkout"], default="cat-file",
+        help=(
+            "Read old images by streaming the needed blobs from git cat-file, or by checking out the base commit "
+            "in a temporary directory (default: cat-file)"))
+    parser.add_argument(
+        "--hash-store", type=str, default=None,
+        help="Path to the persistent store of perceptual hashes (default: inside the git directory)")
+    parser.add_argument(
+        "--no-hash-store", action="store_true", help="Hash all images, without using the persistent store")
+    parser.add_argument(
+        "--format", choices=["text", "json", "html"], default="text",
+        help=(
+            "Print a text report with the git diff of each group example, or write a structured report "
+            "as JSON lines or as an HTML page with thumbnails (default: text)"))
+    parser.add_argument(
+        "--output", type=str, default="-", help="File where json and html reports are written (default: stdout)")
     args = parser.parse_args()
 
-    results = analyze_git_image_changes(args.git_range, args.threshold)
+    if args.no_hash_store:
+        hash_store_path = None
+    elif args.hash_store is not None:
+        hash_store_path = args.hash_store
+    else:
+        hash_store_path = default_hash_store_path()
+    if args.format != "text":
+        with contextlib.ExitStack() as stack:
+            if args.output == "-":
+                # Keep stdout for the report, and print progress messages to stderr
+                stream = sys.stdout
+                stack.enter_context(contextlib.redirect_stdout(sys.stderr))
+            else:
+                stream = stack.enter_context(open(args.output, "w"))
+            report = JSONReport(stream) if args.format == "json" else HTMLReport(stream, args.jobs)
+            results = analyze_git_image_changes(
+                args.git_range, args.threshold, args.jobs, args.mode, hash_store_path, report)
+            report.finish(results)
+        return
+
+    results = analyze_git_image_changes(args.git_range, args.threshold, args.jobs, args.mode, hash_store_path)
 
     print()
     print(f"Changed image files in range '{args.git_range}': {results['total_changed']}")
@@ -0,0 +1,88 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Persist screenshots, difference images and image cache updates in the background."""
+
+import collections.abc
+import concurrent.futures
+import os
+import shutil
+import threading
+import typing
+
+import PIL.Image
+
+
+class ArtifactWriter:
+    """
+    Persist artifacts in a background thread.
+
+    Artifacts are written in the same order in which they were submitted, so that e.g. copying a screenshot
+    to the image cache is always carried out after the screenshot itself has been saved.
+    """
+
+    def __init__(self) -> None:
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifact_writer")
+        self._pending: list[concurrent.futures.Future[typing.Any]] = []
+        self._lock = threading.Lock()
+
+    def submit(
+        self, function: collections.abc.Callable[..., typing.Any], *args: typing.Any  # noqa: ANN401
+    ) -> concurrent.futures.Future[typing.Any]:
+        """
+        Schedule a function persisting an artifact.
+
+        Parameters
+        ----------
+        function
+            The function to be called in the background.
+        args
+            The arguments to be passed to the function.
+
+        Returns
+        -------
+        :
+            A future representing the pending write.
+        """
+        with self._lock:
+            # Forget about writes which were already completed successfully
+            self._pending = [
+                future for future in self._pending if not future.done() or future.exception() is not None]
+            future = self._executor.submit(function, *args)
+            self._pending.append(future)
+        return future
+
+    def save_image(self, image: PIL.Image.Image, path: str) -> concurrent.futures.Future[typing.Any]:
+        """Schedule saving an image to the provided path, creating its directory if needed."""
+        return self.submit(_save_image, image, path)
+
+    def copy_file(self, source: str, destination: str) -> concurrent.futures.Future[typing.Any]:
+        """Schedule copying a file to the provided destination, creating its directory if needed."""
+        return self.submit(_copy_file, source, destination)
+
+    def flush(self) -> None:
+        """Wait until all pending writes have been completed, raising the first error that occurred, if any."""
+        with self._lock:
+            pending = self._pending
+            self._pending = []
+        errors = [future.exception() for future in pending]
+        for error in errors:
+            if error is not None:
+                raise error
+
+
+def _save_image(image: PIL.Image.Image, path: str) -> None:
+    """Save an image, creating its directory if needed."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    image.save(path)
+
+
+def _copy_file(source: str, destination: str) -> None:
+    """Copy a file, creating the directory of the destination if needed."""
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    shutil.copy(source, destination)
+
+
+writer = ArtifactWriter()
@@ -0,0 +1,182 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Command line interface to the image cache tester."""
+
+import argparse
+import collections.abc
+import json
+import sys
+
+import image_cache_tester.compare_arrays
+import image_cache_tester.image_dedup
+import image_cache_tester.image_pack
+import image_cache_tester.image_trees
+
+
+def main(argv: collections.abc.Sequence[str] | None = None) -> int:
+    """
+    Run the command line interface.
+
+    Parameters
+    ----------
+    argv
+        Command line arguments. If not provided, they are read from sys.argv.
+
+    Returns
+    -------
+    :
+        The exit code of the command.
+    """
+    parser = argparse.ArgumentParser(prog="image-cache-tester", description="viskex image cache tester.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    verify_parser = subparsers.add_parser(
+        "verify", help="Verify the screenshots saved by notebook tests against the image cache.")
+    verify_parser.add_argument(
+        "directories", nargs="+",
+        help="Directories which are searched recursively for .image_from_pytest trees")
+    verify_parser.add_argument("--jobs", type=int, default=None, help="Number of workers (default: all cores)")
+    verify_parser.add_argument(
+        "--executor", choices=["process", "thread"], default="process", help="Type of pool of workers")
+    verify_parser.add_argument(
+        "--json", type=str, default=None, help="Write a JSON summary to the given file, or to stdout if -")
+    comparison_mode_group = verify_parser.add_mutually_exclusive_group()
+    comparison_mode_group.add_argument(
+        "--tile-size", type=int, default=None,
+        help=(
+            "Compare images tile by tile through multi-resolution pyramids of tiles of this size, "
+            "reporting statistics of the differing tiles"))
+    comparison_mode_group.add_argument(
+        "--memory-limit", type=int, default=None,
+        help=(
+            "Decode and compare images in strips of rows, so that each worker uses at most this number "
+            "of MiB regardless of the image size"))
+    _add_tolerances_arguments(verify_parser)
+    pack_parser = subparsers.add_parser(
+        "pack",
+        help=(
+            "Convert the notebook directories of image caches to packs. Images which are already stored "
+            "in a pack are preserved unless the directory contains a newer version of them."))
+    pack_parser.add_argument("directories", nargs="+", help="Image cache directories")
+    pack_parser.add_argument(
+        "--compression", choices=["raw", "zlib"], default="zlib",
+        help="Store pixels uncompressed, to read them without any copy, or compressed with zlib")
+    pack_parser.add_argument(
+        "--remove", action="store_true", help="Remove notebook directories after they have been packed")
+    unpack_parser = subparsers.add_parser(
+        "unpack", help="Convert the packs of image caches to notebook directories.")
+    unpack_parser.add_argument("directories", nargs="+", help="Image cache directories")
+    unpack_parser.add_argument("--remove", action="store_true", help="Remove packs after they have been unpacked")
+    dedup_parser = subparsers.add_parser(
+        "dedup",
+        help=(
+            "Replace images which are identical across ranks with references to the image of the lowest rank, "
+            "stored in files with a .ref suffix."))
+    dedup_parser.add_argument("directories", nargs="+", help="Image cache directories")
+    dedup_parser.add_argument(
+        "--restore", action="store_true", help="Replace references with copies of the referenced images instead")
+    args = parser.parse_args(argv)
+    if args.command == "verify":
+        return _verify(args)
+    elif args.command == "pack":
+        return _pack(args)
+    elif args.command == "unpack":
+        return _unpack(args)
+    else:
+        assert args.command == "dedup"
+        return _dedup(args)
+
+
+def _add_tolerances_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add arguments to control tolerances in image comparison."""
+    parser.add_argument(
+        "--channel-threshold", type=int, default=0,
+        help="Absolute difference above which a pixel channel is considered as differing")
+    parser.add_argument(
+        "--max-differing-fraction", type=float, default=0.0, help="Maximum fraction of differing pixels")
+    parser.add_argument("--max-rmse", type=float, default=None, help="Maximum root mean square error")
+    parser.add_argument(
+        "--min-psnr", type=float, default=None, help="Minimum peak signal-to-noise ratio (in decibel)")
+
+
+def _tolerances_from_arguments(args: argparse.Namespace) -> image_cache_tester.compare_arrays.Tolerances:
+    """Create tolerances from the command line arguments."""
+    return image_cache_tester.compare_arrays.Tolerances(
+        channel_threshold=args.channel_threshold, max_differing_fraction=args.max_differing_fraction,
+        max_rmse=args.max_rmse, min_psnr=args.min_psnr)
+
+
+def _verify(args: argparse.Namespace) -> int:
+    """Verify all trees of screenshots found in the provided directories."""
+    tolerances = _tolerances_from_arguments(args)
+    # Print human readable messages to stderr if the JSON summary is written to stdout
+    log = sys.stderr if args.json == "-" else sys.stdout
+    verifications = []
+    for directory in args.directories:
+        image_trees = image_cache_tester.image_trees.find_image_trees(directory)
+        if len(image_trees) == 0:
+            print(f"No {image_cache_tester.image_trees.actual_tree_name} tree found in {directory}", file=log)
+        for (actual_root, expected_root) in image_trees:
+            verification = image_cache_tester.image_trees.verify_image_tree(
+                actual_root, expected_root, tolerances, args.jobs, args.executor, args.tile_size,
+                args.memory_limit * 2**20 if args.memory_limit is not None else None)
+            print(
+                f"{actual_root}: {len(verification.passed)} passed, {len(verification.differing)} differing, "
+                f"{len(verification.missing)} missing, {len(verification.extra)} extra", file=log)
+            for result in verification.differing:
+                if result.error is not None:
+                    print(f"  differing: {result.actual_image_path} ({result.error})", file=log)
+                else:
+                    assert result.metrics is not None
+                    print(
+                        f"  differing: {result.actual_image_path} ({result.metrics.differing_pixels} pixels, "
+                        f"rmse {result.metrics.rmse:.3f})", file=log)
+                    for tile in result.tiles or []:
+                        print(f"    tile {tile.box}: {tile.differing_pixels} pixels", file=log)
+            for image in verification.missing:
+                print(f"  missing: {image}", file=log)
+            for image in verification.extra:
+                print(f"  extra: {image}", file=log)
+            verifications.append(verification)
+    if args.json is not None:
+        summary = {
+            "successful": all(verification.successful for verification in verifications),
+            "trees": [verification.to_json() for verification in verifications]
+        }
+        if args.json == "-":
+            json.dump(summary, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.json, "w") as f:
+                json.dump(summary, f, indent=2)
+    return 0 if all(verification.successful for verification in verifications) else 1
+
+
+def _pack(args: argparse.Namespace) -> int:
+    """Convert the notebook directories of the provided image caches to packs."""
+    for directory in args.directories:
+        for pack_path in image_cache_tester.image_pack.pack_image_cache(directory, args.compression, args.remove):
+            print(f"Packed {pack_path}")
+    return 0
+
+
+def _unpack(args: argparse.Namespace) -> int:
+    """Convert the packs of the provided image caches to notebook directories."""
+    for directory in args.directories:
+        for notebook_dir in image_cache_tester.image_pack.unpack_image_cache(directory, args.remove):
+            print(f"Unpacked {notebook_dir}")
+    return 0
+
+
+def _dedup(args: argparse.Namespace) -> int:
+    """Deduplicate images across ranks in the provided image caches, or restore them."""
+    for directory in args.directories:
+        if args.restore:
+            restored = image_cache_tester.image_dedup.restore_image_cache(directory)
+            print(f"{directory}: {restored} references restored")
+        else:
+            replaced = image_cache_tester.image_dedup.deduplicate_image_cache(directory)
+            print(f"{directory}: {replaced} images replaced by references")
+    return 0
@@ -0,0 +1,239 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Compare two images stored as numpy arrays."""
+
+import dataclasses
+import math
+
+import numpy as np
+import numpy.typing as npt
+
+
+@dataclasses.dataclass(frozen=True)
+class Tolerances:
+    """
+    Tolerances allowed when comparing two images.
+
+    Parameters
+    ----------
+    channel_threshold
+        A pixel is considered as differing only if the absolute difference of at least one of its channels
+        is strictly larger than this threshold.
+    max_differing_fraction
+        Maximum fraction of differing pixels, with respect to the total number of pixels.
+    max_rmse
+        Maximum root mean square error, computed over all channels. If not provided, it is not checked.
+    min_psnr
+        Minimum peak signal-to-noise ratio, in decibel. If not provided, it is not checked.
+    """
+
+    channel_threshold: int = 0
+    max_differing_fraction: float = 0.0
+    max_rmse: float | None = None
+    min_psnr: float | None = None
+
+    def max_differing_pixels(self, num_pixels: int) -> int:
+        """Return the maximum number of differing pixels allowed for an image with the given number of pixels."""
+        return math.floor(self.max_differing_fraction * num_pixels)
+
+    def max_squared_error(self, num_values: int) -> float:
+        """Return the maximum sum of squared errors allowed for an image with the given number of values."""
+        max_squared_error = math.inf
+        if self.max_rmse is not None:
+            max_squared_error = min(max_squared_error, self.max_rmse**2 * num_values)
+        if self.min_psnr is not None:
+            max_squared_error = min(max_squared_error, 255**2 / 10**(self.min_psnr / 10) * num_values)
+        return max_squared_error
+
+
+@dataclasses.dataclass(frozen=True)
+class ComparisonMetrics:
+    """
+    Metrics resulting from the comparison of two images.
+
+    Parameters
+    ----------
+    passed
+        Whether the comparison satisfied all the tolerances.
+    differing_pixels
+        Number of pixels with at least one channel differing by more than the channel threshold.
+    differing_fraction
+        Fraction of differing pixels, with respect to the total number of pixels.
+    rmse
+        Root mean square error, computed over all channels.
+    psnr
+        Peak signal-to-noise ratio, in decibel.
+    complete
+        Whether the metrics were computed on the whole image. If the comparison exited early, the metrics
+        only account for the rows processed before the exit, and hence are lower bounds for the differing pixels
+        and the root mean square error.
+    """
+
+    passed: bool
+    differing_pixels: int
+    differing_fraction: float
+    rmse: float
+    psnr: float
+    complete: bool
+
+
+def compare_arrays(
+    actual_array: npt.NDArray[np.uint8], expected_array: npt.NDArray[np.uint8],
+    tolerances: Tolerances = Tolerances(), block_rows: int = 64, mask: npt.NDArray[np.bool_] | None = None
+) -> ComparisonMetrics:
+    """
+    Compare two images stored as uint8 arrays of shape (height, width, channels).
+
+    Rows are processed in blocks, and the comparison exits as soon as the tolerances are exceeded.
+
+    Parameters
+    ----------
+    actual_array
+        The image content from the current evaluation of the code.
+    expected_array
+        The reference image content.
+    tolerances
+        The tolerances allowed in the comparison. If not provided, the images are required to be identical.
+    block_rows
+        Number of rows processed at once.
+    mask
+        Boolean array of shape (height, width) which is True on the pixels to be compared. If provided, the pixels
+        outside of the mask are ignored, and fractions and averages are computed with respect to the number of
+        masked pixels. Only the bounding box of the mask is processed.
+
+    Returns
+    -------
+    :
+        The metrics resulting from the comparison.
+    """
+    assert actual_array.shape == expected_array.shape
+    assert actual_array.dtype == np.uint8 and expected_array.dtype == np.uint8
+    if mask is not None:
+        assert mask.shape == actual_array.shape[:2]
+        masked_rows = np.flatnonzero(mask.any(axis=1))
+        masked_columns = np.flatnonzero(mask.any(axis=0))
+        if masked_rows.size > 0:
+            bounding_box = (
+                slice(masked_rows[0], masked_rows[-1] + 1), slice(masked_columns[0], masked_columns[-1] + 1))
+        else:
+            bounding_box = (slice(0, 0), slice(0, 0))
+        actual_array = actual_array[bounding_box]
+        expected_array = expected_array[bounding_box]
+        mask = mask[bounding_box]
+        num_pixels = int(np.count_nonzero(mask))
+        num_values = num_pixels * math.prod(actual_array.shape[2:])
+        if num_pixels == mask.size:
+            # The mask is a rectangle, hence restricting to its bounding box is enough
+            mask = None
+    else:
+        num_pixels = actual_array.shape[0] * actual_array.shape[1]
+        num_values = actual_array.size
+    num_rows = actual_array.shape[0]
+    max_differing_pixels = tolerances.max_differing_pixels(num_pixels)
+    max_squared_error = tolerances.max_squared_error(num_values)
+    differing_pixels = 0
+    squared_error = 0
+    complete = True
+    for row_begin in range(0, num_rows, block_rows):
+        actual_block = actual_array[row_begin:row_begin + block_rows]
+        expected_block = expected_array[row_begin:row_begin + block_rows]
+        if np.array_equal(actual_block, expected_block):
+            continue
+        block_differing_pixels, block_squared_error = block_errors(
+            actual_block, expected_block, tolerances.channel_threshold,
+            mask[row_begin:row_begin + block_rows] if mask is not None else None)
+        differing_pixels += block_differing_pixels
+        squared_error += block_squared_error
+        if differing_pixels > max_differing_pixels or squared_error > max_squared_error:
+            complete = row_begin + block_rows >= num_rows
+            break
+    return make_metrics(differing_pixels, squared_error, num_pixels, num_values, tolerances, complete)
+
+
+def block_errors(
+    actual_block: npt.NDArray[np.uint8], expected_block: npt.NDArray[np.uint8], channel_threshold: int,
+    mask: npt.NDArray[np.bool_] | None = None
+) -> tuple[int, int]:
+    """
+    Compute the errors between two blocks of pixels.
+
+    Parameters
+    ----------
+    actual_block, expected_block
+        The blocks to be compared, stored as uint8 arrays of shape (height, width, channels).
+    channel_threshold
+        A pixel is considered as differing only if the absolute difference of at least one of its channels
+        is strictly larger than this threshold.
+    mask
+        Boolean array of shape (height, width) which is True on the pixels to be compared, if any.
+
+    Returns
+    -------
+    :
+        A pair containing the number of differing pixels and the sum of squared errors over all channels.
+    """
+    difference_block = _difference(actual_block, expected_block)
+    if mask is not None:
+        difference_block[~mask] = 0
+    differing_pixels = int(np.count_nonzero(
+        (difference_block > channel_threshold).reshape(*difference_block.shape[:2], -1).any(axis=2)))
+    squared_error = int(np.square(difference_block, dtype=np.uint32).sum(dtype=np.uint64))
+    return differing_pixels, squared_error
+
+
+def make_metrics(
+    differing_pixels: int, squared_error: float, num_pixels: int, num_values: int, tolerances: Tolerances,
+    complete: bool
+) -> ComparisonMetrics:
+    """
+    Assemble the metrics of a comparison from the accumulated errors.
+
+    Parameters
+    ----------
+    differing_pixels
+        Number of differing pixels.
+    squared_error
+        Sum of squared errors over all channels.
+    num_pixels
+        Number of compared pixels.
+    num_values
+        Number of compared values, i.e. the number of compared pixels times the number of channels.
+    tolerances
+        The tolerances allowed in the comparison.
+    complete
+        Whether the errors were accumulated over all compared pixels.
+
+    Returns
+    -------
+    :
+        The metrics of the comparison.
+    """
+    mean_squared_error = squared_error / num_values if num_values > 0 else 0.0
+    return ComparisonMetrics(
+        passed=(
+            differing_pixels <= tolerances.max_differing_pixels(num_pixels)
+            and squared_error <= tolerances.max_squared_error(num_values)),
+        differing_pixels=differing_pixels,
+        differing_fraction=differing_pixels / num_pixels if num_pixels > 0 else 0.0,
+        rmse=math.sqrt(mean_squared_error),
+        psnr=10 * math.log10(255**2 / mean_squared_error) if mean_squared_error > 0 else math.inf,
+        complete=complete
+    )
+
+
+def difference_array(
+    actual_array: npt.NDArray[np.uint8], expected_array: npt.NDArray[np.uint8]
+) -> npt.NDArray[np.uint8]:
+    """Return the absolute difference between two images stored as uint8 arrays."""
+    assert actual_array.shape == expected_array.shape
+    return _difference(actual_array, expected_array)
+
+
+def _difference(
+    actual_array: npt.NDArray[np.uint8], expected_array: npt.NDArray[np.uint8]
+) -> npt.NDArray[np.uint8]:
+    """Compute the absolute difference between two uint8 arrays without promoting them to a wider type."""
+    return np.maximum(actual_array, expected_array) - np.minimum(actual_array, expected_array)
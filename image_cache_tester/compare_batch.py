@@ -0,0 +1,130 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Compare many pairs of images in parallel."""
+
+import collections.abc
+import concurrent.futures
+import dataclasses
+import os
+
+import image_cache_tester.compare_arrays
+import image_cache_tester.compare_images
+import image_cache_tester.image_pack
+import image_cache_tester.image_pyramid
+
+
+@dataclasses.dataclass(frozen=True)
+class PairComparison:
+    """
+    Result of the comparison of a pair of images within a batch.
+
+    Parameters
+    ----------
+    actual_image_path
+        Path to the image content from the current evaluation of the code.
+    expected_image_path
+        Path to the reference image content.
+    metrics
+        The metrics resulting from the comparison, or None if the comparison could not be carried out.
+    error
+        The reason why the comparison could not be carried out, or None if it was carried out.
+    tiles
+        Statistics of the differing tiles, if the images were compared tile by tile.
+    """
+
+    actual_image_path: str
+    expected_image_path: str
+    metrics: image_cache_tester.compare_arrays.ComparisonMetrics | None
+    error: str | None = None
+    tiles: list[image_cache_tester.image_pyramid.TileStatistics] | None = None
+
+    @property
+    def passed(self) -> bool:
+        """Return whether the comparison was carried out and satisfied all the tolerances."""
+        return self.metrics is not None and self.metrics.passed
+
+
+def compare_batch(
+    pairs: collections.abc.Iterable[tuple[str, str]],
+    tolerances: image_cache_tester.compare_arrays.Tolerances = image_cache_tester.compare_arrays.Tolerances(),
+    max_workers: int | None = None, executor: str = "process", use_digests: bool = False,
+    tile_size: int | None = None, memory_limit: int | None = None
+) -> collections.abc.Iterator[PairComparison]:
+    """
+    Compare many pairs of images in a pool of workers.
+
+    Parameters
+    ----------
+    pairs
+        Iterable of pairs of paths, where the first entry is the actual image and the second one is the
+        expected image. The iterable is consumed lazily, so that comparisons start before it is exhausted.
+    tolerances
+        The tolerances allowed in each comparison. If not provided, the images are required to be identical.
+    max_workers
+        Number of workers. If not provided, it defaults to the number of available cores.
+    executor
+        Either "process", to compare images in a process pool, or "thread", to compare them in a thread pool.
+    use_digests
+        If True, accept the actual image without decoding the expected one when its pixel digest matches
+        the one stored in the image cache manifest.
+    tile_size
+        If provided, compare images tile by tile through multi-resolution pyramids of tiles of this size.
+    memory_limit
+        If provided, each worker compares images in strips of rows, using at most this number of bytes.
+
+    Returns
+    -------
+    :
+        A generator of comparison results, which are yielded as soon as they are available. The order
+        of the results does not necessarily match the order of the pairs.
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if executor == "process":
+        pool: concurrent.futures.Executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+    elif executor == "thread":
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    else:
+        raise ValueError(f"Invalid executor {executor}: expected either process or thread")
+    # Limit the number of submitted comparisons, so that results are streamed back without materializing
+    # the whole iterable of pairs
+    max_pending = 2 * max_workers
+    with pool:
+        pending: set[concurrent.futures.Future[PairComparison]] = set()
+        for (actual_image_path, expected_image_path) in pairs:
+            pending.add(pool.submit(
+                _compare_pair, actual_image_path, expected_image_path, tolerances, use_digests, tile_size,
+                memory_limit))
+            if len(pending) >= max_pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in concurrent.futures.as_completed(pending):
+            yield future.result()
+
+
+def _compare_pair(
+    actual_image_path: str, expected_image_path: str, tolerances: image_cache_tester.compare_arrays.Tolerances,
+    use_digests: bool, tile_size: int | None = None, memory_limit: int | None = None
+) -> PairComparison:
+    """
+    Compare a pair of images, returning only the metrics so that no image is sent back to the caller.
+
+    Any failure of the comparison (e.g., an image which cannot be decoded) is reported as an error rather than
+    raised, so that it does not abort the comparison of the rest of the batch. The cache of decoded expected
+    images is bypassed, since each image of a batch is decoded only once by short-lived workers.
+    """
+    if not os.path.exists(actual_image_path):
+        return PairComparison(actual_image_path, expected_image_path, None, f"{actual_image_path} does not exist")
+    if not image_cache_tester.image_pack.exists(expected_image_path):
+        return PairComparison(actual_image_path, expected_image_path, None, f"{expected_image_path} does not exist")
+    try:
+        comparison = image_cache_tester.compare_images._compare_images(
+            actual_image_path, expected_image_path, False, tolerances=tolerances, use_digests=use_digests,
+            tile_size=tile_size, memory_limit=memory_limit, use_cache=False)
+    except Exception as e:
+        return PairComparison(actual_image_path, expected_image_path, None, str(e))
+    return PairComparison(actual_image_path, expected_image_path, comparison.metrics, tiles=comparison.tiles)
@@ -5,17 +5,132 @@
 # SPDX-License-Identifier: MIT
 """Compare two images using PIL."""
 
+import collections.abc
+import functools
+import itertools
+import math
 import os
+import typing
 
+import numpy as np
+import numpy.typing as npt
 import PIL.Image
 import PIL.ImageChops
-import pyvista
+
+import image_cache_tester.artifact_writer
+import image_cache_tester.compare_arrays
+import image_cache_tester.decoded_image_cache
+import image_cache_tester.image_cache_manifest
+import image_cache_tester.image_dedup
+import image_cache_tester.image_masks
+import image_cache_tester.image_pack
+import image_cache_tester.image_pyramid
+import image_cache_tester.image_strips
+import image_cache_tester.timings
+
+if typing.TYPE_CHECKING:
+    # pyvista is only needed for annotations, and importing it is slow
+    import pyvista
+
+
+class ImageComparison:
+    """
+    Result of the comparison between an actual image and an expected one.
+
+    The difference image is only computed when it is first accessed. For backward compatibility, the result
+    can be unpacked as a tuple containing the actual image, the expected image and their difference.
+
+    Parameters
+    ----------
+    actual_image
+        The actual image, in RGB format. The image may also be provided as a function loading it, e.g. when
+        the comparison was carried out in strips, in which case it is only loaded when first accessed.
+    expected_image
+        The expected image, in RGB format. The image may also be provided as a uint8 array of shape
+        (height, width, 3), e.g. when read from a pack, in which case it is only converted when first accessed,
+        or as a function loading it, e.g. when the comparison was decided without decoding it.
+    metrics
+        The metrics resulting from the comparison.
+    difference_image
+        The difference image, if already available.
+    mask
+        Boolean array of shape (height, width) which is True on the compared pixels, if the comparison was
+        restricted to a mask. Pixels outside of the mask are black in the difference image. The mask may also
+        be provided as a function loading it.
+    tiles
+        Statistics of the differing tiles, if the images were compared tile by tile.
+    """
+
+    def __init__(
+        self, actual_image: PIL.Image.Image | collections.abc.Callable[[], PIL.Image.Image],
+        expected_image: PIL.Image.Image | npt.NDArray[np.uint8] | collections.abc.Callable[[], PIL.Image.Image],
+        metrics: image_cache_tester.compare_arrays.ComparisonMetrics, difference_image: PIL.Image.Image | None = None,
+        mask: npt.NDArray[np.bool_] | collections.abc.Callable[[], npt.NDArray[np.bool_] | None] | None = None,
+        tiles: list[image_cache_tester.image_pyramid.TileStatistics] | None = None
+    ) -> None:
+        if isinstance(actual_image, PIL.Image.Image):
+            self.__dict__["actual_image"] = actual_image
+        else:
+            self._actual_image = actual_image
+        if isinstance(expected_image, PIL.Image.Image):
+            self.__dict__["expected_image"] = expected_image
+        else:
+            self._expected_image = expected_image
+        self.metrics = metrics
+        if mask is None or isinstance(mask, np.ndarray):
+            self.__dict__["mask"] = mask
+        else:
+            self._mask = mask
+        self.tiles = tiles
+        if difference_image is not None:
+            self.__dict__["difference_image"] = difference_image
+
+    @property
+    def passed(self) -> bool:
+        """Return whether the comparison satisfied all the tolerances."""
+        return self.metrics.passed
+
+    @functools.cached_property
+    def actual_image(self) -> PIL.Image.Image:
+        """Return the actual image."""
+        return self._actual_image()
+
+    @functools.cached_property
+    def expected_image(self) -> PIL.Image.Image:
+        """Return the expected image."""
+        if isinstance(self._expected_image, np.ndarray):
+            return PIL.Image.fromarray(self._expected_image)
+        else:
+            return self._expected_image()
+
+    @functools.cached_property
+    def mask(self) -> npt.NDArray[np.bool_] | None:
+        """Return the mask restricting the compared pixels, if any."""
+        return self._mask()
+
+    @functools.cached_property
+    def difference_image(self) -> PIL.Image.Image:
+        """Return the difference between the actual and expected images."""
+        difference_image = PIL.ImageChops.difference(self.actual_image, self.expected_image)
+        if self.mask is not None:
+            difference_image.paste(0, mask=PIL.Image.fromarray(~self.mask))
+        return difference_image
+
+    def __iter__(self) -> collections.abc.Iterator[PIL.Image.Image]:
+        """Unpack as a tuple containing the actual image, the expected image and their difference."""
+        yield self.actual_image
+        yield self.expected_image
+        yield self.difference_image
 
 
 def compare_images(
-    plotter: pyvista.Plotter, plotter_screenshot: str, expected_screenshot: str, verbose: bool,
-    regold: dict[str, bool] = {}
-) -> tuple[PIL.Image.Image, PIL.Image.Image, PIL.Image.Image]:
+    plotter: "pyvista.Plotter", plotter_screenshot: str, expected_screenshot: str, verbose: bool,
+    regold: dict[str, bool] = {}, in_memory: bool = False,
+    tolerances: image_cache_tester.compare_arrays.Tolerances = image_cache_tester.compare_arrays.Tolerances(),
+    use_digests: bool = False, save_screenshot: bool = False,
+    regions: image_cache_tester.image_masks.Regions = image_cache_tester.image_masks.Regions(),
+    tile_size: int | None = None, display: bool = True
+) -> ImageComparison:
     """
     Compare the image contained in a pyvista plotter to a cached one.
 
@@ -32,21 +147,68 @@ def compare_images(
     regold
         Dictionary to determine which images should be regolded.
         Allowed keys are "expected_image" and "difference_image". If the key is not found, image will not be regolded.
+    in_memory
+        If True, the screenshot is taken as an in-memory array and compared without writing it to disk first.
+        The screenshot is then saved in the background only if the comparison fails or if the expected image
+        does not exist yet. Use image_cache_tester.artifact_writer.writer.flush to make sure that pending
+        screenshots have been saved.
+    tolerances
+        The tolerances allowed in the comparison. If not provided, the images are required to be identical.
+    use_digests
+        If True, accept the actual image without decoding the expected one when its pixel digest matches
+        the one stored in the image cache manifest.
+    save_screenshot
+        If True, the screenshot is saved in the background also when in_memory is True and the comparison
+        is successful.
+    regions
+        The regions restricting which pixels are compared, in addition to the mask stored next to the cached image.
+    tile_size
+        If provided, compare images tile by tile through multi-resolution pyramids of tiles of this size,
+        using the pyramid precomputed next to the cached image if available.
+    display
+        If False, the plotter is rendered without being displayed in the notebook, so that the caller can
+        display a downscaled version of the screenshot instead.
 
     Returns
     -------
     :
-        A tuple containing three images in pillow format: plotter screenshot, expected screenshot and their difference.
+        The result of the comparison between the plotter screenshot and the expected screenshot.
     """
-    plotter.show(auto_close=False)
-    plotter.screenshot(plotter_screenshot)
-    plotter.close()
-    return _compare_images(plotter_screenshot, expected_screenshot, verbose, regold)
+    recorder = image_cache_tester.timings.recorder
+    with recorder.phase("show"):
+        if display:
+            plotter.show(auto_close=False)
+        else:
+            plotter.show(auto_close=False, jupyter_backend="none")
+    if in_memory:
+        with recorder.phase("screenshot"):
+            screenshot = plotter.screenshot(None, return_img=True)
+            plotter.close()
+        assert screenshot is not None
+        recorder.add_bytes("screenshot", screenshot.nbytes)
+        actual_image = image_cache_tester.image_strips.to_rgb(PIL.Image.fromarray(screenshot))
+        expected_screenshot_exists = image_cache_tester.image_pack.exists(expected_screenshot)
+        comparison = _compare_actual_image(
+            actual_image, plotter_screenshot, expected_screenshot, verbose, regold, tolerances, use_digests, regions,
+            tile_size)
+        if not comparison.passed or not expected_screenshot_exists or save_screenshot:
+            image_cache_tester.artifact_writer.writer.save_image(actual_image, plotter_screenshot)
+        return comparison
+    else:
+        with recorder.phase("screenshot"):
+            plotter.screenshot(plotter_screenshot)
+            plotter.close()
+        return _compare_images(
+            plotter_screenshot, expected_screenshot, verbose, regold, tolerances, use_digests, regions, tile_size)
 
 
 def _compare_images(
-    actual_image_path: str, expected_image_path: str, verbose: bool, regold: dict[str, bool] = {}
-) -> tuple[PIL.Image.Image, PIL.Image.Image, PIL.Image.Image]:
+    actual_image_path: str, expected_image_path: str, verbose: bool, regold: dict[str, bool] = {},
+    tolerances: image_cache_tester.compare_arrays.Tolerances = image_cache_tester.compare_arrays.Tolerances(),
+    use_digests: bool = False,
+    regions: image_cache_tester.image_masks.Regions = image_cache_tester.image_masks.Regions(),
+    tile_size: int | None = None, memory_limit: int | None = None, use_cache: bool = True
+) -> ImageComparison:
     """
     Compare two images. RGBA images are silently converted to RGB ignoring alpha channels.
 
@@ -55,48 +217,377 @@ def _compare_images(
     actual_image_path
         Path to the image content from the current evaluation of the code.
     expected_image_path
-        Path to the reference image content.
+        Path to the reference image content. If the path does not exist, the image is read from the image
+        referenced by the path with a .ref suffix appended, or from the pack of the image cache which contains it.
     verbose
         Print additional messages on failed comparison.
     regold
         Dictionary to determine which images should be regolded.
         Allowed keys are "expected_image" and "difference_image". If the key is not found, image will not be regolded.
+    tolerances
+        The tolerances allowed in the comparison. If not provided, the images are required to be identical.
+    use_digests
+        If True, accept the actual image without decoding the expected one when its pixel digest matches
+        the one stored in the image cache manifest or pack.
+    regions
+        The regions restricting which pixels are compared, in addition to the mask stored next to the expected
+        image with a .mask.png suffix in place of the .png one.
+    tile_size
+        If provided, compare images tile by tile through multi-resolution pyramids of tiles of this size.
+        If a pyramid with a .pyramid.npz suffix is stored next to the expected image and its pixel digest
+        matches the one in the image cache manifest, images which are grossly different are rejected without
+        decoding the expected image. Comparisons restricted to a mask are always carried out row by row.
+    memory_limit
+        If provided, decode and compare both images in strips of rows, so that the memory used by the comparison
+        stays below this number of bytes regardless of the image size. Images are only decoded at once when
+        accessing the images of the returned comparison. Incompatible with tile_size.
+    use_cache
+        If True, the expected image is decoded through the process-wide cache of decoded expected images,
+        which pays off only in long-lived processes comparing the same images repeatedly (e.g., notebook kernels).
 
     Returns
     -------
     :
-        A tuple containing three images in pillow format: actual image, expected image and their difference.
+        The result of the comparison between the actual image and the expected image.
     """
     if not os.path.exists(actual_image_path):
         raise RuntimeError(f"{actual_image_path} does not exist")
-    else:
-        actual_image = PIL.Image.open(actual_image_path).convert("RGB")
+    if memory_limit is not None:
+        if tile_size is not None:
+            raise ValueError("Comparisons with a memory limit cannot be carried out tile by tile")
+        return _compare_images_in_strips(
+            actual_image_path, expected_image_path, verbose, tolerances, use_digests, regions, memory_limit, use_cache)
+    with image_cache_tester.timings.recorder.phase("decode_actual"):
+        actual_image = image_cache_tester.image_strips.to_rgb(PIL.Image.open(actual_image_path))
+        actual_image.load()
+    image_cache_tester.timings.recorder.add_bytes("decode_actual", actual_image.width * actual_image.height * 3)
+    return _compare_actual_image(
+        actual_image, actual_image_path, expected_image_path, verbose, regold, tolerances, use_digests, regions,
+        tile_size, use_cache)
+
 
+def _compare_actual_image(
+    actual_image: PIL.Image.Image, actual_image_path: str, expected_image_path: str, verbose: bool,
+    regold: dict[str, bool] = {},
+    tolerances: image_cache_tester.compare_arrays.Tolerances = image_cache_tester.compare_arrays.Tolerances(),
+    use_digests: bool = False,
+    regions: image_cache_tester.image_masks.Regions = image_cache_tester.image_masks.Regions(),
+    tile_size: int | None = None, use_cache: bool = True
+) -> ImageComparison:
+    """
+    Compare an image already loaded in memory to the reference image stored on disk.
+
+    Parameters
+    ----------
+    actual_image
+        The image content from the current evaluation of the code, in RGB format.
+    actual_image_path
+        Path associated to the actual image, only used in messages.
+    expected_image_path
+        Path to the reference image content. If the path does not exist, the image is read from the image
+        referenced by the path with a .ref suffix appended, or from the pack of the image cache which contains it.
+    verbose
+        Print additional messages on failed comparison.
+    regold
+        Dictionary to determine which images should be regolded.
+        Allowed keys are "expected_image" and "difference_image". If the key is not found, image will not be regolded.
+    tolerances
+        The tolerances allowed in the comparison. If not provided, the images are required to be identical.
+    use_digests
+        If True, accept the actual image without decoding the expected one when its pixel digest matches
+        the one stored in the image cache manifest or pack.
+    regions
+        The regions restricting which pixels are compared, in addition to the mask stored next to the expected
+        image with a .mask.png suffix in place of the .png one.
+    tile_size
+        If provided, compare images tile by tile through multi-resolution pyramids of tiles of this size.
+        If a pyramid with a .pyramid.npz suffix is stored next to the expected image and its pixel digest
+        matches the one in the image cache manifest, images which are grossly different are rejected without
+        decoding the expected image. Comparisons restricted to a mask are always carried out row by row.
+    use_cache
+        If True, the expected image is decoded through the process-wide cache of decoded expected images.
+
+    Returns
+    -------
+    :
+        The result of the comparison between the actual image and the expected image.
+    """
     if regold.get("expected_image", False):  # pragma: no cover
         print("Regolding expected image")
         actual_image.save(expected_image_path)
-    if not os.path.exists(expected_image_path):
+    mask_image_path = expected_image_path
+    expected_image_path = image_cache_tester.image_dedup.resolve(expected_image_path)
+    actual_array = np.asarray(actual_image)
+    # The expected image is pixel-wise identical to the actual one if their digests match, so there is no need
+    # to decode it
+    identical_metrics = image_cache_tester.compare_arrays.ComparisonMetrics(
+        passed=True, differing_pixels=0, differing_fraction=0.0, rmse=0.0, psnr=math.inf, complete=True)
+    recorder = image_cache_tester.timings.recorder
+    if use_digests:
+        with recorder.phase("digest", actual_array.nbytes):
+            expected_digest = image_cache_tester.image_cache_manifest.lookup(expected_image_path)
+            identical = expected_digest is not None and (
+                expected_digest == image_cache_tester.image_cache_manifest.pixel_digest(actual_array))
+        if identical:
+            return ImageComparison(actual_image, actual_image, identical_metrics)
+    # Grossly different images are rejected through the precomputed pyramid of the expected image, if available,
+    # so that there is no need to decode it
+    actual_pyramid = None
+    expected_pyramid = None
+    if tile_size is not None and os.path.exists(expected_image_path):
+        with recorder.phase("pyramid"):
+            expected_pyramid = _load_pyramid(expected_image_path, actual_array.shape, tile_size)
+            rejection = None
+            if (
+                expected_pyramid is not None
+                    and
+                image_cache_tester.image_masks.build_mask(mask_image_path, regions, *actual_array.shape[:2]) is None
+            ):
+                actual_pyramid = image_cache_tester.image_pyramid.build_pyramid(actual_array, tile_size)
+                rejection = image_cache_tester.image_pyramid.reject(actual_pyramid, expected_pyramid, tolerances)
+        if rejection is not None:
+            comparison = ImageComparison(
+                actual_image,
+                functools.partial(_expected_image_loader(use_cache), expected_image_path),
+                rejection[0], tiles=rejection[1])
+            if verbose:
+                print(
+                    f"Pyramids of {actual_image_path} and {expected_image_path} differ in tiles "
+                    f"{[tile.box for tile in rejection[1]]}")
+            return comparison
+    expected_image: PIL.Image.Image | npt.NDArray[np.uint8]
+    if os.path.exists(expected_image_path):
+        with recorder.phase("decode_expected"):
+            expected_image = _expected_image_loader(use_cache)(expected_image_path)
+            expected_array = np.asarray(expected_image)
+        recorder.add_bytes("decode_expected", expected_array.nbytes)
+    elif (packed_image := image_cache_tester.image_pack.find(expected_image_path)) is not None:
+        pack, key = packed_image
+        if use_digests:
+            with recorder.phase("digest", actual_array.nbytes):
+                identical = pack.pixel_digest(key) == image_cache_tester.image_cache_manifest.pixel_digest(
+                    actual_array)
+            if identical:
+                return ImageComparison(actual_image, actual_image, identical_metrics)
+        # Raw blocks are a read-only view of the memory mapped pack, and thus are compared without any copy
+        with recorder.phase("decode_expected"):
+            expected_image = expected_array = pack.load_array(key)
+        recorder.add_bytes("decode_expected", expected_array.nbytes)
+    else:
         if verbose:
             print(f"Expected image {expected_image_path} does not exist: creating an empty one")
         expected_image = PIL.Image.new("RGB", actual_image.size)
-    else:
-        expected_image = PIL.Image.open(expected_image_path).convert("RGB")
+        expected_array = np.asarray(expected_image)
 
-    if actual_image.size != expected_image.size:
+    if actual_array.shape != expected_array.shape:
+        expected_size = (expected_array.shape[1], expected_array.shape[0])
         if verbose:
             print(
                 f"Size of {actual_image_path} is {actual_image.size}, while size of {expected_image_path} "
-                f"is {expected_image.size}")
+                f"is {expected_size}")
         # Since we cannot compare images with different sizes, return a difference image equal to the entire
         # expected image, as if the actual image was empty.
-        return actual_image, expected_image, expected_image
+        metrics = image_cache_tester.compare_arrays.ComparisonMetrics(
+            passed=False, differing_pixels=expected_size[0] * expected_size[1], differing_fraction=1.0,
+            rmse=math.inf, psnr=-math.inf, complete=False)
+        if not isinstance(expected_image, PIL.Image.Image):
+            expected_image = PIL.Image.fromarray(expected_image)
+        return ImageComparison(actual_image, expected_image, metrics, expected_image)
 
-    difference_image = PIL.ImageChops.difference(actual_image, expected_image)
+    with recorder.phase("compare", actual_array.nbytes + expected_array.nbytes):
+        mask = image_cache_tester.image_masks.build_mask(mask_image_path, regions, *actual_array.shape[:2])
+        tiles = None
+        if tile_size is not None and mask is None:
+            metrics, tiles = image_cache_tester.image_pyramid.compare_pyramids(
+                actual_array, expected_array, tolerances, tile_size, actual_pyramid, expected_pyramid)
+        else:
+            metrics = image_cache_tester.compare_arrays.compare_arrays(
+                actual_array, expected_array, tolerances, mask=mask)
+    comparison = ImageComparison(actual_image, expected_image, metrics, mask=mask, tiles=tiles)
     if regold.get("difference_image", False):  # pragma: no cover
         print("Regold difference image")
-        difference_image.save(expected_image_path.replace(".png", "_difference_image.png"))
-    if difference_image.getbbox() and verbose:
+        image_cache_tester.artifact_writer.writer.save_image(
+            comparison.difference_image, expected_image_path.replace(".png", "_difference_image.png"))
+    if not comparison.passed and verbose:
         print(
             f"Bounding box for difference between {actual_image_path} and {expected_image_path} "
-            f"is {difference_image.getbbox()}")
-    return actual_image, expected_image, difference_image
+            f"is {comparison.difference_image.getbbox()}")
+    return comparison
+
+
+def _load_pyramid(
+    expected_image_path: str, shape: tuple[int, ...], tile_size: int
+) -> image_cache_tester.image_pyramid.ImagePyramid | None:
+    """Load the precomputed pyramid of the expected image, if it is up to date and has the expected shape."""
+    expected_digest = image_cache_tester.image_cache_manifest.lookup(expected_image_path)
+    if expected_digest is None:
+        return None
+    expected_pyramid = image_cache_tester.image_pyramid.load_pyramid(expected_image_path, expected_digest, tile_size)
+    if expected_pyramid is None or expected_pyramid.shape != shape:
+        return None
+    return expected_pyramid
+
+
+def _compare_images_in_strips(
+    actual_image_path: str, expected_image_path: str, verbose: bool,
+    tolerances: image_cache_tester.compare_arrays.Tolerances, use_digests: bool,
+    regions: image_cache_tester.image_masks.Regions, memory_limit: int, use_cache: bool = True
+) -> ImageComparison:
+    """
+    Compare two images decoding them in strips of rows, so that memory usage does not depend on the image size.
+
+    See _compare_images for the description of the parameters.
+    """
+    mask_image_path = expected_image_path
+    expected_image_path = image_cache_tester.image_dedup.resolve(expected_image_path)
+    with PIL.Image.open(actual_image_path) as image:
+        actual_width, actual_height = image.size
+    shape = (actual_height, actual_width, 3)
+    actual_image = functools.partial(_open_rgb, actual_image_path)
+    # Set up how to load the expected image, either at once or in strips
+    expected_image: collections.abc.Callable[[], PIL.Image.Image]
+    expected_strips: collections.abc.Callable[[int], collections.abc.Iterator[npt.NDArray[np.uint8]]]
+    expected_digest = None
+    if os.path.exists(expected_image_path):
+        with PIL.Image.open(expected_image_path) as image:
+            expected_width, expected_height = image.size
+        expected_shape = (expected_height, expected_width, 3)
+        expected_image = functools.partial(_expected_image_loader(use_cache), expected_image_path)
+        expected_strips = functools.partial(image_cache_tester.image_strips.iter_file_strips, expected_image_path)
+        expected_digest = image_cache_tester.image_cache_manifest.lookup(expected_image_path)
+    elif (packed_image := image_cache_tester.image_pack.find(expected_image_path)) is not None:
+        pack, key = packed_image
+        expected_shape = tuple(pack.index[key]["shape"])
+        expected_image = functools.partial(_load_packed_image, pack, key)
+        expected_strips = functools.partial(pack.iter_strips, key)
+        expected_digest = pack.pixel_digest(key)
+    else:
+        if verbose:
+            print(f"Expected image {expected_image_path} does not exist: creating an empty one")
+        expected_shape = shape
+        expected_image = functools.partial(PIL.Image.new, "RGB", (actual_width, actual_height))
+        expected_strips = functools.partial(_iter_black_strips, shape)
+
+    if expected_shape != shape:
+        expected_size = (expected_shape[1], expected_shape[0])
+        if verbose:
+            print(
+                f"Size of {actual_image_path} is {(actual_width, actual_height)}, while size of "
+                f"{expected_image_path} is {expected_size}")
+        metrics = image_cache_tester.compare_arrays.ComparisonMetrics(
+            passed=False, differing_pixels=expected_size[0] * expected_size[1], differing_fraction=1.0,
+            rmse=math.inf, psnr=-math.inf, complete=False)
+        return ImageComparison(actual_image, expected_image, metrics, expected_image())
+
+    strip_rows = image_cache_tester.image_strips.rows_per_strip(actual_width, memory_limit)
+    if use_digests and expected_digest is not None and expected_digest == (
+        image_cache_tester.image_cache_manifest.strips_pixel_digest(
+            shape, image_cache_tester.image_strips.iter_file_strips(actual_image_path, strip_rows))
+    ):
+        identical_metrics = image_cache_tester.compare_arrays.ComparisonMetrics(
+            passed=True, differing_pixels=0, differing_fraction=0.0, rmse=0.0, psnr=math.inf, complete=True)
+        return ImageComparison(actual_image, actual_image, identical_metrics)
+
+    # Count the compared pixels beforehand, since tolerances depend on it
+    mask_strips: collections.abc.Iterator[npt.NDArray[np.bool_] | None]
+    if image_cache_tester.image_masks.has_mask(mask_image_path, regions):
+        num_pixels = sum(
+            int(np.count_nonzero(mask_strip)) for mask_strip in image_cache_tester.image_masks.iter_mask_strips(
+                mask_image_path, regions, actual_height, actual_width, strip_rows))
+        mask_strips = image_cache_tester.image_masks.iter_mask_strips(
+            mask_image_path, regions, actual_height, actual_width, strip_rows)
+        mask: collections.abc.Callable[[], npt.NDArray[np.bool_] | None] | None = functools.partial(
+            image_cache_tester.image_masks.build_mask, mask_image_path, regions, actual_height, actual_width)
+    else:
+        num_pixels = actual_height * actual_width
+        mask_strips = itertools.repeat(None)
+        mask = None
+    num_values = num_pixels * shape[2]
+    max_differing_pixels = tolerances.max_differing_pixels(num_pixels)
+    max_squared_error = tolerances.max_squared_error(num_values)
+    differing_pixels = 0
+    squared_error = 0
+    complete = True
+    rows_compared = 0
+    # The bounding box of the difference is only printed in verbose mode, and is built strip by strip rather
+    # than from the difference image, which would require to decode both images at once
+    bbox: tuple[int, int, int, int] | None = None
+    for (actual_strip, expected_strip, mask_strip) in zip(
+        image_cache_tester.image_strips.iter_file_strips(actual_image_path, strip_rows),
+        expected_strips(strip_rows), mask_strips
+    ):
+        row_begin = rows_compared
+        rows_compared += actual_strip.shape[0]
+        if np.array_equal(actual_strip, expected_strip):
+            continue
+        if verbose:
+            bbox = _union_bbox(bbox, _strip_bbox(actual_strip, expected_strip, mask_strip, row_begin))
+        strip_differing_pixels, strip_squared_error = image_cache_tester.compare_arrays.block_errors(
+            actual_strip, expected_strip, tolerances.channel_threshold, mask_strip)
+        differing_pixels += strip_differing_pixels
+        squared_error += strip_squared_error
+        if differing_pixels > max_differing_pixels or squared_error > max_squared_error:
+            complete = rows_compared >= actual_height
+            break
+    metrics = image_cache_tester.compare_arrays.make_metrics(
+        differing_pixels, squared_error, num_pixels, num_values, tolerances, complete)
+    comparison = ImageComparison(actual_image, expected_image, metrics, mask=mask)
+    if not comparison.passed and verbose:
+        print(
+            f"Bounding box for difference between {actual_image_path} and {expected_image_path} "
+            f"is {bbox}" + ("" if complete else f" within the first {rows_compared} rows"))
+    return comparison
+
+
+def _strip_bbox(
+    actual_strip: npt.NDArray[np.uint8], expected_strip: npt.NDArray[np.uint8],
+    mask_strip: npt.NDArray[np.bool_] | None, row_begin: int
+) -> tuple[int, int, int, int] | None:
+    """Return the bounding box of the pixels which differ in a strip starting at a given row, if any."""
+    differing = (actual_strip != expected_strip).any(axis=2)
+    if mask_strip is not None:
+        differing &= mask_strip
+    rows = np.flatnonzero(differing.any(axis=1))
+    if len(rows) == 0:
+        return None
+    columns = np.flatnonzero(differing.any(axis=0))
+    return (int(columns[0]), row_begin + int(rows[0]), int(columns[-1]) + 1, row_begin + int(rows[-1]) + 1)
+
+
+def _union_bbox(
+    bbox: tuple[int, int, int, int] | None, other_bbox: tuple[int, int, int, int] | None
+) -> tuple[int, int, int, int] | None:
+    """Return the smallest bounding box containing two bounding boxes, either of which may be empty."""
+    if bbox is None:
+        return other_bbox
+    if other_bbox is None:
+        return bbox
+    return (
+        min(bbox[0], other_bbox[0]), min(bbox[1], other_bbox[1]), max(bbox[2], other_bbox[2]),
+        max(bbox[3], other_bbox[3]))
+
+
+def _open_rgb(image_path: str) -> PIL.Image.Image:
+    """Decode an image in RGB format."""
+    return image_cache_tester.image_strips.to_rgb(PIL.Image.open(image_path))
+
+
+def _expected_image_loader(use_cache: bool) -> collections.abc.Callable[[str], PIL.Image.Image]:
+    """Return how to decode an expected image, either through the cache of decoded expected images or not."""
+    if use_cache:
+        return image_cache_tester.decoded_image_cache.expected_images.load
+    else:
+        return _open_rgb
+
+
+def _load_packed_image(pack: image_cache_tester.image_pack.ImagePack, key: str) -> PIL.Image.Image:
+    """Decode an image stored in a pack."""
+    return PIL.Image.fromarray(pack.load_array(key))
+
+
+def _iter_black_strips(
+    shape: tuple[int, int, int], strip_rows: int
+) -> collections.abc.Iterator[npt.NDArray[np.uint8]]:
+    """Generate the strips of a black image, in place of an expected image which does not exist."""
+    for row_begin in range(0, shape[0], strip_rows):
+        yield np.zeros((min(strip_rows, shape[0] - row_begin), *shape[1:]), dtype=np.uint8)
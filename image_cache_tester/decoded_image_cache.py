@@ -0,0 +1,102 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Cache of decoded expected images."""
+
+import collections
+import os
+import threading
+
+import PIL.Image
+
+import image_cache_tester.image_strips
+
+
+class DecodedImageCache:
+    """
+    Bounded least recently used cache of decoded images, keyed by path, size and modification time.
+
+    Images returned by the cache are shared between callers, and hence must not be modified.
+
+    Parameters
+    ----------
+    max_bytes
+        Maximum number of bytes occupied by the decoded images stored in the cache. Images larger than
+        this limit are decoded but never stored. Set to zero to disable caching.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._images: collections.OrderedDict[tuple[str, int, int], PIL.Image.Image] = collections.OrderedDict()
+        self._keys: dict[str, tuple[str, int, int]] = dict()
+        self._lock = threading.Lock()
+
+    def load(self, path: str) -> PIL.Image.Image:
+        """
+        Load an image in RGB format, decoding it only if it is not available in the cache.
+
+        Parameters
+        ----------
+        path
+            Path to the image.
+
+        Returns
+        -------
+        :
+            The decoded image, in RGB format.
+        """
+        path = os.path.abspath(path)
+        path_stat = os.stat(path)
+        key = (path, path_stat.st_size, path_stat.st_mtime_ns)
+        with self._lock:
+            if key in self._images:
+                self.hits += 1
+                self._images.move_to_end(key)
+                return self._images[key]
+            self.misses += 1
+        image = image_cache_tester.image_strips.to_rgb(PIL.Image.open(path))
+        image_bytes = _image_bytes(image)
+        with self._lock:
+            # Drop a stale entry associated to a previous version of the same file
+            if path in self._keys:
+                self._remove(self._keys[path])
+            if image_bytes <= self.max_bytes:
+                self._images[key] = image
+                self._keys[path] = key
+                self.current_bytes += image_bytes
+                while self.current_bytes > self.max_bytes:
+                    self._remove(next(iter(self._images)))
+        return image
+
+    def clear(self) -> None:
+        """Remove all images from the cache, and reset hit and miss counters."""
+        with self._lock:
+            self._images.clear()
+            self._keys.clear()
+            self.current_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        """Return the number of images stored in the cache."""
+        return len(self._images)
+
+    def _remove(self, key: tuple[str, int, int]) -> None:
+        """Remove an image from the cache. The lock must be held by the caller."""
+        image = self._images.pop(key)
+        del self._keys[key[0]]
+        self.current_bytes -= _image_bytes(image)
+
+
+def _image_bytes(image: PIL.Image.Image) -> int:
+    """Return the number of bytes occupied by a decoded image."""
+    return image.width * image.height * len(image.getbands())
+
+
+expected_images = DecodedImageCache(
+    max_bytes=int(os.environ.get("IMAGE_CACHE_TESTER_DECODED_CACHE_BYTES", 256 * 1024 * 1024)))
@@ -0,0 +1,155 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Digest sidecar index of the images stored in the image cache."""
+
+import collections.abc
+import hashlib
+import json
+import os
+import tempfile
+import typing
+
+import numpy as np
+import numpy.typing as npt
+
+manifest_name = ".digests.json"
+
+_manifests: dict[str, tuple[int, dict[str, dict[str, typing.Any]]]] = {}
+
+
+def pixel_digest(image_array: npt.NDArray[np.uint8]) -> str:
+    """
+    Compute a digest of the raw pixels of an image.
+
+    Parameters
+    ----------
+    image_array
+        The image content, stored as a uint8 array of shape (height, width, channels).
+
+    Returns
+    -------
+    :
+        The hexadecimal digest of the image shape and pixels.
+    """
+    return strips_pixel_digest(image_array.shape, [image_array])
+
+
+def strips_pixel_digest(
+    shape: tuple[int, ...], strips: collections.abc.Iterable[npt.NDArray[np.uint8]]
+) -> str:
+    """
+    Compute a digest of the raw pixels of an image provided in strips of rows.
+
+    Parameters
+    ----------
+    shape
+        The shape of the whole image.
+    strips
+        The image content, split in consecutive strips of rows.
+
+    Returns
+    -------
+    :
+        The same digest as the one computed by pixel_digest on the whole image.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(tuple(shape)).encode())
+    for strip in strips:
+        digest.update(np.ascontiguousarray(strip).data)
+    return digest.hexdigest()
+
+
+def file_digest(path: str) -> str:
+    """Compute a digest of the content of a file, without decoding it."""
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=16)).hexdigest()
+
+
+def lookup(image_path: str) -> str | None:
+    """
+    Return the pixel digest of an image in the cache, if the manifest contains an up to date entry for it.
+
+    An entry is considered up to date if size and modification time of the image match the ones stored in the
+    manifest. If only the modification time differs, as it happens after a fresh clone of the image cache,
+    the entry is validated comparing the digest of the file content, which is still cheaper than decoding
+    the image.
+
+    Parameters
+    ----------
+    image_path
+        Path to the image in the cache.
+
+    Returns
+    -------
+    :
+        The pixel digest of the image, or None if the manifest does not contain an up to date entry.
+    """
+    try:
+        image_stat = os.stat(image_path)
+    except FileNotFoundError:
+        return None
+    entries = _load_manifest(os.path.dirname(image_path))
+    entry = entries.get(os.path.basename(image_path))
+    if entry is None or entry["size"] != image_stat.st_size:
+        return None
+    if entry["mtime_ns"] != image_stat.st_mtime_ns:
+        if entry["file_digest"] != file_digest(image_path):
+            return None
+        # Only update the in-memory copy of the manifest, so that verification never writes to the cache
+        entry["mtime_ns"] = image_stat.st_mtime_ns
+    return typing.cast(str, entry["pixel_digest"])
+
+
+def record(image_path: str, image_array: npt.NDArray[np.uint8]) -> None:
+    """
+    Record the pixel digest of an image in the cache, updating the manifest of its directory.
+
+    Parameters
+    ----------
+    image_path
+        Path to the image in the cache.
+    image_array
+        The pixels stored in the image.
+    """
+    directory = os.path.dirname(image_path)
+    name = os.path.basename(image_path)
+    image_stat = os.stat(image_path)
+    entry = {
+        "size": image_stat.st_size,
+        "mtime_ns": image_stat.st_mtime_ns,
+        "file_digest": file_digest(image_path),
+        "pixel_digest": pixel_digest(image_array)
+    }
+    entries = _load_manifest(directory)
+    if entries.get(name) == entry:
+        return
+    # Update a copy of the entries, so that the in-memory manifest is unchanged if writing fails
+    entries = {**entries, name: entry}
+    with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False) as f:
+        try:
+            json.dump(entries, f, indent=1, sort_keys=True)
+        except BaseException:
+            # Do not leave a partially written manifest behind
+            f.close()
+            os.remove(f.name)
+            raise
+    manifest_path = os.path.join(directory, manifest_name)
+    os.replace(f.name, manifest_path)
+    _manifests[directory] = (os.stat(manifest_path).st_mtime_ns, entries)
+
+
+def _load_manifest(directory: str) -> dict[str, dict[str, typing.Any]]:
+    """Load the manifest stored in a directory, reusing the parsed content if the file has not changed."""
+    manifest_path = os.path.join(directory, manifest_name)
+    try:
+        manifest_mtime_ns = os.stat(manifest_path).st_mtime_ns
+    except FileNotFoundError:
+        _manifests.pop(directory, None)
+        return {}
+    if directory not in _manifests or _manifests[directory][0] != manifest_mtime_ns:
+        with open(manifest_path) as f:
+            _manifests[directory] = (manifest_mtime_ns, json.load(f))
+    return _manifests[directory][1]
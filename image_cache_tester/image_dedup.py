@@ -0,0 +1,209 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Deduplication of identical images produced by different ranks in the image cache."""
+
+import collections.abc
+import os
+import re
+import shutil
+import typing
+
+import numpy as np
+import PIL.Image
+
+import image_cache_tester.image_cache_manifest
+
+if typing.TYPE_CHECKING:
+    import mpi4py.MPI
+
+reference_suffix = ".ref"
+
+_comm_rank_pattern = re.compile(r"^comm_rank=(\d+)$")
+
+
+def resolve(image_path: str) -> str:
+    """
+    Resolve the reference which replaces an image, if any.
+
+    Parameters
+    ----------
+    image_path
+        Path to the image.
+
+    Returns
+    -------
+    :
+        The path to the image referenced by image_path + ".ref", if the image does not exist but the reference
+        does. Otherwise, the path to the image itself.
+    """
+    if os.path.exists(image_path):
+        return image_path
+    reference_path = image_path + reference_suffix
+    if not os.path.exists(reference_path):
+        return image_path
+    with open(reference_path) as f:
+        return os.path.normpath(os.path.join(os.path.dirname(image_path), f.read().strip()))
+
+
+def write_reference(image_path: str, target_path: str) -> None:
+    """
+    Replace an image with a reference to an identical image.
+
+    Parameters
+    ----------
+    image_path
+        Path to the image to be replaced. The image is removed, if it exists.
+    target_path
+        Path to the image which is referenced. The path must not be a reference itself.
+    """
+    assert os.path.exists(target_path)
+    with open(image_path + reference_suffix, "w") as f:
+        f.write(os.path.relpath(target_path, os.path.dirname(image_path)) + "\n")
+    if os.path.exists(image_path):
+        os.remove(image_path)
+
+
+def remove_reference(image_path: str) -> None:
+    """Remove the reference which replaces an image, if any, so that the image takes precedence."""
+    if os.path.exists(image_path + reference_suffix):
+        os.remove(image_path + reference_suffix)
+
+
+def select_references(digests: list[str | None]) -> list[int | None]:
+    """
+    Select which ranks should reference the image of another rank.
+
+    Parameters
+    ----------
+    digests
+        The pixel digest of the image of each rank, or None if a rank has no image.
+
+    Returns
+    -------
+    :
+        For each rank, the lowest rank with an identical image if that is a different rank, or None if the
+        rank should store its own image.
+    """
+    first_ranks: dict[str, int] = dict()
+    references: list[int | None] = []
+    for (rank, digest) in enumerate(digests):
+        if digest is None:
+            references.append(None)
+        elif digest not in first_ranks:
+            first_ranks[digest] = rank
+            references.append(None)
+        else:
+            references.append(first_ranks[digest])
+    return references
+
+
+def deduplicate_across_ranks(
+    digests: dict[str, str], image_path_generator: collections.abc.Callable[[str, int], str],
+    comm: "mpi4py.MPI.Comm | None" = None
+) -> int:
+    """
+    Replace the images of the current rank which are identical to the ones of a lower rank with references.
+
+    This function is collective, and must be called after all images have been written by all ranks.
+
+    Parameters
+    ----------
+    digests
+        Dictionary from the id of each cell verified on the current rank to the pixel digest of the image
+        stored in the image cache.
+    image_path_generator
+        Function returning the path in the image cache of the image associated to a cell id and a rank.
+    comm
+        The communicator over which digests are exchanged. If not provided, the world communicator is used.
+
+    Returns
+    -------
+    :
+        The number of images of the current rank which were replaced by a reference.
+    """
+    if comm is None:
+        import mpi4py.MPI
+        comm = mpi4py.MPI.COMM_WORLD
+    all_digests = comm.allgather(digests)
+    replaced = 0
+    for cell_id in digests:
+        reference = select_references([rank_digests.get(cell_id) for rank_digests in all_digests])[comm.rank]
+        image_path = image_path_generator(cell_id, comm.rank)
+        if reference is not None:
+            write_reference(image_path, image_path_generator(cell_id, reference))
+            replaced += 1
+        else:
+            # The image differs from the ones of lower ranks, so a previous reference is no longer valid
+            remove_reference(image_path)
+    return replaced
+
+
+def deduplicate_image_cache(cache_dir: str) -> int:
+    """
+    Replace images which are identical across ranks with references to the image of the lowest rank.
+
+    Parameters
+    ----------
+    cache_dir
+        The image cache directory.
+
+    Returns
+    -------
+    :
+        The number of images replaced by a reference.
+    """
+    # Group images which only differ in the comm_rank component of their path
+    groups: dict[tuple[str, ...], dict[int, str]] = dict()
+    for (dirpath, _, filenames) in os.walk(cache_dir):
+        parts = os.path.relpath(dirpath, cache_dir).split(os.sep)
+        rank_indices = [index for (index, part) in enumerate(parts) if _comm_rank_pattern.match(part)]
+        if len(rank_indices) != 1:
+            continue
+        rank_match = _comm_rank_pattern.match(parts[rank_indices[0]])
+        assert rank_match is not None
+        for filename in filenames:
+            if filename.endswith(".png") and not filename.endswith("_difference_image.png"):
+                key = (*parts[:rank_indices[0]], *parts[rank_indices[0] + 1:], filename)
+                groups.setdefault(key, dict())[int(rank_match.group(1))] = os.path.join(dirpath, filename)
+    replaced = 0
+    for rank_images in groups.values():
+        ranks = sorted(rank_images)
+        digests: list[str | None] = [None] * (ranks[-1] + 1)
+        for rank in ranks:
+            digests[rank] = image_cache_tester.image_cache_manifest.pixel_digest(
+                np.asarray(PIL.Image.open(rank_images[rank]).convert("RGB")))
+        for (rank, reference) in enumerate(select_references(digests)):
+            if reference is not None:
+                write_reference(rank_images[rank], rank_images[reference])
+                replaced += 1
+    return replaced
+
+
+def restore_image_cache(cache_dir: str) -> int:
+    """
+    Replace every reference in the image cache with a copy of the referenced image.
+
+    Parameters
+    ----------
+    cache_dir
+        The image cache directory.
+
+    Returns
+    -------
+    :
+        The number of references which were replaced.
+    """
+    reference_paths: list[str] = []
+    for (dirpath, _, filenames) in os.walk(cache_dir):
+        reference_paths.extend(
+            os.path.join(dirpath, filename) for filename in filenames if filename.endswith(reference_suffix))
+    # Copy all images first, since references always point to actual images and not to other references
+    for reference_path in reference_paths:
+        image_path = reference_path[:-len(reference_suffix)]
+        shutil.copyfile(resolve(image_path), image_path)
+    for reference_path in reference_paths:
+        os.remove(reference_path)
+    return len(reference_paths)
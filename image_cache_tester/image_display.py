@@ -0,0 +1,64 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Policies to display the images of a verification in a notebook, bounding the size of its outputs."""
+
+import PIL.Image
+
+import image_cache_tester.compare_images
+import image_cache_tester.rank_verdicts
+
+
+def display_items(
+    comparison: image_cache_tester.compare_images.ImageComparison, mode: str = "full", thumbnail_size: int = 128,
+    display_passed: bool = True
+) -> list[str | PIL.Image.Image]:
+    """
+    Return the titles and images to be displayed in a notebook after an image verification.
+
+    Images are embedded in the notebook outputs, hence every mode other than full bounds the size of the outputs
+    of each cell independently of the size of the screenshots.
+
+    Parameters
+    ----------
+    comparison
+        The result of the comparison.
+    mode
+        Either full, to display the actual, expected and difference images at full resolution, thumbnails, to
+        display each of them downscaled, or composite, to display a single image with all of them downscaled
+        and placed side by side. Only the actual image is displayed if the verification passed. In composite mode,
+        the title of a failed verification points to display_full_images, since the screenshots of failed
+        verifications are always saved.
+    thumbnail_size
+        Maximum width and height of each downscaled image.
+    display_passed
+        Whether to display the actual image if the verification passed.
+
+    Returns
+    -------
+    :
+        Titles, each followed by the corresponding image. The list is empty if nothing is to be displayed.
+    """
+    if mode not in ("full", "thumbnails", "composite"):
+        raise ValueError(f"Invalid display mode {mode}: expected either full, thumbnails or composite")
+    if comparison.passed:
+        if not display_passed:
+            return []
+        titles = ["Actual screenshot"]
+        images = [comparison.actual_image]
+    else:
+        titles = ["Actual screenshot", "Expected screenshot", "Difference between screenshots"]
+        images = list(comparison)
+    if mode == "composite":
+        title = ", ".join(titles)
+        if not comparison.passed:
+            title += " (call display_full_images for full resolution images)"
+        return [title, image_cache_tester.rank_verdicts.composite_thumbnail(images, thumbnail_size)]
+    if mode == "thumbnails":
+        images = [image_cache_tester.rank_verdicts.composite_thumbnail([image], thumbnail_size) for image in images]
+    items: list[str | PIL.Image.Image] = []
+    for (title, image) in zip(titles, images):
+        items.extend([title, image])
+    return items
@@ -0,0 +1,228 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Masks and regions of interest restricting which pixels of an image are compared."""
+
+import collections.abc
+import dataclasses
+import os
+import re
+import typing
+
+import numpy as np
+import numpy.typing as npt
+import PIL.Image
+
+import image_cache_tester.image_dedup
+import image_cache_tester.image_pack
+import image_cache_tester.image_strips
+
+mask_suffix = ".mask.png"
+
+_region_pattern = re.compile(
+    r"^\s*#\s*PYTEST_IMAGE_(ROI|IGNORE)\s*:\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*$", re.MULTILINE)
+
+
+@dataclasses.dataclass(frozen=True)
+class Regions:
+    """
+    Rectangular regions restricting which pixels of an image are compared.
+
+    Each region is a box (left, upper, right, lower) in pixel coordinates, with the same conventions as PIL,
+    i.e. the right and lower coordinates are excluded.
+
+    Parameters
+    ----------
+    include
+        Regions of interest. If provided, only the pixels inside at least one of them are compared.
+    exclude
+        Regions to be ignored, e.g. the ones containing a timestamp or a text overlay. Exclusion takes precedence
+        over inclusion.
+    """
+
+    include: tuple[tuple[int, int, int, int], ...] = ()
+    exclude: tuple[tuple[int, int, int, int], ...] = ()
+
+    def __bool__(self) -> bool:
+        """Return whether any region was provided."""
+        return len(self.include) > 0 or len(self.exclude) > 0
+
+    def to_mask(
+        self, height: int, width: int, row_begin: int = 0, row_end: int | None = None
+    ) -> npt.NDArray[np.bool_]:
+        """
+        Return a boolean array which is True on the pixels to be compared.
+
+        Parameters
+        ----------
+        height, width
+            Size of the image.
+        row_begin, row_end
+            Range of rows of the image to be returned. If not provided, all rows are returned.
+
+        Returns
+        -------
+        :
+            A boolean array of shape (row_end - row_begin, width).
+        """
+        if row_end is None:
+            row_end = height
+        mask = np.full((row_end - row_begin, width), len(self.include) == 0)
+        for (left, upper, right, lower) in self.include:
+            mask[max(upper - row_begin, 0):max(lower - row_begin, 0), left:right] = True
+        for (left, upper, right, lower) in self.exclude:
+            mask[max(upper - row_begin, 0):max(lower - row_begin, 0), left:right] = False
+        return mask
+
+
+def parse_regions(source: str) -> Regions:
+    """
+    Parse the regions declared in the source code of a cell.
+
+    Regions of interest are declared by comments like `# PYTEST_IMAGE_ROI: left, upper, right, lower`,
+    and regions to be ignored by comments like `# PYTEST_IMAGE_IGNORE: left, upper, right, lower`.
+    Each marker may be repeated to declare several regions.
+
+    Parameters
+    ----------
+    source
+        The source code of the cell.
+
+    Returns
+    -------
+    :
+        The regions declared in the cell, which are empty if the cell contains no marker.
+    """
+    include = []
+    exclude = []
+    for match in _region_pattern.finditer(source):
+        left, upper, right, lower = (int(coordinate) for coordinate in match.group(2, 3, 4, 5))
+        if left >= right or upper >= lower:
+            raise ValueError(f"Invalid region in {match.group(0).strip()}: the region is empty")
+        if match.group(1) == "ROI":
+            include.append((left, upper, right, lower))
+        else:
+            exclude.append((left, upper, right, lower))
+    return Regions(tuple(include), tuple(exclude))
+
+
+def mask_path(image_path: str) -> str:
+    """Return the path of the mask stored next to an image of the image cache."""
+    assert image_path.endswith(".png")
+    return image_path[:-len(".png")] + mask_suffix
+
+
+def is_mask(path: str) -> bool:
+    """Return whether a path refers to a mask rather than to an image."""
+    return path.removesuffix(image_cache_tester.image_dedup.reference_suffix).endswith(mask_suffix)
+
+
+def load_mask(image_path: str) -> npt.NDArray[np.bool_] | None:
+    """
+    Load the mask stored next to an image of the image cache.
+
+    Masks are images in which non-black pixels are compared and black pixels are ignored. As images, masks
+    may be stored on disk, replaced by a reference or stored in a pack.
+
+    Parameters
+    ----------
+    image_path
+        Path to the image.
+
+    Returns
+    -------
+    :
+        A boolean array of shape (height, width) which is True on the pixels to be compared, or None if the image
+        has no mask.
+    """
+    path = image_cache_tester.image_dedup.resolve(mask_path(image_path))
+    if os.path.exists(path):
+        mask_array = np.asarray(image_cache_tester.image_strips.to_rgb(PIL.Image.open(path)))
+    elif (packed_mask := image_cache_tester.image_pack.find(path)) is not None:
+        pack, key = packed_mask
+        mask_array = pack.load_array(key)
+    else:
+        return None
+    return typing.cast(npt.NDArray[np.bool_], mask_array.any(axis=2))
+
+
+def build_mask(image_path: str, regions: Regions, height: int, width: int) -> npt.NDArray[np.bool_] | None:
+    """
+    Combine the mask stored next to an image of the image cache with the regions declared for it.
+
+    Parameters
+    ----------
+    image_path
+        Path to the image.
+    regions
+        The regions declared for the image.
+    height, width
+        Size of the image.
+
+    Returns
+    -------
+    :
+        A boolean array of shape (height, width) which is True on the pixels to be compared, or None if all pixels
+        are to be compared.
+    """
+    mask = load_mask(image_path)
+    if mask is not None and mask.shape != (height, width):
+        raise ValueError(
+            f"Size of mask {mask_path(image_path)} is {(mask.shape[1], mask.shape[0])}, "
+            f"while size of the image is {(width, height)}")
+    if regions:
+        regions_mask = regions.to_mask(height, width)
+        mask = regions_mask if mask is None else mask & regions_mask
+    return mask
+
+
+def has_mask(image_path: str, regions: Regions) -> bool:
+    """Return whether the comparison of an image of the image cache is restricted by a mask or by regions."""
+    return bool(regions) or image_cache_tester.image_pack.exists(mask_path(image_path))
+
+
+def iter_mask_strips(
+    image_path: str, regions: Regions, height: int, width: int, strip_rows: int
+) -> collections.abc.Iterator[npt.NDArray[np.bool_]]:
+    """
+    Combine the mask stored next to an image of the image cache with the regions declared for it, in strips of rows.
+
+    Parameters
+    ----------
+    image_path
+        Path to the image.
+    regions
+        The regions declared for the image.
+    height, width
+        Size of the image.
+    strip_rows
+        Number of rows of each strip.
+
+    Returns
+    -------
+    :
+        A generator of boolean arrays of shape (rows, width) which are True on the pixels to be compared.
+    """
+    path = image_cache_tester.image_dedup.resolve(mask_path(image_path))
+    mask_strips: collections.abc.Iterator[npt.NDArray[np.uint8]] | None
+    if os.path.exists(path):
+        with PIL.Image.open(path) as mask_image:
+            mask_size = mask_image.size
+        mask_strips = image_cache_tester.image_strips.iter_file_strips(path, strip_rows)
+    elif (packed_mask := image_cache_tester.image_pack.find(path)) is not None:
+        pack, key = packed_mask
+        mask_size = (pack.index[key]["shape"][1], pack.index[key]["shape"][0])
+        mask_strips = pack.iter_strips(key, strip_rows)
+    else:
+        mask_size = (width, height)
+        mask_strips = None
+    if mask_size != (width, height):
+        raise ValueError(
+            f"Size of mask {mask_path(image_path)} is {mask_size}, while size of the image is {(width, height)}")
+    for row_begin in range(0, height, strip_rows):
+        mask = regions.to_mask(height, width, row_begin, min(row_begin + strip_rows, height))
+        if mask_strips is not None:
+            mask &= next(mask_strips).any(axis=2)
+        yield mask
@@ -0,0 +1,477 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Packed storage format for the image cache, with one indexed file per notebook."""
+
+import collections.abc
+import json
+import mmap
+import os
+import shutil
+import struct
+import types
+import typing
+import zlib
+
+import numpy as np
+import numpy.typing as npt
+import PIL.Image
+
+import image_cache_tester.image_cache_manifest
+import image_cache_tester.image_dedup
+
+pack_suffix = ".pack"
+
+_magic = b"ICTPACK1"
+_header = struct.Struct("<8sQQ")
+_alignment = 64
+
+_packs: dict[str, tuple[int, "ImagePack"]] = {}
+
+
+class ImagePack:
+    """
+    Read-only access to a pack of images through a memory map.
+
+    A pack starts with a header containing the offset and length of a JSON index, which is stored at the end
+    of the file. The index maps the path of each image, relative to the notebook directory in the image cache,
+    to the offset, length, shape, compression and pixel digest of its block. Blocks contain the RGB pixels
+    either raw, in which case they are read without any copy, or compressed with zlib. Identical images,
+    e.g. the ones produced by different ranks, share the same block.
+
+    Parameters
+    ----------
+    path
+        Path to the pack.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_offset, index_length = _header.unpack_from(self._mmap, 0)
+        if magic != _magic:
+            self._mmap.close()
+            raise RuntimeError(f"{path} is not an image pack")
+        self.index: dict[str, dict[str, typing.Any]] = json.loads(
+            self._mmap[index_offset:index_offset + index_length])
+
+    def __enter__(self) -> "ImagePack":
+        """Enter the context manager."""
+        return self
+
+    def __exit__(
+        self, exception_type: type[BaseException] | None, exception_value: BaseException | None,
+        traceback: types.TracebackType | None
+    ) -> None:
+        """Close the memory map when exiting the context manager."""
+        self.close()
+
+    def close(self) -> None:
+        """Close the memory map."""
+        self._mmap.close()
+
+    def __contains__(self, key: str) -> bool:
+        """Return whether the pack contains an image."""
+        return key in self.index
+
+    def load_array(self, key: str) -> npt.NDArray[np.uint8]:
+        """
+        Load an image from the pack.
+
+        Parameters
+        ----------
+        key
+            Path of the image, relative to the notebook directory in the image cache.
+
+        Returns
+        -------
+        :
+            The image content, as a read-only uint8 array of shape (height, width, 3). Raw blocks are
+            returned as a view of the memory map.
+        """
+        entry = self.index[key]
+        offset, length = entry["offset"], entry["length"]
+        if entry["compression"] == "raw":
+            buffer: typing.Any = self._mmap
+        else:
+            assert entry["compression"] == "zlib"
+            buffer = zlib.decompress(memoryview(self._mmap)[offset:offset + length])
+            offset, length = 0, len(buffer)
+        return np.frombuffer(buffer, dtype=np.uint8, count=length, offset=offset).reshape(entry["shape"])
+
+    def iter_strips(self, key: str, strip_rows: int) -> collections.abc.Iterator[npt.NDArray[np.uint8]]:
+        """
+        Load an image from the pack in strips of rows.
+
+        Raw blocks are split in read-only views of the memory map, and the pages of each strip are released
+        once the following strip is requested, so that the resident memory does not grow with the image size.
+        Compressed blocks are decompressed incrementally.
+
+        Parameters
+        ----------
+        key
+            Path of the image, relative to the notebook directory in the image cache.
+        strip_rows
+            Number of rows of each strip.
+
+        Returns
+        -------
+        :
+            A generator of strips, stored as uint8 arrays of shape (rows, width, 3).
+        """
+        entry = self.index[key]
+        offset, length = entry["offset"], entry["length"]
+        _, width, channels = entry["shape"]
+        strip_bytes = strip_rows * width * channels
+        if entry["compression"] == "raw":
+            for strip_begin in range(offset, offset + length, strip_bytes):
+                strip_end = min(strip_begin + strip_bytes, offset + length)
+                yield np.frombuffer(
+                    self._mmap, dtype=np.uint8, count=strip_end - strip_begin, offset=strip_begin
+                ).reshape(-1, width, channels)
+                self._release(strip_begin, strip_end)
+        else:
+            assert entry["compression"] == "zlib"
+            decompressor = zlib.decompressobj()
+            rows = bytearray()
+            for piece_begin in range(offset, offset + length, strip_bytes):
+                compressed = self._mmap[piece_begin:min(piece_begin + strip_bytes, offset + length)]
+                while len(compressed) > 0:
+                    rows += decompressor.decompress(compressed, strip_bytes)
+                    compressed = decompressor.unconsumed_tail
+                    while len(rows) >= strip_bytes:
+                        yield np.frombuffer(bytes(rows[:strip_bytes]), dtype=np.uint8).reshape(-1, width, channels)
+                        del rows[:strip_bytes]
+            rows += decompressor.flush()
+            if len(rows) > 0:
+                yield np.frombuffer(bytes(rows), dtype=np.uint8).reshape(-1, width, channels)
+
+    def _release(self, begin: int, end: int) -> None:
+        """Release the resident pages of a range of the memory map, which are read again from disk if needed."""
+        if hasattr(mmap, "MADV_DONTNEED"):
+            page_begin = begin - begin % mmap.PAGESIZE
+            self._mmap.madvise(mmap.MADV_DONTNEED, page_begin, end - page_begin)
+
+    def pixel_digest(self, key: str) -> str:
+        """Return the pixel digest of an image in the pack."""
+        return typing.cast(str, self.index[key]["pixel_digest"])
+
+
+class _PackWriter:
+    """
+    Write a pack one image at a time, so that only the image being added is held in memory.
+
+    The pack is written to a temporary file, which replaces the pack only once the index has been written.
+
+    Parameters
+    ----------
+    path
+        Path to the pack.
+    compression
+        Either "raw", to store pixels uncompressed and read them without any copy, or "zlib", to compress them.
+    """
+
+    def __init__(self, path: str, compression: str) -> None:
+        if compression not in ("raw", "zlib"):
+            raise ValueError(f"Invalid compression {compression}: expected either raw or zlib")
+        self.path = path
+        self.compression = compression
+        self._index: dict[str, dict[str, typing.Any]] = dict()
+        self._blocks: dict[str, tuple[int, int]] = dict()
+        self._file = open(path + ".tmp", "wb")
+        self._file.write(_header.pack(_magic, 0, 0))
+
+    def __enter__(self) -> "_PackWriter":
+        """Enter the context manager."""
+        return self
+
+    def __exit__(
+        self, exception_type: type[BaseException] | None, exception_value: BaseException | None,
+        traceback: types.TracebackType | None
+    ) -> None:
+        """Complete the pack, or discard it if an exception was raised while adding images."""
+        if exception_type is None:
+            self.close()
+        else:
+            self._file.close()
+            os.remove(self.path + ".tmp")
+
+    def add(self, key: str, image_array: npt.NDArray[np.uint8]) -> None:
+        """
+        Add an image to the pack, sharing its block with an identical image already added.
+
+        Parameters
+        ----------
+        key
+            Path of the image, relative to the notebook directory in the image cache.
+        image_array
+            The image content, stored as a uint8 array of shape (height, width, 3).
+        """
+        image_array = np.ascontiguousarray(image_array)
+        assert image_array.dtype == np.uint8 and image_array.ndim == 3
+        image_digest = image_cache_tester.image_cache_manifest.pixel_digest(image_array)
+        if image_digest not in self._blocks:
+            self._write_block(
+                image_digest,
+                image_array.tobytes() if self.compression == "raw" else zlib.compress(image_array.tobytes()))
+        self._add_entry(key, list(image_array.shape), image_digest)
+
+    def copy(self, pack: ImagePack, key: str) -> None:
+        """
+        Add an image of another pack, copying its block without decoding it if it has the same compression.
+
+        Parameters
+        ----------
+        pack
+            The pack which contains the image.
+        key
+            Path of the image, relative to the notebook directory in the image cache.
+        """
+        entry = pack.index[key]
+        if entry["compression"] != self.compression:
+            self.add(key, pack.load_array(key))
+            return
+        if entry["pixel_digest"] not in self._blocks:
+            self._write_block(entry["pixel_digest"], pack._mmap[entry["offset"]:entry["offset"] + entry["length"]])
+        self._add_entry(key, entry["shape"], entry["pixel_digest"])
+
+    def close(self) -> None:
+        """Write the index, and replace the pack with the temporary file."""
+        index_bytes = json.dumps(self._index, sort_keys=True).encode()
+        index_offset = self._file.tell()
+        self._file.write(index_bytes)
+        self._file.seek(0)
+        self._file.write(_header.pack(_magic, index_offset, len(index_bytes)))
+        self._file.close()
+        os.replace(self.path + ".tmp", self.path)
+
+    def _write_block(self, image_digest: str, block: bytes) -> None:
+        """Write the block of an image, aligned in the file."""
+        self._file.write(b"\0" * (-self._file.tell() % _alignment))
+        self._blocks[image_digest] = (self._file.tell(), len(block))
+        self._file.write(block)
+
+    def _add_entry(self, key: str, shape: list[int], image_digest: str) -> None:
+        """Add the entry of an image to the index, pointing to the block already written for its pixels."""
+        offset, length = self._blocks[image_digest]
+        self._index[key] = {
+            "offset": offset,
+            "length": length,
+            "shape": shape,
+            "compression": self.compression,
+            "pixel_digest": image_digest
+        }
+
+
+def write_pack(images: dict[str, npt.NDArray[np.uint8]], path: str, compression: str = "zlib") -> None:
+    """
+    Write a pack of images.
+
+    Parameters
+    ----------
+    images
+        Dictionary from the path of each image, relative to the notebook directory in the image cache,
+        to its content stored as a uint8 array of shape (height, width, 3).
+    path
+        Path to the pack.
+    compression
+        Either "raw", to store pixels uncompressed and read them without any copy, or "zlib", to compress them.
+    """
+    with _PackWriter(path, compression) as writer:
+        for key in sorted(images):
+            writer.add(key, images[key])
+
+
+def pack_directory(notebook_dir: str, compression: str = "zlib", remove: bool = False) -> str:
+    """
+    Convert the images of a notebook directory in the image cache to a pack stored next to the directory.
+
+    If the pack already exists, its images are preserved unless the directory contains a newer version of them,
+    so that images added to the directory layout when refreshing the image cache can be folded into the pack.
+    Images are decoded and written to the pack one at a time, so that memory usage does not grow with the number
+    of images.
+
+    Parameters
+    ----------
+    notebook_dir
+        Directory in the image cache associated to a notebook.
+    compression
+        Either "raw", to store pixels uncompressed and read them without any copy, or "zlib", to compress them.
+    remove
+        If True, remove the directory after the pack has been written.
+
+    Returns
+    -------
+    :
+        The path to the pack.
+    """
+    notebook_dir = os.path.normpath(notebook_dir)
+    pack_path = notebook_dir + pack_suffix
+    image_paths = dict()
+    for (dirpath, _, filenames) in os.walk(notebook_dir):
+        for filename in filenames:
+            # References to identical images are stored as copies, which then share the same block
+            filename = filename.removesuffix(image_cache_tester.image_dedup.reference_suffix)
+            if filename.endswith(".png"):
+                image_path = os.path.join(dirpath, filename)
+                image_paths[os.path.relpath(image_path, notebook_dir).replace(os.sep, "/")] = image_path
+    with _PackWriter(pack_path, compression) as writer:
+        if os.path.exists(pack_path):
+            with ImagePack(pack_path) as pack:
+                for key in sorted(pack.index):
+                    if key not in image_paths:
+                        writer.copy(pack, key)
+        for key in sorted(image_paths):
+            with PIL.Image.open(image_cache_tester.image_dedup.resolve(image_paths[key])) as image:
+                writer.add(key, np.asarray(image.convert("RGB")))
+    if remove:
+        shutil.rmtree(notebook_dir, ignore_errors=True)
+    return pack_path
+
+
+def unpack_directory(pack_path: str, remove: bool = False) -> str:
+    """
+    Convert a pack to a notebook directory in the image cache, stored next to the pack.
+
+    Parameters
+    ----------
+    pack_path
+        Path to the pack.
+    remove
+        If True, remove the pack after the directory has been written.
+
+    Returns
+    -------
+    :
+        The directory in the image cache associated to the notebook.
+    """
+    assert pack_path.endswith(pack_suffix)
+    notebook_dir = pack_path[:-len(pack_suffix)]
+    with ImagePack(pack_path) as pack:
+        for key in pack.index:
+            image_path = os.path.join(notebook_dir, *key.split("/"))
+            os.makedirs(os.path.dirname(image_path), exist_ok=True)
+            PIL.Image.fromarray(pack.load_array(key)).save(image_path)
+    if remove:
+        os.remove(pack_path)
+    return notebook_dir
+
+
+def pack_image_cache(cache_dir: str, compression: str = "zlib", remove: bool = False) -> list[str]:
+    """
+    Convert every notebook directory of an image cache to a pack.
+
+    Parameters
+    ----------
+    cache_dir
+        The image cache directory.
+    compression
+        Either "raw", to store pixels uncompressed and read them without any copy, or "zlib", to compress them.
+    remove
+        If True, remove each notebook directory after its pack has been written.
+
+    Returns
+    -------
+    :
+        The paths to the packs.
+    """
+    return [
+        pack_directory(os.path.join(cache_dir, entry), compression, remove) for entry in sorted(os.listdir(cache_dir))
+        if os.path.isdir(os.path.join(cache_dir, entry))]
+
+
+def unpack_image_cache(cache_dir: str, remove: bool = False) -> list[str]:
+    """
+    Convert every pack of an image cache to a notebook directory.
+
+    Parameters
+    ----------
+    cache_dir
+        The image cache directory.
+    remove
+        If True, remove each pack after its notebook directory has been written.
+
+    Returns
+    -------
+    :
+        The notebook directories.
+    """
+    return [
+        unpack_directory(os.path.join(cache_dir, entry), remove) for entry in sorted(os.listdir(cache_dir))
+        if entry.endswith(pack_suffix)]
+
+
+def list_packed_images(cache_dir: str) -> set[str]:
+    """Return the paths of all images stored in the packs of an image cache, relative to the image cache."""
+    images: set[str] = set()
+    for entry in os.listdir(cache_dir):
+        if entry.endswith(pack_suffix):
+            pack = open_pack(os.path.join(cache_dir, entry))
+            assert pack is not None
+            images.update(os.path.join(entry[:-len(pack_suffix)], *key.split("/")) for key in pack.index)
+    return images
+
+
+def locate(image_path: str) -> tuple[str, str] | None:
+    """
+    Locate the pack which may contain an image of the image cache.
+
+    Parameters
+    ----------
+    image_path
+        Path to the image, following the directory layout of the image cache.
+
+    Returns
+    -------
+    :
+        A pair containing the path to the pack and the key of the image in the pack, or None if the path
+        does not belong to the image cache.
+    """
+    parts = os.path.normpath(image_path).split(os.sep)
+    if ".image_cache" not in parts:
+        return None
+    cache_index = len(parts) - 1 - parts[::-1].index(".image_cache")
+    if cache_index + 2 >= len(parts):
+        return None
+    pack_path = os.sep.join(parts[:cache_index + 2]) + pack_suffix
+    return pack_path, "/".join(parts[cache_index + 2:])
+
+
+def open_pack(pack_path: str) -> ImagePack | None:
+    """Open a pack, reusing a previously opened one if the file has not changed since then."""
+    try:
+        pack_mtime_ns = os.stat(pack_path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if pack_path not in _packs or _packs[pack_path][0] != pack_mtime_ns:
+        # Close the memory map of the previous version of the pack, unless arrays still reference it, in which
+        # case it is closed once they are garbage collected
+        if pack_path in _packs:
+            try:
+                _packs[pack_path][1].close()
+            except BufferError:
+                pass
+        _packs[pack_path] = (pack_mtime_ns, ImagePack(pack_path))
+    return _packs[pack_path][1]
+
+
+def find(image_path: str) -> tuple[ImagePack, str] | None:
+    """Return the pack containing an image of the image cache and its key, or None if no pack contains it."""
+    location = locate(image_path)
+    if location is None:
+        return None
+    pack_path, key = location
+    pack = open_pack(pack_path)
+    if pack is None or key not in pack:
+        return None
+    return pack, key
+
+
+def exists(image_path: str) -> bool:
+    """Return whether an image of the image cache exists, either on disk, as a reference or in a pack."""
+    return (
+        os.path.exists(image_path) or os.path.exists(image_path + image_cache_tester.image_dedup.reference_suffix)
+        or find(image_path) is not None)
@@ -0,0 +1,333 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Multi-resolution pyramids of tiles, to reject differing images early and compare images tile by tile."""
+
+import dataclasses
+import math
+import os
+import typing
+
+import numpy as np
+import numpy.typing as npt
+
+import image_cache_tester.compare_arrays
+import image_cache_tester.image_cache_manifest
+
+pyramid_suffix = ".pyramid.npz"
+
+
+@dataclasses.dataclass(frozen=True)
+class ImagePyramid:
+    """
+    Sums of the pixels of an image over tiles, at multiple resolutions.
+
+    Parameters
+    ----------
+    tile_size
+        Width and height of the tiles of the finest level. Tiles on the right and bottom borders may be smaller.
+    shape
+        Shape (height, width, channels) of the image.
+    levels
+        Sums of each channel over each tile, stored as int64 arrays of shape (tile rows, tile columns, channels).
+        The first level contains sums over tiles of tile_size x tile_size pixels, and each following level
+        merges 2 x 2 tiles of the previous one, until a single tile is left.
+    """
+
+    tile_size: int
+    shape: tuple[int, ...]
+    levels: tuple[npt.NDArray[np.int64], ...]
+
+    def tile_extent(self, level: int) -> int:
+        """Return the width and height of the tiles of a level."""
+        return self.tile_size * (1 << level)
+
+    def pixel_counts(self, level: int) -> npt.NDArray[np.int64]:
+        """Return the number of pixels of each tile of a level, as an array of shape (tile rows, tile columns)."""
+        extent = self.tile_extent(level)
+        heights = np.diff(np.append(np.arange(0, self.shape[0], extent), self.shape[0]))
+        widths = np.diff(np.append(np.arange(0, self.shape[1], extent), self.shape[1]))
+        return np.outer(heights, widths).astype(np.int64)
+
+
+@dataclasses.dataclass(frozen=True)
+class TileStatistics:
+    """
+    Statistics of the comparison of a tile.
+
+    Parameters
+    ----------
+    box
+        The tile, as a box (left, upper, right, lower) in pixel coordinates.
+    differing_pixels
+        Number of differing pixels in the tile.
+    squared_error
+        Sum of squared errors over all channels of the tile.
+    exact
+        Whether the statistics were computed at full resolution. Otherwise, they are lower bounds estimated
+        from a level of the pyramids.
+    """
+
+    box: tuple[int, int, int, int]
+    differing_pixels: int
+    squared_error: float
+    exact: bool
+
+
+def build_pyramid(image_array: npt.NDArray[np.uint8], tile_size: int = 64) -> ImagePyramid:
+    """
+    Build the pyramid of an image.
+
+    Parameters
+    ----------
+    image_array
+        The image content, stored as a uint8 array of shape (height, width, channels).
+    tile_size
+        Width and height of the tiles of the finest level.
+
+    Returns
+    -------
+    :
+        The pyramid of the image.
+    """
+    assert image_array.ndim == 3 and image_array.shape[0] > 0 and image_array.shape[1] > 0
+    height, width, channels = image_array.shape
+    # Sum bands of rows first, since they are contiguous in memory. A tile of uint8 values cannot overflow
+    # a uint32 accumulator, which is faster than an int64 one.
+    row_sums = _band_sums(
+        np.ascontiguousarray(image_array).reshape(height, width * channels), tile_size, np.uint32)
+    level = _band_sums(row_sums.reshape(-1, width, channels).swapaxes(0, 1), tile_size, np.int64).swapaxes(0, 1)
+    levels = [level]
+    while level.shape[0] > 1 or level.shape[1] > 1:
+        level = _band_sums(_band_sums(level, 2, np.int64).swapaxes(0, 1), 2, np.int64).swapaxes(0, 1)
+        levels.append(level)
+    return ImagePyramid(tile_size, tuple(image_array.shape), tuple(levels))
+
+
+def pyramid_path(image_path: str) -> str:
+    """Return the path of the pyramid stored next to an image of the image cache."""
+    assert image_path.endswith(".png")
+    return image_path[:-len(".png")] + pyramid_suffix
+
+
+def save_pyramid(image_path: str, image_array: npt.NDArray[np.uint8], tile_size: int = 64) -> None:
+    """
+    Precompute the pyramid of an image of the image cache, and store it next to the image.
+
+    Parameters
+    ----------
+    image_path
+        Path to the image in the cache.
+    image_array
+        The pixels stored in the image.
+    tile_size
+        Width and height of the tiles of the finest level.
+    """
+    pyramid = build_pyramid(image_array, tile_size)
+    arrays: dict[str, typing.Any] = {
+        "tile_size": tile_size,
+        "shape": np.array(pyramid.shape),
+        "pixel_digest": image_cache_tester.image_cache_manifest.pixel_digest(image_array)
+    }
+    arrays.update({f"level_{index}": level for (index, level) in enumerate(pyramid.levels)})
+    path = pyramid_path(image_path)
+    with open(path + ".tmp", "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(path + ".tmp", path)
+
+
+def load_pyramid(image_path: str, pixel_digest: str, tile_size: int = 64) -> ImagePyramid | None:
+    """
+    Load the precomputed pyramid of an image of the image cache.
+
+    Parameters
+    ----------
+    image_path
+        Path to the image in the cache.
+    pixel_digest
+        The pixel digest of the image, which is used to discard outdated pyramids.
+    tile_size
+        Width and height of the tiles of the finest level.
+
+    Returns
+    -------
+    :
+        The pyramid of the image, or None if no up to date pyramid with the requested tile size is stored
+        next to the image.
+    """
+    try:
+        with np.load(pyramid_path(image_path)) as data:
+            if int(data["tile_size"]) != tile_size or str(data["pixel_digest"]) != pixel_digest:
+                return None
+            num_levels = sum(1 for key in data.files if key.startswith("level_"))
+            return ImagePyramid(
+                tile_size, tuple(int(extent) for extent in data["shape"]),
+                tuple(data[f"level_{index}"] for index in range(num_levels)))
+    except FileNotFoundError:
+        return None
+
+
+def reject(
+    actual_pyramid: ImagePyramid, expected_pyramid: ImagePyramid,
+    tolerances: image_cache_tester.compare_arrays.Tolerances = image_cache_tester.compare_arrays.Tolerances()
+) -> tuple[image_cache_tester.compare_arrays.ComparisonMetrics, list[TileStatistics]] | None:
+    """
+    Reject two images whose pyramids prove that they do not satisfy the tolerances.
+
+    Levels are visited from the coarsest to the finest. On each tile, the difference between the mean values
+    of a channel provides a lower bound on the sum of squared errors, since the mean of the squares is not
+    smaller than the square of the mean, and on the number of differing pixels, since each pixel can contribute
+    at most 255 to the sum of absolute differences.
+
+    Parameters
+    ----------
+    actual_pyramid
+        The pyramid of the image content from the current evaluation of the code.
+    expected_pyramid
+        The pyramid of the reference image content.
+    tolerances
+        The tolerances allowed in the comparison.
+
+    Returns
+    -------
+    :
+        If the lower bounds exceed the tolerances on a level, a pair containing the metrics, computed from
+        the lower bounds, and the statistics of the tiles of the finest level with a positive lower bound.
+        Bounds on finer levels are never looser than the ones on coarser levels, hence the finest level
+        is used for reporting. Otherwise, None.
+    """
+    assert actual_pyramid.shape == expected_pyramid.shape
+    assert actual_pyramid.tile_size == expected_pyramid.tile_size
+    num_pixels = actual_pyramid.shape[0] * actual_pyramid.shape[1]
+    num_values = num_pixels * math.prod(actual_pyramid.shape[2:])
+    max_differing_pixels = tolerances.max_differing_pixels(num_pixels)
+    max_squared_error = tolerances.max_squared_error(num_values)
+    for level in reversed(range(len(actual_pyramid.levels))):
+        differing_pixels, squared_error = _lower_bounds(
+            actual_pyramid, expected_pyramid, level, tolerances.channel_threshold)
+        total_differing_pixels = int(differing_pixels.sum())
+        total_squared_error = float(squared_error.sum())
+        if total_differing_pixels > max_differing_pixels or total_squared_error > max_squared_error:
+            if level > 0:
+                differing_pixels, squared_error = _lower_bounds(
+                    actual_pyramid, expected_pyramid, 0, tolerances.channel_threshold)
+                total_differing_pixels = int(differing_pixels.sum())
+                total_squared_error = float(squared_error.sum())
+            tiles = [
+                TileStatistics(
+                    _tile_box(actual_pyramid.shape, actual_pyramid.tile_size, row, column),
+                    int(differing_pixels[row, column]), float(squared_error[row, column]), False)
+                for (row, column) in zip(*np.nonzero(squared_error > 0))]
+            metrics = image_cache_tester.compare_arrays.make_metrics(
+                total_differing_pixels, total_squared_error, num_pixels, num_values, tolerances, False)
+            return metrics, tiles
+    return None
+
+
+def compare_pyramids(
+    actual_array: npt.NDArray[np.uint8], expected_array: npt.NDArray[np.uint8],
+    tolerances: image_cache_tester.compare_arrays.Tolerances = image_cache_tester.compare_arrays.Tolerances(),
+    tile_size: int = 64, actual_pyramid: ImagePyramid | None = None, expected_pyramid: ImagePyramid | None = None
+) -> tuple[image_cache_tester.compare_arrays.ComparisonMetrics, list[TileStatistics]]:
+    """
+    Compare two images stored as uint8 arrays of shape (height, width, channels) tile by tile.
+
+    The images are first rejected through their pyramids, if possible. Otherwise, tiles whose sums differ are
+    compared first at full resolution, so that the comparison exits as soon as the tolerances are exceeded,
+    and the remaining tiles are only checked for equality. The cost of computing errors hence scales
+    with the size of the differing area.
+
+    Parameters
+    ----------
+    actual_array
+        The image content from the current evaluation of the code.
+    expected_array
+        The reference image content.
+    tolerances
+        The tolerances allowed in the comparison. If not provided, the images are required to be identical.
+    tile_size
+        Width and height of the tiles.
+    actual_pyramid, expected_pyramid
+        The pyramids of the images, if already available.
+
+    Returns
+    -------
+    :
+        A pair containing the metrics resulting from the comparison and the statistics of the differing tiles.
+    """
+    assert actual_array.shape == expected_array.shape
+    if actual_pyramid is None:
+        actual_pyramid = build_pyramid(actual_array, tile_size)
+    if expected_pyramid is None:
+        expected_pyramid = build_pyramid(expected_array, tile_size)
+    rejection = reject(actual_pyramid, expected_pyramid, tolerances)
+    if rejection is not None:
+        return rejection
+    num_pixels = actual_array.shape[0] * actual_array.shape[1]
+    num_values = actual_array.size
+    max_differing_pixels = tolerances.max_differing_pixels(num_pixels)
+    max_squared_error = tolerances.max_squared_error(num_values)
+    # Visit tiles in decreasing order of the lower bound on their squared error, so that tiles which certainly
+    # differ come first
+    _, squared_error_bounds = _lower_bounds(actual_pyramid, expected_pyramid, 0, tolerances.channel_threshold)
+    order = np.argsort(-squared_error_bounds, axis=None, kind="stable")
+    differing_pixels = 0
+    squared_error = 0
+    tiles = []
+    complete = True
+    for (position, (row, column)) in enumerate(zip(*np.unravel_index(order, squared_error_bounds.shape))):
+        box = _tile_box(actual_array.shape, tile_size, row, column)
+        actual_tile = actual_array[box[1]:box[3], box[0]:box[2]]
+        expected_tile = expected_array[box[1]:box[3], box[0]:box[2]]
+        if np.array_equal(actual_tile, expected_tile):
+            continue
+        tile_differing_pixels, tile_squared_error = image_cache_tester.compare_arrays.block_errors(
+            actual_tile, expected_tile, tolerances.channel_threshold)
+        tiles.append(TileStatistics(box, tile_differing_pixels, tile_squared_error, True))
+        differing_pixels += tile_differing_pixels
+        squared_error += tile_squared_error
+        if differing_pixels > max_differing_pixels or squared_error > max_squared_error:
+            complete = position + 1 == order.size
+            break
+    metrics = image_cache_tester.compare_arrays.make_metrics(
+        differing_pixels, squared_error, num_pixels, num_values, tolerances, complete)
+    return metrics, tiles
+
+
+def _band_sums(
+    array: npt.NDArray[typing.Any], band: int, dtype: type[np.integer[typing.Any]]
+) -> npt.NDArray[typing.Any]:
+    """Sum bands of consecutive entries along the first axis, the last band being smaller if needed."""
+    full_bands = array.shape[0] // band
+    sums: npt.NDArray[typing.Any] = array[:full_bands * band].reshape(
+        full_bands, band, *array.shape[1:]).sum(axis=1, dtype=dtype)
+    if array.shape[0] % band > 0:
+        sums = np.concatenate([sums, array[full_bands * band:].sum(axis=0, dtype=dtype)[np.newaxis]])
+    return sums
+
+
+def _lower_bounds(
+    actual_pyramid: ImagePyramid, expected_pyramid: ImagePyramid, level: int, channel_threshold: int
+) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.float64]]:
+    """Compute lower bounds on the differing pixels and on the sum of squared errors of each tile of a level."""
+    pixel_counts = actual_pyramid.pixel_counts(level)
+    mean_differences = (
+        np.abs(actual_pyramid.levels[level] - expected_pyramid.levels[level]) / pixel_counts[..., np.newaxis])
+    squared_error = pixel_counts * np.square(mean_differences).sum(axis=2)
+    if channel_threshold < 255:
+        # A differing pixel contributes at most 255 to the sum of absolute differences of a channel, while any other
+        # pixel contributes at most the threshold. A small relative tolerance accounts for rounding.
+        differing_fraction = np.maximum(mean_differences.max(axis=2) - channel_threshold, 0) / (255 - channel_threshold)
+        differing_pixels = np.ceil(pixel_counts * differing_fraction * (1 - 1e-9)).astype(np.int64)
+    else:
+        differing_pixels = np.zeros_like(pixel_counts)
+    return differing_pixels, squared_error * (1 - 1e-9)
+
+
+def _tile_box(shape: tuple[int, ...], extent: int, row: int, column: int) -> tuple[int, int, int, int]:
+    """Return the box (left, upper, right, lower) of a tile."""
+    return (
+        int(column * extent), int(row * extent), int(min((column + 1) * extent, shape[1])),
+        int(min((row + 1) * extent, shape[0])))
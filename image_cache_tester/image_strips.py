@@ -0,0 +1,212 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Decode images in strips of rows, so that memory usage does not depend on the image size."""
+
+import collections.abc
+import io
+import struct
+import typing
+import zlib
+
+import numpy as np
+import numpy.typing as npt
+import PIL.Image
+
+_png_signature = b"\x89PNG\r\n\x1a\n"
+_png_channels = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+_read_size = 1 << 16
+
+# Estimate of the bytes used per pixel while comparing a strip: decoded rows of both images, possibly with
+# an alpha channel, their RGB conversion, the difference and the squared difference stored as uint32
+_bytes_per_pixel = 64
+
+
+def to_rgb(image: PIL.Image.Image) -> PIL.Image.Image:
+    """Convert an image to RGB format, without copying it if it already is in RGB format."""
+    return image if image.mode == "RGB" else image.convert("RGB")
+
+
+def rows_per_strip(width: int, memory_limit: int) -> int:
+    """
+    Return the number of rows of each strip, so that comparing strips of two images fits in a memory limit.
+
+    Parameters
+    ----------
+    width
+        Width of the images.
+    memory_limit
+        Maximum number of bytes to be used for comparing a strip.
+
+    Returns
+    -------
+    :
+        The number of rows of each strip, which is at least one.
+    """
+    return max(1, memory_limit // (max(width, 1) * _bytes_per_pixel))
+
+
+def iter_array_strips(
+    image_array: npt.NDArray[np.uint8], strip_rows: int
+) -> collections.abc.Iterator[npt.NDArray[np.uint8]]:
+    """Split an image already stored as an array in strips of rows, without copying it."""
+    for row_begin in range(0, image_array.shape[0], strip_rows):
+        yield image_array[row_begin:row_begin + strip_rows]
+
+
+def iter_file_strips(path: str, strip_rows: int) -> collections.abc.Iterator[npt.NDArray[np.uint8]]:
+    """
+    Decode an image file in strips of rows.
+
+    Non-interlaced PNG images with a bit depth of 8 are decompressed incrementally, and each strip is decoded
+    by PIL together with the last row of the previous strip, on which filters of the first row of the strip
+    depend. Any other image is decoded at once, and then split in strips.
+
+    Parameters
+    ----------
+    path
+        Path to the image.
+    strip_rows
+        Number of rows of each strip.
+
+    Returns
+    -------
+    :
+        A generator of strips, stored as uint8 arrays of shape (rows, width, 3) in RGB format.
+    """
+    with open(path, "rb") as f:
+        header = _read_png_header(f)
+        if header is not None:
+            yield from _iter_png_strips(f, *header, strip_rows)
+            return
+    with PIL.Image.open(path) as image:
+        image_array = np.asarray(to_rgb(image))
+    yield from iter_array_strips(image_array, strip_rows)
+
+
+def _read_png_header(
+    f: typing.BinaryIO
+) -> tuple[tuple[int, int, int], list[tuple[bytes, bytes]], int] | None:
+    """
+    Read the chunks of a PNG image preceding the image data.
+
+    Returns
+    -------
+    :
+        None if the file is not a PNG image which can be decoded in strips. Otherwise, a tuple containing
+        width, height and color type of the image, the chunks which are required to decode it, and the length
+        of the first chunk of image data. The file is positioned at the beginning of that chunk data.
+    """
+    if f.read(len(_png_signature)) != _png_signature:
+        return None
+    size = None
+    chunks = []
+    while True:
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            return None
+        length, chunk_type = struct.unpack(">I4s", chunk_header)
+        if chunk_type == b"IDAT":
+            break
+        if chunk_type == b"IHDR":
+            width, height, bit_depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", f.read(length))
+            if bit_depth != 8 or interlace != 0 or color_type not in _png_channels:
+                return None
+            size = (width, height, color_type)
+            f.seek(4, io.SEEK_CUR)
+        elif chunk_type in (b"PLTE", b"tRNS"):
+            chunks.append((chunk_type, f.read(length)))
+            f.seek(4, io.SEEK_CUR)
+        else:
+            f.seek(length + 4, io.SEEK_CUR)
+    if size is None:
+        return None
+    return size, chunks, length
+
+
+def _iter_png_strips(
+    f: typing.BinaryIO, size: tuple[int, int, int], chunks: list[tuple[bytes, bytes]], idat_length: int,
+    strip_rows: int
+) -> collections.abc.Iterator[npt.NDArray[np.uint8]]:
+    """Decompress the image data of a PNG image incrementally, and decode it in strips of rows."""
+    width, height, color_type = size
+    row_bytes = 1 + width * _png_channels[color_type]
+    strip_bytes = strip_rows * row_bytes
+    decompressor = zlib.decompressobj()
+    filtered_rows = bytearray()
+    # Rows preceding the first one are considered to be zero when unfiltering
+    previous_row = bytes(row_bytes - 1)
+    row_begin = 0
+    for compressed in _iter_idat(f, idat_length):
+        while len(compressed) > 0:
+            # Bound the size of the decompressed output, keeping the rest of the input for later
+            filtered_rows += decompressor.decompress(compressed, strip_bytes)
+            compressed = decompressor.unconsumed_tail
+            while len(filtered_rows) >= strip_bytes and row_begin < height:
+                strip, previous_row = _decode_png_rows(
+                    width, color_type, chunks, previous_row, filtered_rows[:strip_bytes])
+                del filtered_rows[:strip_bytes]
+                row_begin += strip.shape[0]
+                yield strip
+    filtered_rows += decompressor.flush()
+    while row_begin < height:
+        num_rows = min(strip_rows, height - row_begin)
+        strip, previous_row = _decode_png_rows(
+            width, color_type, chunks, previous_row, filtered_rows[:num_rows * row_bytes])
+        del filtered_rows[:num_rows * row_bytes]
+        row_begin += num_rows
+        yield strip
+
+
+def _iter_idat(f: typing.BinaryIO, idat_length: int) -> collections.abc.Iterator[bytes]:
+    """Read the data of consecutive image data chunks, in pieces of bounded size."""
+    length = idat_length
+    while True:
+        while length > 0:
+            piece = f.read(min(length, _read_size))
+            if len(piece) == 0:
+                raise RuntimeError("Truncated PNG image data")
+            length -= len(piece)
+            yield piece
+        f.seek(4, io.SEEK_CUR)
+        length, chunk_type = struct.unpack(">I4s", f.read(8))
+        if chunk_type != b"IDAT":
+            return
+
+
+def _decode_png_rows(
+    width: int, color_type: int, chunks: list[tuple[bytes, bytes]], previous_row: bytes,
+    filtered_rows: bytes | bytearray
+) -> tuple[npt.NDArray[np.uint8], bytes]:
+    """
+    Decode filtered rows of a PNG image.
+
+    The rows are decoded as a standalone PNG image, whose first row is the unfiltered previous row stored
+    without any filter. Image data is stored without compression, since it is immediately decoded again.
+
+    Returns
+    -------
+    :
+        A pair containing the decoded rows in RGB format, and the last of them before the conversion to RGB
+        format, which is required to decode the following rows.
+    """
+    num_rows = len(filtered_rows) // (len(previous_row) + 1)
+    image_data = zlib.compress(b"\0" + previous_row + filtered_rows, 0)
+    png = b"".join([
+        _png_signature,
+        _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, num_rows + 1, 8, color_type, 0, 0, 0)),
+        *(_png_chunk(chunk_type, data) for (chunk_type, data) in chunks),
+        _png_chunk(b"IDAT", image_data),
+        _png_chunk(b"IEND", b"")
+    ])
+    image = PIL.Image.open(io.BytesIO(png))
+    image.load()
+    last_row = np.asarray(image.crop((0, num_rows, width, num_rows + 1))).tobytes()
+    return np.asarray(to_rgb(image))[1:], last_row
+
+
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    """Encode a PNG chunk."""
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
@@ -0,0 +1,165 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Verify trees of screenshots produced by notebook tests against the image cache."""
+
+import dataclasses
+import os
+import typing
+
+import image_cache_tester.compare_arrays
+import image_cache_tester.compare_batch
+import image_cache_tester.image_dedup
+import image_cache_tester.image_masks
+import image_cache_tester.image_pack
+
+actual_tree_name = ".image_from_pytest"
+expected_tree_name = ".image_cache"
+
+
+@dataclasses.dataclass
+class TreeVerification:
+    """
+    Summary of the verification of a tree of screenshots against the image cache.
+
+    Parameters
+    ----------
+    actual_root
+        Root of the tree of screenshots.
+    expected_root
+        Root of the image cache.
+    passed
+        Relative paths of the screenshots that match the cached images.
+    differing
+        Comparison results of the screenshots that do not match the cached images.
+    missing
+        Relative paths of the screenshots without a corresponding cached image.
+    extra
+        Relative paths of the cached images without a corresponding screenshot, restricted to the directories
+        for which at least one screenshot is available.
+    """
+
+    actual_root: str
+    expected_root: str
+    passed: list[str] = dataclasses.field(default_factory=list)
+    differing: list[image_cache_tester.compare_batch.PairComparison] = dataclasses.field(default_factory=list)
+    missing: list[str] = dataclasses.field(default_factory=list)
+    extra: list[str] = dataclasses.field(default_factory=list)
+
+    @property
+    def successful(self) -> bool:
+        """Return whether all screenshots match a cached image."""
+        return len(self.differing) == 0 and len(self.missing) == 0
+
+    def to_json(self) -> dict[str, typing.Any]:
+        """Return a representation of the summary which can be serialized to JSON."""
+        return {
+            "actual_root": self.actual_root,
+            "expected_root": self.expected_root,
+            "passed": sorted(self.passed),
+            "differing": [
+                {
+                    "path": os.path.relpath(result.actual_image_path, self.actual_root),
+                    "error": result.error,
+                    "metrics": dataclasses.asdict(result.metrics) if result.metrics is not None else None,
+                    "tiles": [dataclasses.asdict(tile) for tile in result.tiles] if result.tiles is not None else None
+                } for result in sorted(self.differing, key=lambda result: result.actual_image_path)
+            ],
+            "missing": sorted(self.missing),
+            "extra": sorted(self.extra)
+        }
+
+
+def find_image_trees(root: str) -> list[tuple[str, str]]:
+    """
+    Find the trees of screenshots produced by notebook tests.
+
+    Parameters
+    ----------
+    root
+        Directory in which trees of screenshots are searched for, recursively.
+
+    Returns
+    -------
+    :
+        A list of pairs, containing the root of each tree of screenshots and the root of the image cache
+        stored in the same directory.
+    """
+    image_trees = []
+    for (dirpath, dirnames, _) in os.walk(root):
+        if actual_tree_name in dirnames:
+            image_trees.append(
+                (os.path.join(dirpath, actual_tree_name), os.path.join(dirpath, expected_tree_name)))
+        # Never descend in the trees of images, which do not contain further trees
+        dirnames[:] = sorted(
+            dirname for dirname in dirnames if dirname not in (actual_tree_name, expected_tree_name))
+    return image_trees
+
+
+def list_images(root: str) -> set[str]:
+    """
+    Return the relative paths of all images stored in a tree, including references and packed images.
+
+    Masks stored next to the images are not images on their own, and hence are not returned.
+    """
+    images = image_cache_tester.image_pack.list_packed_images(root)
+    for (dirpath, _, filenames) in os.walk(root, followlinks=True):
+        for filename in filenames:
+            filename = filename.removesuffix(image_cache_tester.image_dedup.reference_suffix)
+            if filename.endswith(".png"):
+                images.add(os.path.relpath(os.path.join(dirpath, filename), root))
+    return {image for image in images if not image_cache_tester.image_masks.is_mask(image)}
+
+
+def verify_image_tree(
+    actual_root: str, expected_root: str,
+    tolerances: image_cache_tester.compare_arrays.Tolerances = image_cache_tester.compare_arrays.Tolerances(),
+    max_workers: int | None = None, executor: str = "process", tile_size: int | None = None,
+    memory_limit: int | None = None
+) -> TreeVerification:
+    """
+    Verify a tree of screenshots against the image cache.
+
+    Parameters
+    ----------
+    actual_root
+        Root of the tree of screenshots.
+    expected_root
+        Root of the image cache.
+    tolerances
+        The tolerances allowed in each comparison. If not provided, the images are required to be identical.
+    max_workers
+        Number of workers. If not provided, it defaults to the number of available cores.
+    executor
+        Either "process", to compare images in a process pool, or "thread", to compare them in a thread pool.
+    tile_size
+        If provided, compare images tile by tile through multi-resolution pyramids of tiles of this size.
+    memory_limit
+        If provided, each worker compares images in strips of rows, using at most this number of bytes.
+
+    Returns
+    -------
+    :
+        The summary of the verification.
+    """
+    verification = TreeVerification(actual_root, expected_root)
+    actual_images = list_images(actual_root)
+    expected_images = list_images(expected_root) if os.path.isdir(expected_root) else set()
+    verification.missing = sorted(actual_images - expected_images)
+    actual_dirs = {os.path.dirname(image) for image in actual_images}
+    verification.extra = sorted(
+        image for image in expected_images - actual_images if os.path.dirname(image) in actual_dirs)
+    pairs = (
+        (os.path.join(actual_root, image), os.path.join(expected_root, image))
+        for image in sorted(actual_images & expected_images))
+    for result in image_cache_tester.compare_batch.compare_batch(
+        pairs, tolerances, max_workers, executor, use_digests=True, tile_size=tile_size,
+        memory_limit=memory_limit
+    ):
+        if result.passed:
+            verification.passed.append(os.path.relpath(result.actual_image_path, actual_root))
+        else:
+            verification.differing.append(result)
+    return verification
@@ -0,0 +1,132 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Fingerprints of the inputs of image verification, to skip notebooks which passed and are unchanged since."""
+
+import collections
+import collections.abc
+import hashlib
+import importlib.metadata
+import os
+
+# Environment variables which affect the images, e.g. since they select the pyvista backend or the scalar type
+# of the PETSc build
+_environment_variables = ("PETSC_ARCH", "PETSC_DIR", "VISKEX_PYVISTA_BACKEND", "VTK_DEFAULT_OPENGL_WINDOW")
+
+# Distributions whose version affects the images
+_distributions = ("fenics-dolfinx", "firedrake", "petsc4py", "pyvista", "viskex", "vtk")
+
+
+def environment_fingerprint() -> str:
+    """
+    Return a fingerprint of the environment in which notebooks are run.
+
+    The fingerprint is computed from environment variables and versions of installed distributions, rather than
+    by importing the plotting libraries, which would be slow.
+    """
+    environment = [f"{name}={os.environ.get(name)}" for name in _environment_variables]
+    for name in _distributions:
+        try:
+            environment.append(f"{name}=={importlib.metadata.version(name)}")
+        except importlib.metadata.PackageNotFoundError:
+            environment.append(f"{name} not installed")
+    return hashlib.sha256("\n".join(environment).encode()).hexdigest()
+
+
+def tree_fingerprint(paths: collections.abc.Iterable[str]) -> str:
+    """
+    Return a fingerprint of the files contained in a set of files and directories.
+
+    Files are identified by their path, size and modification time, so that large trees of images are
+    fingerprinted without reading them. Paths which do not exist do not contribute to the fingerprint.
+
+    Parameters
+    ----------
+    paths
+        The files and directories to be fingerprinted. Directories are visited recursively.
+
+    Returns
+    -------
+    :
+        A hex digest, which changes whenever a file is added, removed or modified.
+    """
+    fingerprint = hashlib.sha256()
+    for path in paths:
+        files = [path] if os.path.isfile(path) else sorted(
+            os.path.join(dirpath, filename) for (dirpath, _, filenames) in os.walk(path) for filename in filenames)
+        for file_path in files:
+            stat = os.stat(file_path)
+            fingerprint.update(f"{file_path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return fingerprint.hexdigest()
+
+
+class IncrementalVerification:
+    """
+    Tracker of the notebooks which passed image verification, to skip them while their inputs are unchanged.
+
+    Parameters
+    ----------
+    records
+        Dictionary from each notebook to the fingerprint of its inputs at the end of the last session in which
+        all its cells passed.
+    """
+
+    def __init__(self, records: dict[str, str]) -> None:
+        self.records = records
+        self.sources: dict[str, str] = dict()
+        self._collected: collections.Counter[str] = collections.Counter()
+        self._passed: collections.Counter[str] = collections.Counter()
+        self._failed: set[str] = set()
+
+    def is_unchanged(self, notebook: str, fingerprint: str) -> bool:
+        """Return whether a notebook passed verification with inputs having the same fingerprint."""
+        return self.records.get(notebook) == fingerprint
+
+    def collect(self, notebook: str) -> None:
+        """Record that a cell of a notebook was collected."""
+        self._collected[notebook] += 1
+
+    def report(self, notebook: str, when: str, outcome: str) -> None:
+        """
+        Record the outcome of a phase of the test of a cell of a notebook.
+
+        Parameters
+        ----------
+        notebook
+            The notebook which contains the cell.
+        when
+            The phase of the test, i.e. setup, call or teardown.
+        outcome
+            Either passed, failed or skipped.
+        """
+        if outcome == "failed":
+            self._failed.add(notebook)
+        elif outcome == "passed" and when == "call":
+            self._passed[notebook] += 1
+
+    def update(self, fingerprints: dict[str, str]) -> dict[str, str]:
+        """
+        Update the records with the notebooks run in the current session.
+
+        A notebook is recorded only if all its collected cells were run and passed, so that notebooks which
+        were only partially run, e.g. because of a selection of cells, are run again in the next session.
+        The records of notebooks which failed are removed.
+
+        Parameters
+        ----------
+        fingerprints
+            Dictionary from each notebook run in the current session to the fingerprint of its inputs.
+
+        Returns
+        -------
+        :
+            The updated records.
+        """
+        for (notebook, fingerprint) in fingerprints.items():
+            if notebook in self._failed:
+                self.records.pop(notebook, None)
+            elif self._collected[notebook] > 0 and self._passed[notebook] == self._collected[notebook]:
+                self.records[notebook] = fingerprint
+        return self.records
@@ -0,0 +1,116 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Concurrent execution of notebooks on pytest-xdist workers, within a budget of cores."""
+
+import fcntl
+import os
+import types
+import typing
+
+
+def available_cores() -> int:
+    """Return the number of cores which the current process is allowed to run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    else:  # pragma: no cover
+        return os.cpu_count() or 1
+
+
+def num_workers(np: int, num_cores: int | None = None) -> int:
+    """
+    Return the number of notebooks which can run concurrently without oversubscribing the cores.
+
+    Parameters
+    ----------
+    np
+        Number of cores used by each notebook, i.e. the number of ipyparallel engines it starts.
+    num_cores
+        Number of cores available. If not provided, the cores which the current process is allowed to run on.
+
+    Returns
+    -------
+    :
+        The number of workers, which is at least one.
+    """
+    if num_cores is None:
+        num_cores = available_cores()
+    return max(1, num_cores // np)
+
+
+def distribution_mode(dist: str) -> str:
+    """
+    Return the pytest-xdist distribution mode to be used for notebooks.
+
+    The cells of a notebook share the same kernel, hence they must all run on the same worker. Modes which
+    distribute whole files are used unchanged, while the default load mode is replaced by the loadfile one.
+    The loadgroup mode is replaced as well, since cells carry no group marker.
+
+    Parameters
+    ----------
+    dist
+        The distribution mode requested on the command line, or no if pytest-xdist is not in use.
+
+    Returns
+    -------
+    :
+        Either no or a mode which runs all cells of a notebook on the same worker.
+    """
+    if dist in ("no", "loadfile", "loadscope"):
+        return dist
+    elif dist in ("load", "loadgroup"):
+        return "loadfile"
+    else:
+        raise ValueError(
+            f"Invalid distribution mode {dist}: the cells of a notebook must all run on the same worker, "
+            "please use either loadfile or loadscope")
+
+
+class FileLock:
+    """
+    Exclusive lock shared between processes, based on an advisory lock on a file.
+
+    The lock is released automatically if the process which holds it terminates.
+
+    Parameters
+    ----------
+    path
+        Path of the lock file, which is created if it does not exist.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._fd: int | None = None
+
+    @property
+    def locked(self) -> bool:
+        """Return whether the lock is held by this object."""
+        return self._fd is not None
+
+    def acquire(self) -> None:
+        """Acquire the lock, waiting until it is released by any other process."""
+        assert self._fd is None, "The lock is already held"
+        fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        self._fd = fd
+
+    def release(self) -> None:
+        """Release the lock, if held."""
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> typing.Self:
+        """Acquire the lock on entering the context."""
+        self.acquire()
+        return self
+
+    def __exit__(
+        self, exception_type: type[BaseException] | None, exception_value: BaseException | None,
+        traceback: types.TracebackType | None
+    ) -> None:
+        """Release the lock on exiting the context."""
+        self.release()
@@ -5,16 +5,40 @@
 # SPDX-License-Identifier: MIT
 """Utility functions to be used in pytest configuration file for notebooks tests."""
 
-import fnmatch
+import concurrent.futures
+import hashlib
+import importlib.metadata
+import json
+import os
 import pathlib
+import shutil
+import typing
 
 import nbformat
 import nbvalx.pytest_hooks_notebooks
 import pytest
 
+import image_cache_tester.incremental
+import image_cache_tester.parallel_notebooks
+import image_cache_tester.timings
+
 collect_file = nbvalx.pytest_hooks_notebooks.collect_file
 IPyNbFile = nbvalx.pytest_hooks_notebooks.IPyNbFile
 
+# Directories which never contain notebooks to be instrumented
+_pruned_dirs = {
+    ".git", ".image_cache", ".image_from_pytest", ".image_timings", ".ipynb_checkpoints", ".pytest_cache",
+    ".virtual_documents", "__pycache__"}
+
+# Notebooks whose timings are reported at the end of the session
+_timings_notebooks_key = pytest.StashKey[list[pathlib.Path]]()
+
+# Tracker of the notebooks which passed image verification, if incremental verification was requested
+_incremental_key = pytest.StashKey[image_cache_tester.incremental.IncrementalVerification]()
+
+# Key of the records of incremental verification in the pytest cache
+_incremental_cache_key = "image_cache_tester/incremental_verification"
+
 
 def addoption(parser: pytest.Parser, pluginmanager: pytest.PytestPluginManager) -> None:
     """Add options to control verification of images from cache."""
@@ -23,6 +47,58 @@ def addoption(parser: pytest.Parser, pluginmanager: pytest.PytestPluginManager)
     # Add options to control image verification
     parser.addoption("--verify-images", action="store_true", help="Verify images against image cache")
     parser.addoption("--refresh-image-cache", action="store_true", help="Refresh images in cache")
+    parser.addoption(
+        "--save-screenshots", action="store_true", help=(
+            "Save every screenshot to .image_from_pytest, rather than only the ones which fail verification, "
+            "so that they can be verified again with image-cache-tester verify"))
+    parser.addoption(
+        "--image-rank-summary", action="store_true", help=(
+            "In notebooks using ipyparallel, compare images locally on each rank without displaying them, "
+            "and display a summary of all ranks with thumbnails of failures in the final cell"))
+    parser.addoption(
+        "--deduplicate-image-cache", action="store_true", help=(
+            "When refreshing the image cache in notebooks using ipyparallel, replace images which are identical "
+            "to the one of a lower rank with a reference to it"))
+    parser.addoption(
+        "--image-display", choices=["full", "thumbnails", "composite"], default="full", help=(
+            "How to display the actual, expected and difference images in the notebook: at full resolution, "
+            "as separate thumbnails, or as a single composite thumbnail. Thumbnails bound the size of the "
+            "notebook outputs independently of the size of the screenshots"))
+    parser.addoption(
+        "--hide-passed-images", action="store_true",
+        help="Do not display the screenshot in the notebook if the image verification passed")
+    parser.addoption(
+        "--image-thumbnail-size", type=int, default=128, help=(
+            "Maximum width and height of the thumbnails displayed in the notebook and in the summary of all ranks"))
+    parser.addoption(
+        "--image-tile-size", type=int, default=None, help=(
+            "Compare images tile by tile through multi-resolution pyramids of tiles of this size. Pyramids are "
+            "stored next to the cached images when refreshing the image cache, so that grossly different images "
+            "are rejected without decoding the cached ones"))
+    parser.addoption(
+        "--incremental-images", action="store_true", help=(
+            "Skip notebooks whose source, image cache, environment and options are unchanged since the last "
+            "session in which all their cells passed. Records are stored in the pytest cache"))
+    parser.addoption(
+        "--image-timings", action="store_true", help=(
+            "Record the time spent in each phase of image verification, aggregated by notebook and cell, "
+            "and report it in the terminal summary"))
+    parser.addoption(
+        "--image-timings-json", type=str, default=None, help=(
+            "Record the time spent in each phase of image verification, and write it to the given JSON file"))
+    # Add options to control tolerances in image verification
+    parser.addoption(
+        "--image-channel-threshold", type=int, default=0,
+        help="Absolute difference above which a pixel channel is considered as differing")
+    parser.addoption(
+        "--image-max-differing-fraction", type=float, default=0.0,
+        help="Maximum fraction of differing pixels allowed in image verification")
+    parser.addoption(
+        "--image-max-rmse", type=float, default=None,
+        help="Maximum root mean square error allowed in image verification")
+    parser.addoption(
+        "--image-min-psnr", type=float, default=None,
+        help="Minimum peak signal-to-noise ratio (in decibel) allowed in image verification")
 
 
 def sessionstart(session: pytest.Session) -> None:
@@ -33,61 +109,151 @@ def sessionstart(session: pytest.Session) -> None:
         session.config.option.verify_images = True
     verify_images = session.config.option.verify_images
     np = session.config.option.np
+    timings = session.config.option.image_timings or session.config.option.image_timings_json is not None
+    tolerances = (
+        "image_cache_tester.compare_arrays.Tolerances("
+        f"channel_threshold={session.config.option.image_channel_threshold!r}, "
+        f"max_differing_fraction={session.config.option.image_max_differing_fraction!r}, "
+        f"max_rmse={session.config.option.image_max_rmse!r}, "
+        f"min_psnr={session.config.option.image_min_psnr!r})")
     # Add image cache to data to be linked if image verification options are requested
     if verify_images:
         link_data_in_work_dir = session.config.option.link_data_in_work_dir
         if "**/.image_cache" not in link_data_in_work_dir:
             link_data_in_work_dir.append("**/.image_cache")
-    # Start session as in nbvalx
-    nbvalx.pytest_hooks_notebooks.sessionstart(session)
-    # Proceed with the rest only if image verification was requested
-    if not verify_images:  # pragma: no cover
-        return
-    # pathlib.PurePath.full_match is only available in python 3.13+. In the meantime,
-    # implement the comparison using fnmatch
-    def full_match(path: pathlib.Path, pattern: str) -> bool:
-        """Backport of pathlib.PurePath.full_match."""
-        return fnmatch.fnmatch(str(path), pattern)
-    # Get all notebooks in the work directory
-    calling_dirs = session.config.args
-    assert len(calling_dirs) == 1
-    calling_dir = pathlib.Path(calling_dirs[0])
-    notebooks = dict()
-    for dir_entry in calling_dir.rglob("*"):
-        if dir_entry.is_file():
-            if full_match(dir_entry, f"**/{session.config.option.work_dir}/*.ipynb"):
-                assert not full_match(dir_entry, "**/*.log.ipynb")
-                with open(dir_entry) as f:
-                    notebooks[dir_entry] = nbformat.read(f, as_version=4)  # type: ignore[no-untyped-call]
-    # Update notebook with image verification
-    for (nb_path, nb) in notebooks.items():
-        # Add a cell on top for computation of expected and actual image paths
-        image_paths_code = f'''import os
-import shutil
-import time
+    # Each pytest-xdist worker prepares the notebooks in the work directory again, and nbvalx removes and rewrites
+    # them while doing so: the lock is hence held until the current process has collected them, otherwise a worker
+    # could collect a notebook which another one is rewriting. The lock is released by a plugin registered here,
+    # so that the release does not depend on which hooks are wired in the conftest, or immediately by the
+    # pytest-xdist controller, which collects nothing.
+    session.config.option.dist = image_cache_tester.parallel_notebooks.distribution_mode(
+        getattr(session.config.option, "dist", "no"))
+    work_dir_lock = image_cache_tester.parallel_notebooks.FileLock(_lock_path(session.config, "work_dir"))
+    work_dir_lock.acquire()
+    try:
+        # Start session as in nbvalx
+        nbvalx.pytest_hooks_notebooks.sessionstart(session)
+        # Proceed with the rest only if image verification was requested
+        if verify_images:
+            _instrument_notebooks(session, np, refresh_image_cache, timings, tolerances)
+    finally:
+        if session.config.pluginmanager.has_plugin("dsession"):
+            work_dir_lock.release()
+        else:
+            session.config.pluginmanager.register(_WorkDirLockRelease(work_dir_lock))
+
+
+class _WorkDirLockRelease:
+    """Release the lock on the work directory once the notebooks have been collected."""
 
-import IPython.display
-import mpi4py.MPI
-import numpy as np
-import pyvista
+    def __init__(self, lock: image_cache_tester.parallel_notebooks.FileLock) -> None:
+        self._lock = lock
 
-import viskex.utils.dtype
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_collection_modifyitems(self) -> None:
+        """Release the lock, since the notebooks have been collected."""
+        self._lock.release()
 
-import image_cache_tester.compare_images  # isort: skip
+    def pytest_sessionfinish(self) -> None:
+        """Release the lock, in case collection was interrupted."""
+        self._lock.release()
 
-# Check that the pyvista jupyter backend is compatible with cache generation. Note that this
-# cannot be done in the sessionstart code because that would force an import of viskex
-# in the pytest hooks themselevs, rather than in the notebook.
-pyvista_jupyter_backend = pyvista.global_theme.jupyter_backend
-if pyvista_jupyter_backend not in ("html", "static"):
-    raise RuntimeError(
-        "Invalid pyvista jupyter backend: got " + pyvista_jupyter_backend + ", "
-        "expected either html or static. "
-        "Please set the environment variable VISKEX_PYVISTA_BACKEND.")
+
+def _instrument_notebooks(
+    session: pytest.Session, np: int, refresh_image_cache: bool, timings: bool, tolerances: str
+) -> None:
+    """Add image verification to the notebooks in the work directory."""
+    # Get all notebooks in the work directory of each collection path, dropping duplicates in case
+    # collection paths are nested
+    notebooks = list(dict.fromkeys(
+        nb_path for calling_dir in session.config.args
+        for nb_path in _find_work_dir_notebooks(pathlib.Path(calling_dir), session.config.option.work_dir)))
+    # Remove timings of previous sessions, so that only the notebooks which are run in this session are reported
+    if timings:
+        for nb_path in notebooks:
+            shutil.rmtree(_timings_dir(nb_path), ignore_errors=True)
+        session.config.stash[_timings_notebooks_key] = notebooks
+    # Instrumented notebooks are cached, with a key depending on the notebook content and path, on the
+    # implementation of these hooks and on the options which affect the instrumentation
+    instrumentation_cache_dir = _instrumentation_cache_dir(session)
+    instrumentation_options = "\n".join([
+        importlib.metadata.version("image_cache_tester"), _hooks_digest(), str(np), str(refresh_image_cache),
+        str(session.config.option.save_screenshots), str(session.config.option.image_rank_summary),
+        str(session.config.option.deduplicate_image_cache),
+        session.config.option.image_display, str(session.config.option.hide_passed_images),
+        str(session.config.option.image_thumbnail_size), str(session.config.option.image_tile_size), str(timings),
+        tolerances])
+    # Track which notebooks pass, so that they are skipped in the next sessions while their inputs are unchanged
+    cache = getattr(session.config, "cache", None)
+    incremental = None
+    if session.config.option.incremental_images and cache is not None:
+        incremental = image_cache_tester.incremental.IncrementalVerification(cache.get(_incremental_cache_key, {}))
+        session.config.stash[_incremental_key] = incremental
+        environment = image_cache_tester.incremental.environment_fingerprint()
+    # Update notebook with image verification
+    def instrument_notebook(nb_path: pathlib.Path) -> None:
+        """Add image verification to a notebook in the work directory."""
+        nb_content = nb_path.read_bytes()
+        if incremental is not None:
+            incremental.sources[str(nb_path)] = hashlib.sha256(
+                nb_content + instrumentation_options.encode() + environment.encode()).hexdigest()
+        if instrumentation_cache_dir is not None:
+            instrumentation_key = hashlib.sha256(
+                nb_content + str(nb_path).encode() + instrumentation_options.encode()).hexdigest()
+            cached_nb_path = instrumentation_cache_dir / f"{instrumentation_key}.ipynb"
+            if cached_nb_path.exists():
+                shutil.copyfile(cached_nb_path, f"{nb_path}.{os.getpid()}.tmp")
+                os.replace(f"{nb_path}.{os.getpid()}.tmp", nb_path)
+                return
+        nb = nbformat.reads(nb_content.decode(), as_version=4)  # type: ignore[no-untyped-call]
+        # Determine if notebook uses ipyparallel
+        uses_ipyparallel = False
+        first_px_cell = -1
+        for (cell_index, cell) in enumerate(nb.cells):
+            if cell.cell_type == "code" and "%%px" in cell.source:
+                uses_ipyparallel = True
+                first_px_cell = cell_index
+                break
+        rank_summary = uses_ipyparallel and session.config.option.image_rank_summary
+        deduplicate = uses_ipyparallel and refresh_image_cache and session.config.option.deduplicate_image_cache
+        # Plotters are displayed by pyvista only if screenshots are displayed at full resolution, since the rank
+        # summary and the other display policies rather display downscaled screenshots, if any
+        display_plotter = (
+            not rank_summary and session.config.option.image_display == "full"
+            and not session.config.option.hide_passed_images)
+        # Add a cell on top for computation of expected and actual image paths
+        # Only lightweight modules are imported when the notebook starts. Heavy modules (e.g. mpi4py, numpy
+        # and pyvista) are imported by the functions below on the first verification, so that kernels and
+        # ipyparallel engines do not pay their import cost before plotting anything. The only exception is viskex,
+        # which sets the pyvista theme on import and hence must be imported before any plotter is created: this
+        # does not add to the cost of notebooks which show images, since they import pyvista anyway.
+        shows_images = any(
+            cell.cell_type == "code" and any(
+                show in cell.source for show in ("viskex.dolfinx", "viskex.firedrake", ".show("))
+            for cell in nb.cells)
+        viskex_import = "\nimport viskex.utils.dtype\n" if shows_images else ""
+        image_paths_code = f'''import os
+{viskex_import}
+import image_cache_tester.artifact_writer  # isort: skip
+import image_cache_tester.timings  # isort: skip
 
 
 def _image_path_generator(directory: str, cell_id: str, comm_size: int, comm_rank: int) -> str:
     """Return the image name associated to a cell id."""
+    import numpy as np
+    import pyvista
+
+    import viskex.utils.dtype
+
+    # Check that the pyvista jupyter backend is compatible with cache generation. Note that this
+    # cannot be done in the sessionstart code because that would force an import of viskex
+    # in the pytest hooks themselevs, rather than in the notebook.
+    pyvista_jupyter_backend = pyvista.global_theme.jupyter_backend
+    if pyvista_jupyter_backend not in ("html", "static"):
+        raise RuntimeError(
+            "Invalid pyvista jupyter backend: got " + pyvista_jupyter_backend + ", "
+            "expected either html or static. "
+            "Please set the environment variable VISKEX_PYVISTA_BACKEND.")
     ipynb_name = "{nb_path.name}"
     assert ipynb_name.endswith(".ipynb")
     ipynb_name = ipynb_name[:-6]  # drop extension
@@ -96,10 +262,11 @@ def _image_path_generator(directory: str, cell_id: str, comm_size: int, comm_ran
         output_scalar_type = "complex"
     else:
         output_scalar_type = "real"
+    # Directories are created only when an image is actually written, so that e.g. the notebook directories of an
+    # image cache which was packed are not created again
     output_dir = os.path.join(
         ipynb_dir, directory, ipynb_name, output_scalar_type, "comm_size=" + str(comm_size),
         "comm_rank=" + str(comm_rank), pyvista_jupyter_backend)
-    os.makedirs(output_dir, exist_ok=True)
     return os.path.join(output_dir, cell_id + ".png")
 
 
@@ -121,34 +288,148 @@ class ImageVerificationError(RuntimeError):
         super().__init__(self, info)
         ImageVerificationError._failures += 1
 
-def verify_plotter_image(plotter: pyvista.Plotter, cell_id: str, refresh_image_cache: bool, xfail: bool) -> None:
-    """Compare plotter image to cache, and raise an error if comparison fails."""
+# Verdicts of the image verifications carried out on the current rank
+image_verification_verdicts = []
+
+# Pixel digests of the images stored in the image cache by the current rank, used for deduplication
+image_cache_digests = dict()
+
+# Regions declared in each cell through PYTEST_IMAGE_ROI and PYTEST_IMAGE_IGNORE markers
+image_verification_regions = dict()
+
+# Timings of the phases of image verification, which each rank writes after every verification
+image_cache_tester.timings.recorder.enabled = {timings}
+
+def display_full_images(cell_id: str) -> None:
+    """Display the full resolution images of a failed verification on the current rank."""
+    import IPython.display
+    import mpi4py.MPI
+
+    import image_cache_tester.compare_arrays
+    import image_cache_tester.compare_images
+    import image_cache_tester.image_masks
+
+    comparison = image_cache_tester.compare_images._compare_images(
+        screenshot_image_path_generator(cell_id, {np}, mpi4py.MPI.COMM_WORLD.rank),
+        expected_image_path_generator(cell_id, {np}, mpi4py.MPI.COMM_WORLD.rank), False,
+        tolerances={tolerances},
+        regions=image_verification_regions.get(cell_id, image_cache_tester.image_masks.Regions()))
+    titles = ("Actual screenshot", "Expected screenshot", "Difference between screenshots")
+    for (title, image) in zip(titles, comparison):
+        IPython.display.display(title)
+        IPython.display.display(image)
+
+def record_pyramid(expected_image_path: str, cached_image: "PIL.Image.Image") -> None:
+    """Store the pyramid of an image of the image cache next to it, if images are compared tile by tile."""
+    import numpy as np
+
+    import image_cache_tester.image_pyramid
+
+    if {session.config.option.image_tile_size} is not None:
+        image_cache_tester.artifact_writer.writer.submit(
+            image_cache_tester.image_pyramid.save_pyramid, expected_image_path, np.asarray(cached_image),
+            {session.config.option.image_tile_size})
+
+def verify_plotter_image(
+    plotter: "pyvista.Plotter", cell_id: str, refresh_image_cache: bool, xfail: bool, region_markers: str = ""
+) -> None:
+    """
+    Compare plotter image to cache, and raise an error if comparison fails.
+
+    Regions are parsed from the PYTEST_IMAGE_ROI and PYTEST_IMAGE_IGNORE markers of the cell in the notebook,
+    so that invalid markers are reported as a cell failure.
+    """
+    import mpi4py.MPI
+
+    import image_cache_tester.image_masks
+
+    recorder = image_cache_tester.timings.recorder
+    try:
+        with recorder.cell(cell_id), recorder.phase("total"):
+            _verify_plotter_image(
+                plotter, cell_id, refresh_image_cache, xfail,
+                image_cache_tester.image_masks.parse_regions(region_markers))
+    finally:
+        # Timings are written also on failure, since the following cells are not run
+        if recorder.enabled:
+            recorder.write(image_cache_tester.timings.rank_timings_path(
+                "{_timings_dir(nb_path)}", mpi4py.MPI.COMM_WORLD.rank))
+
+def _verify_plotter_image(
+    plotter: "pyvista.Plotter", cell_id: str, refresh_image_cache: bool, xfail: bool,
+    regions: "image_cache_tester.image_masks.Regions"
+) -> None:
+    """Compare plotter image to cache, timing each phase, and raise an error if comparison fails."""
+    import IPython.display
+    import mpi4py.MPI
+    import numpy as np
+
+    import image_cache_tester.compare_arrays
+    import image_cache_tester.compare_images
+    import image_cache_tester.image_cache_manifest
+    import image_cache_tester.image_dedup
+    import image_cache_tester.image_display
+    import image_cache_tester.image_pack
+    import image_cache_tester.rank_verdicts
+
+    recorder = image_cache_tester.timings.recorder
+    image_verification_regions[cell_id] = regions
     screenshot_image_path = screenshot_image_path_generator(cell_id, {np}, mpi4py.MPI.COMM_WORLD.rank)
     expected_image_path = expected_image_path_generator(cell_id, {np}, mpi4py.MPI.COMM_WORLD.rank)
-    screenshot_image, expected_image, difference_image = image_cache_tester.compare_images.compare_images(
-        plotter, screenshot_image_path, expected_image_path, True)
-    if difference_image.getbbox():
-        IPython.display.display("Actual screenshot")
-        IPython.display.display(screenshot_image)
-        IPython.display.display("Expected screenshot")
-        IPython.display.display(expected_image)
-        IPython.display.display("Difference between screenshots")
-        IPython.display.display(difference_image)
-    else:
-        IPython.display.display("Actual screenshot")
-        IPython.display.display(screenshot_image)
+    expected_image_exists = image_cache_tester.image_pack.exists(expected_image_path)
+    comparison = image_cache_tester.compare_images.compare_images(
+        plotter, screenshot_image_path, expected_image_path, True, in_memory=True,
+        tolerances={tolerances}, use_digests=True, save_screenshot={session.config.option.save_screenshots},
+        regions=regions, tile_size={session.config.option.image_tile_size},
+        display={display_plotter})
+    with recorder.phase("display"):
+        if {rank_summary}:
+            # Only keep a compact verdict, which is gathered on the first rank at the end of the notebook
+            image_verification_verdicts.append(image_cache_tester.rank_verdicts.make_verdict(
+                cell_id, mpi4py.MPI.COMM_WORLD.rank, comparison, xfail,
+                {session.config.option.image_thumbnail_size}))
+        else:
+            for item in image_cache_tester.image_display.display_items(
+                comparison, "{session.config.option.image_display}", {session.config.option.image_thumbnail_size},
+                {not session.config.option.hide_passed_images}
+            ):
+                IPython.display.display(item)
     if refresh_image_cache and not xfail:
-        shutil.copy(screenshot_image_path, expected_image_path)
-    if difference_image.getbbox() and not xfail:
-        raise ImageVerificationError("Image cache verification failed for cell " + cell_id)'''
-        # Determine if notebook uses ipyparallel
-        uses_ipyparallel = False
-        first_px_cell = -1
-        for (cell_index, cell) in enumerate(nb.cells):
-            if cell.cell_type == "code" and "%%px" in cell.source:
-                uses_ipyparallel = True
-                first_px_cell = cell_index
-                break
+        with recorder.phase("refresh"):
+            # Artifacts are written in order, hence the copy takes place after the screenshot has been saved
+            # Images stored in a pack do not need to be recorded in the manifest, since the pack index already
+            # contains their pixel digest. Updated images are instead stored in the directory layout, which takes
+            # precedence over the pack until the image cache is packed again.
+            # A reference left by a previous deduplication is stale once the image itself is written, hence it is
+            # removed even if the image cache is not deduplicated again at the end of the notebook
+            if not comparison.passed or not expected_image_exists:
+                image_cache_tester.artifact_writer.writer.copy_file(screenshot_image_path, expected_image_path)
+                image_cache_tester.artifact_writer.writer.submit(
+                    image_cache_tester.image_dedup.remove_reference, expected_image_path)
+                cached_image = comparison.actual_image
+                image_cache_tester.artifact_writer.writer.submit(
+                    image_cache_tester.image_cache_manifest.record, expected_image_path, np.asarray(cached_image))
+                record_pyramid(expected_image_path, cached_image)
+            else:
+                cached_image = comparison.expected_image
+                if {deduplicate} and not os.path.exists(expected_image_path):
+                    # Each rank stores its own image, and references are only written in the final cell
+                    image_cache_tester.artifact_writer.writer.save_image(cached_image, expected_image_path)
+                    image_cache_tester.artifact_writer.writer.submit(
+                        image_cache_tester.image_dedup.remove_reference, expected_image_path)
+                if os.path.exists(expected_image_path) or {deduplicate}:
+                    image_cache_tester.artifact_writer.writer.submit(
+                        image_cache_tester.image_cache_manifest.record, expected_image_path, np.asarray(cached_image))
+                    record_pyramid(expected_image_path, cached_image)
+            if {deduplicate}:
+                image_cache_digests[cell_id] = image_cache_tester.image_cache_manifest.pixel_digest(
+                    np.asarray(cached_image))
+    if not comparison.passed and not xfail:
+        if {rank_summary}:
+            # Defer the failure to the final cell, since the cells following a failed one are not run
+            ImageVerificationError._failures += 1
+        else:
+            raise ImageVerificationError("Image cache verification failed for cell " + cell_id)'''
         if uses_ipyparallel:
             # Add the cell after the cluster start one, so that %%px is available
             image_paths_position = first_px_cell
@@ -228,11 +509,40 @@ def verify_plotter_image(plotter: pyvista.Plotter, cell_id: str, refresh_image_c
                 if has_show:
                     indentation = " " * indentation_length
                     verify_image_code = f"""{indentation}verify_plotter_image(
-{indentation}    {plotter_variable}, "{cell_id}", {refresh_image_cache}, {"PYTEST_XFAIL" in cell.source})"""
+{indentation}    {plotter_variable}, "{cell_id}", {refresh_image_cache}, {"PYTEST_XFAIL" in cell.source}"""
+                    region_markers = "\n".join(
+                        line for line in lines if "PYTEST_IMAGE_ROI" in line or "PYTEST_IMAGE_IGNORE" in line)
+                    if len(region_markers) > 0:
+                        verify_image_code += f""", {region_markers!r}"""
+                    verify_image_code += ")"
                     lines.append(verify_image_code)
                     cell.source = "\n".join(lines)
         # Add a final summary of how many image verification failures there were
-        failures_summary_code = """if ImageVerificationError._failures > 0:
+        failures_summary_code = """image_cache_tester.artifact_writer.writer.flush()
+"""
+        if deduplicate:
+            failures_summary_code += f"""import image_cache_tester.image_dedup  # isort: skip
+
+image_cache_tester.image_dedup.deduplicate_across_ranks(
+    image_cache_digests, lambda cell_id, comm_rank: expected_image_path_generator(cell_id, {np}, comm_rank))
+"""
+        if rank_summary:
+            failures_summary_code += """import IPython.display
+
+import image_cache_tester.rank_verdicts  # isort: skip
+
+all_verdicts = image_cache_tester.rank_verdicts.gather_verdicts(
+    image_verification_verdicts)
+if all_verdicts is not None:
+    IPython.display.display(IPython.display.Pretty(image_cache_tester.rank_verdicts.summarize_verdicts(all_verdicts)))
+    for verdict in all_verdicts:
+        if verdict.thumbnail is not None:
+            IPython.display.display(
+                "Cell " + verdict.cell_id + " on rank " + str(verdict.comm_rank) + ": actual, expected, difference "
+                "(call display_full_images on that rank for full resolution images)")
+            IPython.display.display(IPython.display.Image(verdict.thumbnail))
+"""
+        failures_summary_code += """if ImageVerificationError._failures > 0:
     raise ImageVerificationError(
         "There were " + str(ImageVerificationError._failures) + " image verification failures.")"""
         failures_summary_position = len(nb.cells)
@@ -248,6 +558,161 @@ def verify_plotter_image(plotter: pyvista.Plotter, cell_id: str, refresh_image_c
         failures_summary_cell = nbformat.v4.new_code_cell(failures_summary_code)  # type: ignore[no-untyped-call]
         failures_summary_cell.id = "failures_summary"
         nb.cells.insert(failures_summary_position, failures_summary_cell)
-        # Write modified notebook to the work directory
-        with open(nb_path, "w") as f:
+        # Write modified notebook to the work directory, replacing it atomically since other pytest-xdist workers
+        # may be collecting it
+        with open(f"{nb_path}.{os.getpid()}.tmp", "w") as f:
             nbformat.write(nb, f)  # type: ignore[no-untyped-call]
+        # Store the modified notebook in the cache, replacing it atomically since other sessions may be reading
+        if instrumentation_cache_dir is not None:
+            shutil.copyfile(f"{nb_path}.{os.getpid()}.tmp", f"{cached_nb_path}.{os.getpid()}.tmp")
+            os.replace(f"{cached_nb_path}.{os.getpid()}.tmp", cached_nb_path)
+        os.replace(f"{nb_path}.{os.getpid()}.tmp", nb_path)
+
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        # Consume the results, so that exceptions raised while instrumenting are propagated
+        list(executor.map(instrument_notebook, notebooks))
+
+
+@pytest.hookimpl(tryfirst=True)
+def collection_modifyitems(session: pytest.Session, config: pytest.Config, items: list[pytest.Item]) -> None:
+    """Deselect the cells of notebooks which passed image verification and whose inputs are unchanged since."""
+    incremental = config.stash.get(_incremental_key, None)
+    if incremental is None:
+        return
+    # Cells are counted before any other deselection, so that partially run notebooks are not recorded
+    for item in items:
+        incremental.collect(str(item.path))
+    unchanged = {
+        nb_name for nb_name in incremental.sources
+        if incremental.is_unchanged(nb_name, _incremental_fingerprint(incremental, nb_name))}
+    config.hook.pytest_deselected(items=[item for item in items if str(item.path) in unchanged])
+    items[:] = [item for item in items if str(item.path) not in unchanged]
+
+
+def runtest_makereport(item: pytest.Item, call: pytest.CallInfo[None]) -> None:
+    """Record the outcome of each cell, to determine which notebooks passed image verification."""
+    incremental = item.config.stash.get(_incremental_key, None)
+    if incremental is None:
+        return
+    outcome = "passed" if call.excinfo is None else (
+        "skipped" if call.excinfo.errisinstance(pytest.skip.Exception) else "failed")
+    incremental.report(str(item.path), call.when, outcome)
+
+
+def sessionfinish(session: pytest.Session, exitstatus: int) -> None:
+    """Store the fingerprints of the notebooks which passed image verification."""
+    incremental = session.config.stash.get(_incremental_key, None)
+    if incremental is None:
+        return
+    # Fingerprints are computed again, since the image cache may have been refreshed during the session.
+    # Records are read again and updated under a lock, since each pytest-xdist worker updates the records of
+    # the notebooks it ran.
+    with image_cache_tester.parallel_notebooks.FileLock(_lock_path(session.config, "incremental")):
+        incremental.records = session.config.cache.get(_incremental_cache_key, {})
+        records = incremental.update({
+            nb_name: _incremental_fingerprint(incremental, nb_name) for nb_name in incremental.sources})
+        session.config.cache.set(_incremental_cache_key, records)
+
+
+@pytest.hookimpl(optionalhook=True)
+def xdist_auto_num_workers(config: pytest.Config) -> int:
+    """Run as many notebooks concurrently with pytest-xdist -n auto as the cores allow, given np cores each."""
+    return image_cache_tester.parallel_notebooks.num_workers(config.option.np)
+
+
+def terminal_summary(
+    terminalreporter: pytest.TerminalReporter, exitstatus: int, config: pytest.Config
+) -> None:
+    """Report the time spent in each phase of image verification, if requested."""
+    notebooks = config.stash.get(_timings_notebooks_key, None)
+    if notebooks is None:
+        return
+    # Notebooks which were not run, e.g. because they were deselected, have no timings
+    all_timings = {
+        os.path.relpath(nb_path, config.rootpath): image_cache_tester.timings.load_timings(str(_timings_dir(nb_path)))
+        for nb_path in notebooks}
+    all_timings = {nb_name: nb_timings for (nb_name, nb_timings) in all_timings.items() if len(nb_timings) > 0}
+    merged_timings = {
+        nb_name: image_cache_tester.timings.merge_ranks(nb_timings) for (nb_name, nb_timings) in all_timings.items()}
+    if config.option.image_timings:
+        terminalreporter.section("image verification timings")
+        for line in image_cache_tester.timings.summarize_timings(merged_timings):
+            terminalreporter.write_line(line)
+    if config.option.image_timings_json is not None:
+        with open(config.option.image_timings_json, "w") as f:
+            json.dump({
+                nb_name: {
+                    "cells": image_cache_tester.timings.to_json(merged_timings[nb_name]),
+                    "ranks": {
+                        str(comm_rank): image_cache_tester.timings.to_json(cells)
+                        for (comm_rank, cells) in nb_timings.items()}
+                } for (nb_name, nb_timings) in all_timings.items()
+            }, f, indent=2)
+
+
+def _lock_path(config: pytest.Config, name: str) -> str:
+    """Return the path of a lock file shared by all pytest processes running in the same root directory."""
+    cache = getattr(config, "cache", None)
+    lock_dir = cache.mkdir("image_cache_tester_locks") if cache is not None else config.rootpath
+    return str(lock_dir / f"{name}.lock")
+
+
+def _incremental_fingerprint(
+    incremental: image_cache_tester.incremental.IncrementalVerification, nb_name: str
+) -> str:
+    """Return the fingerprint of the inputs of a notebook in the work directory, including its image cache."""
+    nb_path = pathlib.Path(nb_name)
+    image_cache_dir = nb_path.parent / ".image_cache"
+    image_cache = image_cache_tester.incremental.tree_fingerprint([
+        str(image_cache_dir / nb_path.stem), str(image_cache_dir / f"{nb_path.stem}.pack")])
+    return hashlib.sha256((incremental.sources[nb_name] + image_cache).encode()).hexdigest()
+
+
+def _timings_dir(nb_path: pathlib.Path) -> pathlib.Path:
+    """Return the directory where each rank writes the timings of a notebook in the work directory."""
+    return nb_path.parent / ".image_timings" / nb_path.stem
+
+
+def _find_work_dir_notebooks(calling_dir: pathlib.Path, work_dir: str) -> list[pathlib.Path]:
+    """
+    Find the notebooks in the work directories contained in a collection path.
+
+    Directories which cannot contain a work directory, such as the trees of images, are never visited.
+    Once a directory matches the beginning of the work directory path, only the next component of the path
+    is visited.
+    """
+    work_dir_parts = pathlib.Path(work_dir).parts
+    if len(work_dir_parts) == 0:
+        # Notebooks are never instrumented in place, to prevent modifying the original ones
+        return []
+    notebooks = list()
+    for (dirpath, dirnames, filenames) in os.walk(calling_dir):
+        dirpath_parts = pathlib.Path(dirpath).parts
+        matched_parts = max(
+            matched_parts for matched_parts in range(len(work_dir_parts) + 1)
+            if dirpath_parts[len(dirpath_parts) - matched_parts:] == work_dir_parts[:matched_parts])
+        if matched_parts == len(work_dir_parts):
+            for filename in sorted(filenames):
+                if filename.endswith(".ipynb"):
+                    assert not filename.endswith(".log.ipynb")
+                    notebooks.append(pathlib.Path(dirpath, filename))
+            dirnames[:] = []
+        elif matched_parts > 0:
+            dirnames[:] = [dirname for dirname in dirnames if dirname == work_dir_parts[matched_parts]]
+        else:
+            dirnames[:] = sorted(dirname for dirname in dirnames if dirname not in _pruned_dirs)
+    return notebooks
+
+
+def _instrumentation_cache_dir(session: pytest.Session) -> pathlib.Path | None:
+    """Return the directory where instrumented notebooks are cached, or None if the pytest cache is disabled."""
+    cache = getattr(session.config, "cache", None)
+    if cache is None:
+        return None
+    return typing.cast(pathlib.Path, cache.mkdir("image_cache_tester_notebooks"))
+
+
+def _hooks_digest() -> str:
+    """Return a digest of the source code of these hooks, so that cached notebooks are invalidated on changes."""
+    with open(__file__, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
@@ -0,0 +1,169 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Compact verdicts of image verification, gathered across ranks."""
+
+import collections.abc
+import dataclasses
+import io
+import typing
+
+import PIL.Image
+
+import image_cache_tester.compare_arrays
+import image_cache_tester.compare_images
+
+if typing.TYPE_CHECKING:
+    import mpi4py.MPI
+
+
+@dataclasses.dataclass(frozen=True)
+class Verdict:
+    """
+    Compact verdict of the verification of an image on a rank.
+
+    Parameters
+    ----------
+    cell_id
+        Id of the cell which produced the image.
+    comm_rank
+        Rank which produced the image.
+    passed
+        Whether the image matched the cached one.
+    xfail
+        Whether the cell was allowed to fail.
+    metrics
+        The metrics resulting from the comparison.
+    thumbnail
+        PNG encoding of downscaled actual, expected and difference images placed side by side, only available
+        if the verification failed.
+    """
+
+    cell_id: str
+    comm_rank: int
+    passed: bool
+    xfail: bool
+    metrics: image_cache_tester.compare_arrays.ComparisonMetrics
+    thumbnail: bytes | None = None
+
+
+def composite_thumbnail(images: collections.abc.Sequence[PIL.Image.Image], max_size: int) -> PIL.Image.Image:
+    """
+    Downscale images and place them side by side.
+
+    Parameters
+    ----------
+    images
+        The images to be composited.
+    max_size
+        Maximum width and height of each downscaled image.
+
+    Returns
+    -------
+    :
+        The composite image, in RGB format.
+    """
+    thumbnails = []
+    for image in images:
+        thumbnail = image.convert("RGB")
+        thumbnail.thumbnail((max_size, max_size))
+        thumbnails.append(thumbnail)
+    composite = PIL.Image.new(
+        "RGB", (sum(thumbnail.width for thumbnail in thumbnails), max(thumbnail.height for thumbnail in thumbnails)))
+    offset = 0
+    for thumbnail in thumbnails:
+        composite.paste(thumbnail, (offset, 0))
+        offset += thumbnail.width
+    return composite
+
+
+def make_verdict(
+    cell_id: str, comm_rank: int, comparison: image_cache_tester.compare_images.ImageComparison, xfail: bool,
+    thumbnail_size: int = 128
+) -> Verdict:
+    """
+    Summarize the comparison of an image into a compact verdict.
+
+    Parameters
+    ----------
+    cell_id
+        Id of the cell which produced the image.
+    comm_rank
+        Rank which produced the image.
+    comparison
+        The result of the comparison.
+    xfail
+        Whether the cell was allowed to fail.
+    thumbnail_size
+        Maximum width and height of each image in the thumbnail attached to failed verifications.
+
+    Returns
+    -------
+    :
+        The verdict.
+    """
+    if comparison.passed:
+        thumbnail = None
+    else:
+        buffer = io.BytesIO()
+        composite_thumbnail(
+            [comparison.actual_image, comparison.expected_image, comparison.difference_image], thumbnail_size
+        ).save(buffer, format="PNG")
+        thumbnail = buffer.getvalue()
+    return Verdict(cell_id, comm_rank, comparison.passed, xfail, comparison.metrics, thumbnail)
+
+
+def gather_verdicts(
+    verdicts: list[Verdict], comm: "mpi4py.MPI.Comm | None" = None, root: int = 0
+) -> list[Verdict] | None:
+    """
+    Gather the verdicts of all ranks.
+
+    Parameters
+    ----------
+    verdicts
+        The verdicts of the current rank.
+    comm
+        The communicator over which verdicts are gathered. If not provided, the world communicator is used.
+    root
+        The rank on which verdicts are gathered.
+
+    Returns
+    -------
+    :
+        On the root rank, the verdicts of all ranks sorted by rank. None on the other ranks.
+    """
+    if comm is None:
+        import mpi4py.MPI
+        comm = mpi4py.MPI.COMM_WORLD
+    gathered = comm.gather(verdicts, root=root)
+    if gathered is None:
+        return None
+    return [verdict for rank_verdicts in gathered for verdict in rank_verdicts]
+
+
+def summarize_verdicts(verdicts: list[Verdict]) -> str:
+    """
+    Summarize the verdicts of all ranks, grouping them by cell.
+
+    Parameters
+    ----------
+    verdicts
+        The verdicts of all ranks.
+
+    Returns
+    -------
+    :
+        A human readable summary, with a line for each cell which failed verification on at least one rank.
+    """
+    failed_ranks: dict[str, list[int]] = dict()
+    for verdict in verdicts:
+        if not verdict.passed:
+            failed_ranks.setdefault(verdict.cell_id, []).append(verdict.comm_rank)
+    lines = [
+        f"{sum(len(ranks) for ranks in failed_ranks.values())} of {len(verdicts)} image verifications failed"]
+    for (cell_id, ranks) in failed_ranks.items():
+        lines.append(f"Cell {cell_id} failed on ranks {', '.join(str(rank) for rank in ranks)}")
+    return "\n".join(lines)
@@ -0,0 +1,215 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Timers and byte counters of the phases of image verification, aggregated by cell."""
+
+import collections.abc
+import contextlib
+import dataclasses
+import json
+import os
+import tempfile
+import time
+import typing
+
+
+@dataclasses.dataclass
+class PhaseTimings:
+    """
+    Accumulated cost of a phase of image verification.
+
+    Parameters
+    ----------
+    seconds
+        Total wall clock time spent in the phase.
+    calls
+        Number of times the phase was entered.
+    bytes
+        Total number of bytes processed by the phase, e.g. the size of decoded pixels.
+    """
+
+    seconds: float = 0.0
+    calls: int = 0
+    bytes: int = 0
+
+
+class TimingRecorder:
+    """
+    Recorder of the time spent in each phase of image verification, aggregated by cell.
+
+    Recording is disabled by default, in which case timing a phase has a negligible cost.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.cells: dict[str, dict[str, PhaseTimings]] = dict()
+        self._cell_id = ""
+
+    @contextlib.contextmanager
+    def cell(self, cell_id: str) -> collections.abc.Iterator[None]:
+        """Attribute the phases timed within the context to a cell."""
+        previous_cell_id = self._cell_id
+        self._cell_id = cell_id
+        try:
+            yield
+        finally:
+            self._cell_id = previous_cell_id
+
+    @contextlib.contextmanager
+    def phase(self, name: str, num_bytes: int = 0) -> collections.abc.Iterator[None]:
+        """
+        Time a phase of the current cell.
+
+        Parameters
+        ----------
+        name
+            Name of the phase.
+        num_bytes
+            Number of bytes processed by the phase, if known in advance. Bytes known only at the end of the
+            phase can be added with add_bytes.
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timings = self._phase_timings(name)
+            timings.seconds += time.perf_counter() - start
+            timings.calls += 1
+            timings.bytes += num_bytes
+
+    def add_bytes(self, name: str, num_bytes: int) -> None:
+        """Add to the number of bytes processed by a phase of the current cell."""
+        if self.enabled:
+            self._phase_timings(name).bytes += num_bytes
+
+    def _phase_timings(self, name: str) -> PhaseTimings:
+        """Return the accumulated timings of a phase of the current cell."""
+        return self.cells.setdefault(self._cell_id, dict()).setdefault(name, PhaseTimings())
+
+    def write(self, path: str) -> None:
+        """Write the recorded timings to a JSON file, replacing it atomically."""
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False) as f:
+            json.dump(to_json(self.cells), f)
+        os.replace(f.name, path)
+
+
+recorder = TimingRecorder()
+
+
+def to_json(cells: dict[str, dict[str, PhaseTimings]]) -> dict[str, dict[str, dict[str, typing.Any]]]:
+    """Convert the timings of each phase of each cell to a JSON serializable dictionary."""
+    return {
+        cell_id: {name: dataclasses.asdict(timings) for (name, timings) in phases.items()}
+        for (cell_id, phases) in cells.items()}
+
+
+def rank_timings_path(timings_dir: str, comm_rank: int) -> str:
+    """Return the path of the file where a rank writes its timings."""
+    return os.path.join(timings_dir, f"comm_rank={comm_rank}.json")
+
+
+def load_timings(timings_dir: str) -> dict[int, dict[str, dict[str, PhaseTimings]]]:
+    """
+    Load the timings written by all ranks in a directory.
+
+    Parameters
+    ----------
+    timings_dir
+        The directory where each rank wrote its timings.
+
+    Returns
+    -------
+    :
+        Dictionary from each rank to its timings, stored as a dictionary from cell ids to the timings of each
+        phase. The dictionary is empty if the directory does not exist.
+    """
+    if not os.path.isdir(timings_dir):
+        return dict()
+    all_timings = dict()
+    for filename in os.listdir(timings_dir):
+        if filename.startswith("comm_rank=") and filename.endswith(".json"):
+            with open(os.path.join(timings_dir, filename)) as f:
+                cells = json.load(f)
+            all_timings[int(filename[len("comm_rank="):-len(".json")])] = {
+                cell_id: {name: PhaseTimings(**timings) for (name, timings) in phases.items()}
+                for (cell_id, phases) in cells.items()}
+    return dict(sorted(all_timings.items()))
+
+
+def merge_ranks(
+    all_timings: dict[int, dict[str, dict[str, PhaseTimings]]]
+) -> dict[str, dict[str, PhaseTimings]]:
+    """
+    Merge the timings of all ranks.
+
+    Since ranks run concurrently, the time of each phase is the maximum over ranks, while calls and bytes
+    are summed over ranks.
+
+    Parameters
+    ----------
+    all_timings
+        Dictionary from each rank to its timings.
+
+    Returns
+    -------
+    :
+        Dictionary from cell ids to the merged timings of each phase.
+    """
+    merged: dict[str, dict[str, PhaseTimings]] = dict()
+    for cells in all_timings.values():
+        for (cell_id, phases) in cells.items():
+            for (name, timings) in phases.items():
+                merged_timings = merged.setdefault(cell_id, dict()).setdefault(name, PhaseTimings())
+                merged_timings.seconds = max(merged_timings.seconds, timings.seconds)
+                merged_timings.calls += timings.calls
+                merged_timings.bytes += timings.bytes
+    return merged
+
+
+def summarize_timings(notebooks: dict[str, dict[str, dict[str, PhaseTimings]]], max_cells: int = 20) -> list[str]:
+    """
+    Summarize the timings of all notebooks.
+
+    Parameters
+    ----------
+    notebooks
+        Dictionary from each notebook to the timings of its cells, merged over ranks.
+    max_cells
+        Maximum number of cells to be reported, starting from the slowest ones.
+
+    Returns
+    -------
+    :
+        Human readable lines, containing the total time of each phase over all cells followed by the timings
+        of each phase of the slowest cells.
+    """
+    totals: dict[str, PhaseTimings] = dict()
+    cells = []
+    for (notebook, notebook_cells) in notebooks.items():
+        for (cell_id, phases) in notebook_cells.items():
+            for (name, timings) in phases.items():
+                total = totals.setdefault(name, PhaseTimings())
+                total.seconds += timings.seconds
+                total.calls += timings.calls
+                total.bytes += timings.bytes
+            cells.append((phases.get("total", PhaseTimings()).seconds, notebook, cell_id, phases))
+    lines = ["Total time of each phase of image verification:"]
+    lines.extend(
+        f"  {name}: {timings.seconds:.3f}s in {timings.calls} calls, {timings.bytes / 2**20:.1f} MiB"
+        for (name, timings) in sorted(totals.items(), key=lambda item: -item[1].seconds))
+    cells.sort(key=lambda cell: -cell[0])
+    if len(cells) > 0:
+        lines.append(f"Slowest {min(len(cells), max_cells)} of {len(cells)} cells:")
+    for (total_seconds, notebook, cell_id, phases) in cells[:max_cells]:
+        lines.append(f"  {notebook}::{cell_id}: {total_seconds:.3f}s")
+        lines.extend(
+            f"    {name}: {timings.seconds:.3f}s, {timings.bytes / 2**20:.1f} MiB"
+            for (name, timings) in phases.items() if name != "total")
+    return lines
@@ -11,7 +11,12 @@ import image_cache_tester.pytest_hooks_notebooks
 
 pytest_addoption = image_cache_tester.pytest_hooks_notebooks.addoption
 pytest_collect_file = image_cache_tester.pytest_hooks_notebooks.collect_file
+pytest_collection_modifyitems = image_cache_tester.pytest_hooks_notebooks.collection_modifyitems
+pytest_runtest_makereport = image_cache_tester.pytest_hooks_notebooks.runtest_makereport
 pytest_sessionstart = image_cache_tester.pytest_hooks_notebooks.sessionstart
+pytest_sessionfinish = image_cache_tester.pytest_hooks_notebooks.sessionfinish
+pytest_terminal_summary = image_cache_tester.pytest_hooks_notebooks.terminal_summary
+pytest_xdist_auto_num_workers = image_cache_tester.pytest_hooks_notebooks.xdist_auto_num_workers
 
 
 def pytest_runtest_setup(item: image_cache_tester.pytest_hooks_notebooks.IPyNbFile) -> None:
@@ -0,0 +1,53 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Tests for image_cache_tester.artifact_writer module."""
+
+import os
+import tempfile
+
+import numpy as np
+import PIL.Image
+import pytest
+
+import image_cache_tester.artifact_writer
+
+
+def test_artifact_writer_save_and_copy() -> None:
+    """Test that a copy submitted after a save is carried out once the image has been saved."""
+    writer = image_cache_tester.artifact_writer.ArtifactWriter()
+    with tempfile.TemporaryDirectory() as images_dir:
+        image_path = os.path.join(images_dir, "image.png")
+        copy_path = os.path.join(images_dir, "copy.png")
+        image = PIL.Image.new("RGB", (50, 50))
+        image.putpixel((0, 0), (255, 0, 0))
+        writer.save_image(image, image_path)
+        writer.copy_file(image_path, copy_path)
+        writer.flush()
+        assert np.array_equal(np.asarray(PIL.Image.open(copy_path)), np.asarray(image))
+
+
+def test_artifact_writer_creates_directories() -> None:
+    """Test that directories are created only when an artifact is written to them."""
+    writer = image_cache_tester.artifact_writer.ArtifactWriter()
+    with tempfile.TemporaryDirectory() as images_dir:
+        image_path = os.path.join(images_dir, "saved", "image.png")
+        copy_path = os.path.join(images_dir, "copied", "nested", "copy.png")
+        writer.save_image(PIL.Image.new("RGB", (50, 50)), image_path)
+        writer.copy_file(image_path, copy_path)
+        writer.flush()
+        assert os.path.exists(image_path)
+        assert os.path.exists(copy_path)
+
+
+def test_artifact_writer_flush_raises() -> None:
+    """Test that errors occurring in the background are raised by flush."""
+    writer = image_cache_tester.artifact_writer.ArtifactWriter()
+    with tempfile.TemporaryDirectory() as images_dir:
+        missing_path = os.path.join(images_dir, "missing.png")
+        writer.copy_file(missing_path, os.path.join(images_dir, "copy.png"))
+        with pytest.raises(FileNotFoundError):
+            writer.flush()
+        writer.flush()
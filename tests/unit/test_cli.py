@@ -0,0 +1,125 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Tests for image_cache_tester.cli module."""
+
+import contextlib
+import io
+import json
+import os
+import tempfile
+
+import PIL.Image
+
+import image_cache_tester.cli
+
+
+def test_cli_verify() -> None:
+    """Test that the verify command writes a JSON summary and returns a failure exit code on differences."""
+    with tempfile.TemporaryDirectory() as root:
+        leaf_dir = os.path.join("nb", "real", "comm_size=1", "comm_rank=0", "static")
+        for tree in (".image_from_pytest", ".image_cache"):
+            os.makedirs(os.path.join(root, tree, leaf_dir))
+            PIL.Image.new("RGB", (50, 50)).save(os.path.join(root, tree, leaf_dir, "cell.png"))
+        json_path = os.path.join(root, "summary.json")
+        stdout_buffer = io.StringIO()
+        with contextlib.redirect_stdout(stdout_buffer):
+            assert image_cache_tester.cli.main(["verify", root, "--executor", "thread", "--json", json_path]) == 0
+        with open(json_path) as f:
+            summary = json.load(f)
+        assert summary["successful"]
+        assert summary["trees"][0]["passed"] == [os.path.join(leaf_dir, "cell.png")]
+        PIL.Image.new("RGB", (50, 50), (0, 0, 1)).save(os.path.join(root, ".image_from_pytest", leaf_dir, "cell.png"))
+        with contextlib.redirect_stdout(stdout_buffer):
+            assert image_cache_tester.cli.main(["verify", root, "--executor", "thread"]) == 1
+            assert image_cache_tester.cli.main(
+                ["verify", root, "--executor", "thread", "--channel-threshold", "1"]) == 0
+        assert "1 passed, 0 differing, 0 missing, 0 extra" in stdout_buffer.getvalue()
+        assert "0 passed, 1 differing, 0 missing, 0 extra" in stdout_buffer.getvalue()
+        stdout_buffer = io.StringIO()
+        with contextlib.redirect_stdout(stdout_buffer):
+            assert image_cache_tester.cli.main(["verify", root, "--executor", "thread", "--tile-size", "32"]) == 1
+        # Pixels are counted from lower bounds, since the pyramids are enough to reject the actual image
+        tile_lines = [line for line in stdout_buffer.getvalue().splitlines() if line.startswith("    tile ")]
+        assert sorted(line.split(":")[0] for line in tile_lines) == [
+            "    tile (0, 0, 32, 32)", "    tile (0, 32, 32, 50)", "    tile (32, 0, 50, 32)",
+            "    tile (32, 32, 50, 50)"]
+
+
+def test_cli_verify_report() -> None:
+    """Test that the verify command reports differing, missing and extra images, and writes JSON to stdout."""
+    with tempfile.TemporaryDirectory() as root:
+        leaf_dir = os.path.join("nb", "real", "comm_size=1", "comm_rank=0", "static")
+        for tree in (".image_from_pytest", ".image_cache"):
+            os.makedirs(os.path.join(root, tree, leaf_dir))
+            for name in ("passed", "differing", "dangling"):
+                PIL.Image.new("RGB", (50, 50)).save(os.path.join(root, tree, leaf_dir, f"{name}.png"))
+        actual_dir = os.path.join(root, ".image_from_pytest", leaf_dir)
+        expected_dir = os.path.join(root, ".image_cache", leaf_dir)
+        PIL.Image.new("RGB", (50, 50), (0, 0, 1)).save(os.path.join(actual_dir, "differing.png"))
+        # A reference to an image which does not exist cannot be compared
+        os.remove(os.path.join(actual_dir, "dangling.png"))
+        with open(os.path.join(actual_dir, "dangling.png.ref"), "w") as f:
+            f.write("nonexistent.png\n")
+        PIL.Image.new("RGB", (50, 50)).save(os.path.join(actual_dir, "missing.png"))
+        PIL.Image.new("RGB", (50, 50)).save(os.path.join(expected_dir, "extra.png"))
+        stdout_buffer = io.StringIO()
+        stderr_buffer = io.StringIO()
+        with contextlib.redirect_stdout(stdout_buffer), contextlib.redirect_stderr(stderr_buffer):
+            assert image_cache_tester.cli.main(["verify", root, "--executor", "thread", "--json", "-"]) == 1
+        summary = json.loads(stdout_buffer.getvalue())
+        assert not summary["successful"]
+        assert summary["trees"][0]["passed"] == [os.path.join(leaf_dir, "passed.png")]
+        log = stderr_buffer.getvalue().splitlines()
+        assert log[0].endswith("1 passed, 2 differing, 1 missing, 1 extra")
+        assert sorted(log[1:3]) == [
+            f"  differing: {os.path.join(actual_dir, 'dangling.png')} "
+            f"({os.path.join(actual_dir, 'dangling.png')} does not exist)",
+            f"  differing: {os.path.join(actual_dir, 'differing.png')} (2500 pixels, rmse 0.577)"
+        ]
+        assert log[3:] == [
+            f"  missing: {os.path.join(leaf_dir, 'missing.png')}", f"  extra: {os.path.join(leaf_dir, 'extra.png')}"]
+
+
+def test_cli_verify_no_tree() -> None:
+    """Test that the verify command reports directories without any tree of screenshots."""
+    with tempfile.TemporaryDirectory() as root:
+        stdout_buffer = io.StringIO()
+        with contextlib.redirect_stdout(stdout_buffer):
+            assert image_cache_tester.cli.main(["verify", root]) == 0
+        assert stdout_buffer.getvalue() == f"No .image_from_pytest tree found in {root}\n"
+
+
+def test_cli_pack_and_unpack() -> None:
+    """Test that the pack and unpack commands convert between the directory layout and packs."""
+    with tempfile.TemporaryDirectory() as root:
+        cache_dir = os.path.join(root, ".image_cache")
+        leaf_dir = os.path.join(cache_dir, "nb", "real", "comm_size=1", "comm_rank=0", "static")
+        os.makedirs(leaf_dir)
+        PIL.Image.new("RGB", (50, 50)).save(os.path.join(leaf_dir, "cell.png"))
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert image_cache_tester.cli.main(["pack", cache_dir, "--compression", "raw", "--remove"]) == 0
+            assert os.listdir(cache_dir) == ["nb.pack"]
+            assert image_cache_tester.cli.main(["unpack", cache_dir, "--remove"]) == 0
+        assert os.listdir(cache_dir) == ["nb"]
+        assert os.path.exists(os.path.join(leaf_dir, "cell.png"))
+
+
+def test_cli_dedup() -> None:
+    """Test that the dedup command replaces images identical across ranks with references, and restores them."""
+    with tempfile.TemporaryDirectory() as root:
+        cache_dir = os.path.join(root, ".image_cache")
+        for rank in range(2):
+            leaf_dir = os.path.join(cache_dir, "nb", "real", "comm_size=2", f"comm_rank={rank}", "static")
+            os.makedirs(leaf_dir)
+            PIL.Image.new("RGB", (50, 50)).save(os.path.join(leaf_dir, "cell.png"))
+        stdout_buffer = io.StringIO()
+        with contextlib.redirect_stdout(stdout_buffer):
+            assert image_cache_tester.cli.main(["dedup", cache_dir]) == 0
+            assert not os.path.exists(os.path.join(leaf_dir, "cell.png"))
+            assert image_cache_tester.cli.main(["dedup", cache_dir, "--restore"]) == 0
+            assert os.path.exists(os.path.join(leaf_dir, "cell.png"))
+        assert "1 images replaced by references" in stdout_buffer.getvalue()
+        assert "1 references restored" in stdout_buffer.getvalue()
@@ -0,0 +1,133 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Tests for image_cache_tester.compare_arrays module."""
+
+import math
+
+import numpy as np
+import pytest
+
+import image_cache_tester.compare_arrays
+
+
+def test_compare_arrays_identical() -> None:
+    """Test that two identical arrays are the same."""
+    actual_array = np.zeros((50, 50, 3), dtype=np.uint8)
+    actual_array[10, 10] = (255, 0, 0)
+    metrics = image_cache_tester.compare_arrays.compare_arrays(actual_array, actual_array.copy())
+    assert metrics.passed
+    assert metrics.differing_pixels == 0
+    assert metrics.rmse == 0
+    assert metrics.psnr == math.inf
+    assert metrics.complete
+
+
+def test_compare_arrays_single_pixel_failure() -> None:
+    """Test that a single differing pixel fails the comparison when no tolerance is provided."""
+    actual_array = np.zeros((50, 50, 3), dtype=np.uint8)
+    expected_array = actual_array.copy()
+    actual_array[0, 0] = (1, 0, 0)
+    metrics = image_cache_tester.compare_arrays.compare_arrays(actual_array, expected_array)
+    assert not metrics.passed
+    assert metrics.differing_pixels == 1
+    assert metrics.differing_fraction == 1 / 2500
+
+
+def test_compare_arrays_early_exit() -> None:
+    """Test that the comparison stops at the first row block exceeding the tolerances."""
+    actual_array = np.zeros((100, 10, 3), dtype=np.uint8)
+    expected_array = np.full((100, 10, 3), 255, dtype=np.uint8)
+    metrics = image_cache_tester.compare_arrays.compare_arrays(actual_array, expected_array, block_rows=10)
+    assert not metrics.passed
+    assert not metrics.complete
+    assert metrics.differing_pixels == 100
+
+
+def test_compare_arrays_channel_threshold() -> None:
+    """Test that differences below the channel threshold are ignored."""
+    actual_array = np.full((50, 50, 3), 100, dtype=np.uint8)
+    expected_array = actual_array.copy()
+    expected_array[:, :, 1] = 102
+    tolerances = image_cache_tester.compare_arrays.Tolerances(channel_threshold=2)
+    metrics = image_cache_tester.compare_arrays.compare_arrays(actual_array, expected_array, tolerances)
+    assert metrics.passed
+    assert metrics.differing_pixels == 0
+    assert metrics.rmse == pytest.approx(math.sqrt(4 / 3))
+    tolerances = image_cache_tester.compare_arrays.Tolerances(channel_threshold=1)
+    metrics = image_cache_tester.compare_arrays.compare_arrays(actual_array, expected_array, tolerances)
+    assert not metrics.passed
+
+
+def test_compare_arrays_max_differing_fraction() -> None:
+    """Test that a comparison passes as long as the fraction of differing pixels is small enough."""
+    actual_array = np.zeros((10, 10, 3), dtype=np.uint8)
+    expected_array = actual_array.copy()
+    expected_array[0, :2] = 255
+    tolerances = image_cache_tester.compare_arrays.Tolerances(max_differing_fraction=0.02)
+    metrics = image_cache_tester.compare_arrays.compare_arrays(actual_array, expected_array, tolerances)
+    assert metrics.passed
+    assert metrics.differing_pixels == 2
+    expected_array[0, 2] = 255
+    metrics = image_cache_tester.compare_arrays.compare_arrays(actual_array, expected_array, tolerances)
+    assert not metrics.passed
+    assert metrics.differing_pixels == 3
+
+
+def test_compare_arrays_rmse_and_psnr() -> None:
+    """Test that root mean square error and peak signal-to-noise ratio tolerances are enforced."""
+    actual_array = np.full((20, 20, 3), 10, dtype=np.uint8)
+    expected_array = np.full((20, 20, 3), 14, dtype=np.uint8)
+    metrics = image_cache_tester.compare_arrays.compare_arrays(
+        actual_array, expected_array, image_cache_tester.compare_arrays.Tolerances(channel_threshold=255, max_rmse=4))
+    assert metrics.passed
+    assert metrics.rmse == 4
+    assert metrics.psnr == pytest.approx(20 * math.log10(255 / 4))
+    metrics = image_cache_tester.compare_arrays.compare_arrays(
+        actual_array, expected_array, image_cache_tester.compare_arrays.Tolerances(channel_threshold=255, max_rmse=3))
+    assert not metrics.passed
+    metrics = image_cache_tester.compare_arrays.compare_arrays(
+        actual_array, expected_array, image_cache_tester.compare_arrays.Tolerances(channel_threshold=255, min_psnr=40))
+    assert not metrics.passed
+    metrics = image_cache_tester.compare_arrays.compare_arrays(
+        actual_array, expected_array, image_cache_tester.compare_arrays.Tolerances(channel_threshold=255, min_psnr=30))
+    assert metrics.passed
+
+
+def test_compare_arrays_mask() -> None:
+    """Test that pixels outside of the mask are ignored, and that fractions refer to the masked pixels."""
+    actual_array = np.zeros((50, 50, 3), dtype=np.uint8)
+    expected_array = actual_array.copy()
+    expected_array[:10, :10] = 255
+    expected_array[20, 20] = (1, 0, 0)
+    mask = np.ones((50, 50), dtype=bool)
+    mask[:10, :10] = False
+    metrics = image_cache_tester.compare_arrays.compare_arrays(actual_array, expected_array, mask=mask)
+    assert not metrics.passed
+    assert metrics.differing_pixels == 1
+    assert metrics.differing_fraction == 1 / 2400
+    mask[20, 20] = False
+    metrics = image_cache_tester.compare_arrays.compare_arrays(actual_array, expected_array, mask=mask)
+    assert metrics.passed
+    assert metrics.rmse == 0
+    roi = np.zeros((50, 50), dtype=bool)
+    roi[15:25, 15:25] = True
+    metrics = image_cache_tester.compare_arrays.compare_arrays(actual_array, expected_array, mask=roi)
+    assert metrics.differing_pixels == 1
+    assert metrics.differing_fraction == 1 / 100
+    assert metrics.rmse == pytest.approx(math.sqrt(1 / 300))
+    metrics = image_cache_tester.compare_arrays.compare_arrays(
+        actual_array, expected_array, mask=np.zeros((50, 50), dtype=bool))
+    assert metrics.passed
+    assert metrics.differing_fraction == 0
+
+
+def test_difference_array() -> None:
+    """Test that the difference array does not wrap around when the actual value is smaller than the expected one."""
+    actual_array = np.array([[[0, 200, 30]]], dtype=np.uint8)
+    expected_array = np.array([[[255, 100, 30]]], dtype=np.uint8)
+    difference = image_cache_tester.compare_arrays.difference_array(actual_array, expected_array)
+    assert difference.dtype == np.uint8
+    assert np.array_equal(difference, np.array([[[255, 100, 0]]], dtype=np.uint8))
@@ -0,0 +1,113 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Tests for image_cache_tester.compare_batch module."""
+
+import os
+import tempfile
+
+import PIL.Image
+import pytest
+
+import image_cache_tester.compare_batch
+import image_cache_tester.decoded_image_cache
+
+
+@pytest.mark.parametrize("executor", ["process", "thread"])
+def test_compare_batch(executor: str) -> None:
+    """Test that every pair in a batch is compared, independently of the others."""
+    with tempfile.TemporaryDirectory() as images_dir:
+        pairs = []
+        for index in range(6):
+            actual_image_path = os.path.join(images_dir, f"actual_{index}.png")
+            expected_image_path = os.path.join(images_dir, f"expected_{index}.png")
+            image = PIL.Image.new("RGB", (50, 50))
+            image.save(expected_image_path)
+            if index % 2 == 1:
+                image.putpixel((index, index), (255, 0, 0))
+            image.save(actual_image_path)
+            pairs.append((actual_image_path, expected_image_path))
+        results = {
+            result.actual_image_path: result for result in image_cache_tester.compare_batch.compare_batch(
+                iter(pairs), max_workers=2, executor=executor)
+        }
+        assert len(results) == len(pairs)
+        for (index, (actual_image_path, expected_image_path)) in enumerate(pairs):
+            result = results[actual_image_path]
+            assert result.expected_image_path == expected_image_path
+            assert result.error is None
+            assert result.metrics is not None
+            assert result.passed == (index % 2 == 0)
+            assert result.metrics.differing_pixels == index % 2
+
+
+def test_compare_batch_missing_images() -> None:
+    """Test that a missing image is reported as an error rather than raising an exception."""
+    with tempfile.TemporaryDirectory() as images_dir:
+        existing_image_path = os.path.join(images_dir, "existing.png")
+        PIL.Image.new("RGB", (50, 50)).save(existing_image_path)
+        missing_image_path = os.path.join(images_dir, "missing.png")
+        results = list(image_cache_tester.compare_batch.compare_batch(
+            [(missing_image_path, existing_image_path), (existing_image_path, missing_image_path)],
+            executor="thread"))
+        assert len(results) == 2
+        for result in results:
+            assert not result.passed
+            assert result.metrics is None
+            assert result.error == f"{missing_image_path} does not exist"
+
+
+@pytest.mark.parametrize("executor", ["process", "thread"])
+def test_compare_batch_corrupt_image(executor: str) -> None:
+    """Test that an image which cannot be decoded is reported as an error without aborting the batch."""
+    with tempfile.TemporaryDirectory() as images_dir:
+        pairs = []
+        for index in range(5):
+            actual_image_path = os.path.join(images_dir, f"actual_{index}.png")
+            expected_image_path = os.path.join(images_dir, f"expected_{index}.png")
+            PIL.Image.new("RGB", (50, 50)).save(expected_image_path)
+            if index == 2:
+                with open(actual_image_path, "wb") as f:
+                    f.write(b"\x89PNG\r\n\x1a\n" + b"corrupt")
+            else:
+                PIL.Image.new("RGB", (50, 50)).save(actual_image_path)
+            pairs.append((actual_image_path, expected_image_path))
+        results = {
+            result.actual_image_path: result for result in image_cache_tester.compare_batch.compare_batch(
+                pairs, max_workers=2, executor=executor)
+        }
+        assert len(results) == len(pairs)
+        for (index, (actual_image_path, _)) in enumerate(pairs):
+            result = results[actual_image_path]
+            if index == 2:
+                assert not result.passed
+                assert result.metrics is None
+                assert result.error is not None
+                assert actual_image_path in result.error
+            else:
+                assert result.passed
+                assert result.error is None
+
+
+def test_compare_batch_bypasses_decoded_image_cache() -> None:
+    """Test that expected images compared in a batch are not stored in the cache of decoded expected images."""
+    with tempfile.TemporaryDirectory() as images_dir:
+        actual_image_path = os.path.join(images_dir, "actual.png")
+        expected_image_path = os.path.join(images_dir, "expected.png")
+        PIL.Image.new("RGB", (50, 50)).save(expected_image_path)
+        PIL.Image.new("RGB", (50, 50), (255, 0, 0)).save(actual_image_path)
+        image_cache_tester.decoded_image_cache.expected_images.clear()
+        (result, ) = image_cache_tester.compare_batch.compare_batch(
+            [(actual_image_path, expected_image_path)], executor="thread")
+        assert not result.passed
+        assert len(image_cache_tester.decoded_image_cache.expected_images) == 0
+        assert image_cache_tester.decoded_image_cache.expected_images.misses == 0
+
+
+def test_compare_batch_invalid_executor() -> None:
+    """Test that an invalid executor is rejected."""
+    with pytest.raises(ValueError) as excinfo:
+        list(image_cache_tester.compare_batch.compare_batch([], executor="cluster"))
+    assert str(excinfo.value) == "Invalid executor cluster: expected either process or thread"
@@ -8,6 +8,8 @@
 import contextlib
 import io
 import os
+import subprocess
+import sys
 import tempfile
 
 import numpy as np
@@ -15,6 +17,8 @@ import PIL
 import pytest
 import pyvista
 
+import image_cache_tester.artifact_writer
+import image_cache_tester.compare_arrays
 import image_cache_tester.compare_images
 
 
@@ -58,6 +62,27 @@ def test_compare_images_single_pixel_failure(image_cache: str) -> None:
         stdout_buffer.close()
 
 
+def test_compare_images_single_pixel_tolerance(image_cache: str) -> None:
+    """Test that two images with a single non-zero pixel in different positions are within tolerances."""
+    expected_image_path = os.path.join(image_cache, "test_compare_images_single_pixel_failure.png")
+    assert os.path.exists(expected_image_path)
+    with tempfile.NamedTemporaryFile(suffix=".png") as actual_image_file:
+        actual_image_path = actual_image_file.name
+        actual_image = PIL.Image.new("RGB", (50, 50))
+        actual_image.putpixel((1, 1), (255, 0, 0))
+        actual_image.save(actual_image_path)
+        stdout_buffer = io.StringIO()
+        with contextlib.redirect_stdout(stdout_buffer):
+            comparison = image_cache_tester.compare_images._compare_images(
+                actual_image_path, expected_image_path, True,
+                tolerances=image_cache_tester.compare_arrays.Tolerances(max_differing_fraction=0.001))
+        assert comparison.passed
+        assert comparison.metrics.differing_pixels == 2
+        assert comparison.difference_image.getbbox() == (0, 0, 2, 2)
+        assert stdout_buffer.getvalue() == ""
+        stdout_buffer.close()
+
+
 def test_compare_images_expected_not_existing(image_cache: str) -> None:
     """Test that image comparison fails when the expected image does not exist."""
     expected_image_path = os.path.join(image_cache, "test_compare_images_expected_not_existing.png")
@@ -160,3 +185,64 @@ def test_compare_images_pyvista_failure(image_cache: str) -> None:
             f"Bounding box for difference between {plotter_screenshot_path} and {expected_image_path} "
             f"is {difference_image.getbbox()}")
         stdout_buffer.close()
+
+
+@pytest.mark.parametrize("display", [True, False])
+@pytest.mark.filterwarnings("ignore:Not within a jupyter notebook environment")
+def test_compare_images_pyvista_success_in_memory(image_cache: str, display: bool) -> None:
+    """Test that an in-memory screenshot matching the cached one is never saved to disk."""
+    expected_image_path = os.path.join(image_cache, "test_compare_images_pyvista_success.png")
+    assert os.path.exists(expected_image_path)
+    with tempfile.NamedTemporaryFile(suffix=".png") as plotter_screenshot_file:
+        plotter_screenshot_path = plotter_screenshot_file.name
+        plotter = pyvista.Plotter(off_screen=True, window_size=[1024, 768])
+        assert plotter.ren_win is not None
+        assert plotter.ren_win.GetClassName() == "vtkEGLRenderWindow", (
+            "Did you forget to export VTK_DEFAULT_OPENGL_WINDOW=vtkEGLRenderWindow ?")
+        plotter.add_mesh(pyvista.Sphere(start_phi=0, end_phi=90))
+        stdout_buffer = io.StringIO()
+        with contextlib.redirect_stdout(stdout_buffer):
+            plotter_screenshot, expected_image, difference_image = image_cache_tester.compare_images.compare_images(
+                plotter, plotter_screenshot_path, expected_image_path, True, in_memory=True, display=display)
+        image_cache_tester.artifact_writer.writer.flush()
+        assert np.array_equal(np.asarray(plotter_screenshot), np.asarray(expected_image))
+        assert difference_image.getbbox() is None
+        assert os.path.getsize(plotter_screenshot_path) == 0
+        assert stdout_buffer.getvalue() == ""
+        stdout_buffer.close()
+
+
+def test_compare_images_pyvista_failure_in_memory(image_cache: str) -> None:
+    """Test that an in-memory screenshot differing from the cached one is saved to disk."""
+    expected_image_path = os.path.join(image_cache, "test_compare_images_pyvista_failure.png")
+    assert os.path.exists(expected_image_path)
+    with tempfile.NamedTemporaryFile(suffix=".png") as plotter_screenshot_file:
+        plotter_screenshot_path = plotter_screenshot_file.name
+        plotter = pyvista.Plotter(off_screen=True, window_size=[1024, 768])
+        assert plotter.ren_win is not None
+        assert plotter.ren_win.GetClassName() == "vtkEGLRenderWindow", (
+            "Did you forget to export VTK_DEFAULT_OPENGL_WINDOW=vtkEGLRenderWindow ?")
+        plotter.add_mesh(pyvista.Sphere(start_phi=90, end_phi=180))
+        stdout_buffer = io.StringIO()
+        with contextlib.redirect_stdout(stdout_buffer):
+            plotter_screenshot, _expected_image, difference_image = image_cache_tester.compare_images.compare_images(
+                plotter, plotter_screenshot_path, expected_image_path, True, in_memory=True)
+        image_cache_tester.artifact_writer.writer.flush()
+        assert difference_image.getbbox() == (248, 160, 775, 653)
+        assert np.array_equal(
+            np.asarray(PIL.Image.open(plotter_screenshot_path).convert("RGB")), np.asarray(plotter_screenshot))
+        assert stdout_buffer.getvalue().strip("\n") == (
+            f"Bounding box for difference between {plotter_screenshot_path} and {expected_image_path} "
+            f"is {difference_image.getbbox()}")
+        stdout_buffer.close()
+
+
+def test_compare_images_import_is_lazy() -> None:
+    """Test that importing the package does not import modules which are slow to load."""
+    modules = subprocess.check_output([
+        sys.executable, "-c",
+        "import sys; import image_cache_tester.compare_images, image_cache_tester.image_dedup, "
+        "image_cache_tester.rank_verdicts; print(' '.join(sys.modules))"
+    ], text=True).split()
+    assert "pyvista" not in modules
+    assert "mpi4py" not in modules
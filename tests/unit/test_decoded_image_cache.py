@@ -0,0 +1,60 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Tests for image_cache_tester.decoded_image_cache module."""
+
+import os
+import tempfile
+
+import numpy as np
+import PIL.Image
+
+import image_cache_tester.decoded_image_cache
+
+
+def test_decoded_image_cache_hits_and_misses() -> None:
+    """Test that an image is decoded only once as long as it is not modified."""
+    cache = image_cache_tester.decoded_image_cache.DecodedImageCache(max_bytes=50 * 50 * 3)
+    with tempfile.TemporaryDirectory() as images_dir:
+        image_path = os.path.join(images_dir, "image.png")
+        image = PIL.Image.new("RGBA", (50, 50), (255, 0, 0, 255))
+        image.save(image_path)
+        first_image = cache.load(image_path)
+        second_image = cache.load(image_path)
+        assert first_image is second_image
+        assert first_image.mode == "RGB"
+        assert (cache.hits, cache.misses, len(cache), cache.current_bytes) == (1, 1, 1, 50 * 50 * 3)
+        image = PIL.Image.new("RGB", (50, 50), (0, 255, 0))
+        image.save(image_path)
+        image_stat = os.stat(image_path)
+        os.utime(image_path, ns=(image_stat.st_atime_ns, image_stat.st_mtime_ns + 10**9))
+        third_image = cache.load(image_path)
+        assert np.array_equal(np.asarray(third_image), np.asarray(image))
+        assert (cache.hits, cache.misses, len(cache), cache.current_bytes) == (1, 2, 1, 50 * 50 * 3)
+
+
+def test_decoded_image_cache_eviction() -> None:
+    """Test that least recently used images are evicted when exceeding the size limit."""
+    cache = image_cache_tester.decoded_image_cache.DecodedImageCache(max_bytes=2 * 10 * 10 * 3)
+    with tempfile.TemporaryDirectory() as images_dir:
+        image_paths = [os.path.join(images_dir, f"image_{index}.png") for index in range(3)]
+        for image_path in image_paths:
+            PIL.Image.new("RGB", (10, 10)).save(image_path)
+        cache.load(image_paths[0])
+        cache.load(image_paths[1])
+        cache.load(image_paths[0])
+        cache.load(image_paths[2])
+        assert (cache.hits, cache.misses, len(cache)) == (1, 3, 2)
+        cache.load(image_paths[0])
+        assert cache.hits == 2
+        cache.load(image_paths[1])
+        assert cache.misses == 4
+        large_image_path = os.path.join(images_dir, "large.png")
+        PIL.Image.new("RGB", (20, 20)).save(large_image_path)
+        cache.load(large_image_path)
+        assert len(cache) == 2
+        assert cache.current_bytes == 2 * 10 * 10 * 3
+        cache.clear()
+        assert (cache.hits, cache.misses, len(cache), cache.current_bytes) == (0, 0, 0, 0)
@@ -0,0 +1,156 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Tests for image_cache_tester.image_cache_manifest module."""
+
+import json
+import os
+import tempfile
+import typing
+
+import numpy as np
+import PIL.Image
+import pytest
+
+import image_cache_tester.compare_images
+import image_cache_tester.image_cache_manifest
+
+
+def test_image_cache_manifest_record_and_lookup() -> None:
+    """Test that a recorded digest is returned by lookup until the image changes."""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        image_path = os.path.join(cache_dir, "image.png")
+        image = PIL.Image.new("RGB", (50, 50))
+        image.putpixel((0, 0), (255, 0, 0))
+        image.save(image_path)
+        assert image_cache_tester.image_cache_manifest.lookup(image_path) is None
+        image_cache_tester.image_cache_manifest.record(image_path, np.asarray(image))
+        assert os.path.exists(os.path.join(cache_dir, image_cache_tester.image_cache_manifest.manifest_name))
+        assert image_cache_tester.image_cache_manifest.lookup(image_path) == (
+            image_cache_tester.image_cache_manifest.pixel_digest(np.asarray(image)))
+        image.putpixel((1, 1), (255, 0, 0))
+        image.save(image_path)
+        assert image_cache_tester.image_cache_manifest.lookup(image_path) is None
+
+
+def test_image_cache_manifest_lookup_after_touch() -> None:
+    """Test that a change of modification time alone does not invalidate the manifest entry."""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        image_path = os.path.join(cache_dir, "image.png")
+        image = PIL.Image.new("RGB", (50, 50), (0, 255, 0))
+        image.save(image_path)
+        image_cache_tester.image_cache_manifest.record(image_path, np.asarray(image))
+        image_stat = os.stat(image_path)
+        os.utime(image_path, ns=(image_stat.st_atime_ns, image_stat.st_mtime_ns + 10**9))
+        assert image_cache_tester.image_cache_manifest.lookup(image_path) == (
+            image_cache_tester.image_cache_manifest.pixel_digest(np.asarray(image)))
+
+
+def test_image_cache_manifest_lookup_after_modification() -> None:
+    """Test that a change of content which preserves the size invalidates the manifest entry."""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        image_path = os.path.join(cache_dir, "image.png")
+        image = PIL.Image.new("RGB", (50, 50), (0, 255, 0))
+        image.save(image_path)
+        image_cache_tester.image_cache_manifest.record(image_path, np.asarray(image))
+        image_stat = os.stat(image_path)
+        with open(image_path, "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            last_byte = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last_byte[0] ^ 1]))
+        os.utime(image_path, ns=(image_stat.st_atime_ns, image_stat.st_mtime_ns + 10**9))
+        assert os.stat(image_path).st_size == image_stat.st_size
+        assert image_cache_tester.image_cache_manifest.lookup(image_path) is None
+
+
+def test_image_cache_manifest_lookup_after_removal() -> None:
+    """Test that the manifest is read from disk when needed, and that removing it invalidates all its entries."""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        image_path = os.path.join(cache_dir, "image.png")
+        image = PIL.Image.new("RGB", (50, 50), (0, 255, 0))
+        image.save(image_path)
+        image_cache_tester.image_cache_manifest.record(image_path, np.asarray(image))
+        assert image_cache_tester.image_cache_manifest.lookup(image_path) is not None
+        # The manifest is read again from disk once it is not cached anymore, e.g. in another process
+        image_cache_tester.image_cache_manifest._manifests.clear()
+        assert image_cache_tester.image_cache_manifest.lookup(image_path) is not None
+        os.remove(os.path.join(cache_dir, image_cache_tester.image_cache_manifest.manifest_name))
+        assert image_cache_tester.image_cache_manifest.lookup(image_path) is None
+
+
+def test_image_cache_manifest_record_unchanged(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that the manifest is not written again if the entry of an image is unchanged."""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        image_path = os.path.join(cache_dir, "image.png")
+        image = PIL.Image.new("RGB", (50, 50), (0, 255, 0))
+        image.save(image_path)
+        image_cache_tester.image_cache_manifest.record(image_path, np.asarray(image))
+
+        def fail_replace(source: str, destination: str) -> None:
+            """Fail on any attempt to replace the manifest."""
+            raise AssertionError(f"Unexpected replacement of {destination}")
+
+        monkeypatch.setattr(os, "replace", fail_replace)
+        image_cache_tester.image_cache_manifest.record(image_path, np.asarray(image))
+
+
+def test_image_cache_manifest_record_failure(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that a failure while writing the manifest leaves neither a temporary file nor a stale entry behind."""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        image_path = os.path.join(cache_dir, "image.png")
+        image = PIL.Image.new("RGB", (50, 50), (0, 255, 0))
+        image.save(image_path)
+        image_cache_tester.image_cache_manifest.record(image_path, np.asarray(image))
+        other_image_path = os.path.join(cache_dir, "other_image.png")
+        image.save(other_image_path)
+
+        def fail_dump(obj: object, fp: typing.IO[str], **kwargs: object) -> None:
+            """Fail while writing, as if the disk were full."""
+            fp.write("{")
+            raise OSError("No space left on device")
+
+        with monkeypatch.context() as context:
+            context.setattr(json, "dump", fail_dump)
+            with pytest.raises(OSError, match="No space left on device"):
+                image_cache_tester.image_cache_manifest.record(other_image_path, np.asarray(image))
+        assert sorted(os.listdir(cache_dir)) == sorted(
+            [image_cache_tester.image_cache_manifest.manifest_name, "image.png", "other_image.png"])
+        assert image_cache_tester.image_cache_manifest.lookup(other_image_path) is None
+        image_cache_tester.image_cache_manifest.record(other_image_path, np.asarray(image))
+        assert image_cache_tester.image_cache_manifest.lookup(other_image_path) is not None
+
+
+def test_image_cache_manifest_pixel_digest_shape() -> None:
+    """Test that the pixel digest depends on the image shape, and not only on the raw bytes."""
+    image_array = np.zeros((10, 20, 3), dtype=np.uint8)
+    assert image_cache_tester.image_cache_manifest.pixel_digest(image_array) != (
+        image_cache_tester.image_cache_manifest.pixel_digest(image_array.reshape(20, 10, 3)))
+
+
+def test_compare_images_with_digests(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that the expected image is not decoded when its digest matches the one of the actual image."""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        expected_image_path = os.path.join(cache_dir, "expected.png")
+        actual_image_path = os.path.join(cache_dir, "actual.png")
+        image = PIL.Image.new("RGB", (50, 50))
+        image.putpixel((0, 0), (255, 0, 0))
+        image.save(expected_image_path)
+        image.save(actual_image_path)
+        image_cache_tester.image_cache_manifest.record(expected_image_path, np.asarray(image))
+        opened_paths = []
+        original_open = PIL.Image.open
+
+        def open_and_log(path: str) -> PIL.Image.Image:
+            """Log which images are opened."""
+            opened_paths.append(path)
+            return original_open(path)
+
+        monkeypatch.setattr(PIL.Image, "open", open_and_log)
+        comparison = image_cache_tester.compare_images._compare_images(
+            actual_image_path, expected_image_path, True, use_digests=True)
+        assert comparison.passed
+        assert comparison.difference_image.getbbox() is None
+        assert opened_paths == [actual_image_path]
@@ -0,0 +1,142 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Tests for image_cache_tester.image_dedup module."""
+
+import collections.abc
+import os
+import shutil
+import tempfile
+
+import mpi4py.MPI
+import numpy as np
+import PIL.Image
+
+import image_cache_tester.compare_images
+import image_cache_tester.image_cache_manifest
+import image_cache_tester.image_dedup
+import image_cache_tester.image_pack
+import image_cache_tester.image_trees
+
+
+def _create_rank_images(cache_dir: str, colors: list[tuple[int, int, int]]) -> list[str]:
+    """Create an image for each rank, with the provided colors, and return their paths."""
+    image_paths = []
+    for (rank, color) in enumerate(colors):
+        leaf_dir = os.path.join(cache_dir, "nb", "real", f"comm_size={len(colors)}", f"comm_rank={rank}", "static")
+        os.makedirs(leaf_dir)
+        image_paths.append(os.path.join(leaf_dir, "cell.png"))
+        PIL.Image.new("RGB", (50, 50), color).save(image_paths[-1])
+    return image_paths
+
+
+def test_image_dedup_select_references() -> None:
+    """Test that each rank references the lowest rank with an identical image."""
+    assert image_cache_tester.image_dedup.select_references(["a", "b", "a", None, "b", "c"]) == [
+        None, None, 0, None, 1, None]
+
+
+def test_image_dedup_deduplicate_and_restore() -> None:
+    """Test that identical images are replaced by references which are resolved transparently."""
+    with tempfile.TemporaryDirectory() as root:
+        cache_dir = os.path.join(root, ".image_cache")
+        image_paths = _create_rank_images(cache_dir, [(255, 0, 0), (0, 255, 0), (255, 0, 0), (0, 255, 0)])
+        assert image_cache_tester.image_dedup.deduplicate_image_cache(cache_dir) == 2
+        assert [os.path.exists(image_path) for image_path in image_paths] == [True, True, False, False]
+        assert image_cache_tester.image_dedup.resolve(image_paths[2]) == image_paths[0]
+        assert image_cache_tester.image_dedup.resolve(image_paths[3]) == image_paths[1]
+        assert all(image_cache_tester.image_pack.exists(image_path) for image_path in image_paths)
+        assert image_cache_tester.image_trees.list_images(cache_dir) == {
+            os.path.relpath(image_path, cache_dir) for image_path in image_paths}
+        actual_image_path = os.path.join(root, "actual.png")
+        PIL.Image.new("RGB", (50, 50), (0, 255, 0)).save(actual_image_path)
+        assert image_cache_tester.compare_images._compare_images(actual_image_path, image_paths[3], False).passed
+        assert not image_cache_tester.compare_images._compare_images(actual_image_path, image_paths[2], False).passed
+        assert image_cache_tester.image_dedup.restore_image_cache(cache_dir) == 2
+        assert all(os.path.exists(image_path) for image_path in image_paths)
+        assert not any(
+            os.path.exists(image_path + image_cache_tester.image_dedup.reference_suffix) for image_path in image_paths)
+
+
+def test_image_dedup_pack_shares_blocks() -> None:
+    """Test that references are packed as images sharing the same block."""
+    with tempfile.TemporaryDirectory() as root:
+        cache_dir = os.path.join(root, ".image_cache")
+        _create_rank_images(cache_dir, [(255, 0, 0), (255, 0, 0)])
+        image_cache_tester.image_dedup.deduplicate_image_cache(cache_dir)
+        pack_path, = image_cache_tester.image_pack.pack_image_cache(cache_dir, "raw", remove=True)
+        with image_cache_tester.image_pack.ImagePack(pack_path) as pack:
+            first_entry, second_entry = [pack.index[key] for key in sorted(pack.index)]
+            assert first_entry["offset"] == second_entry["offset"]
+            assert all(
+                np.array_equal(pack.load_array(key), np.asarray(PIL.Image.new("RGB", (50, 50), (255, 0, 0))))
+                for key in pack.index)
+
+
+class _RankComm:
+    """Communicator emulating a rank of a larger one, on which the other ranks have already provided their data."""
+
+    def __init__(self, rank: int, other_ranks_digests: list[dict[str, str]]) -> None:
+        self.rank = rank
+        self._other_ranks_digests = other_ranks_digests
+
+    def allgather(self, digests: dict[str, str]) -> list[dict[str, str]]:
+        """Gather the digests of the current rank together with the digests of the other ranks."""
+        return [*self._other_ranks_digests[:self.rank], digests, *self._other_ranks_digests[self.rank:]]
+
+
+def _image_path_generator(cache_dir: str, size: int) -> collections.abc.Callable[[str, int], str]:
+    """Return a function generating the path of the image of a cell on a rank."""
+    def image_path_generator(cell_id: str, rank: int) -> str:
+        return os.path.join(
+            cache_dir, "nb", "real", f"comm_size={size}", f"comm_rank={rank}", "static", cell_id + ".png")
+
+    return image_path_generator
+
+
+def test_image_dedup_deduplicate_across_ranks() -> None:
+    """Test that identical images are replaced across the ranks of the world communicator."""
+    comm = mpi4py.MPI.COMM_WORLD
+    root = comm.bcast(tempfile.mkdtemp() if comm.rank == 0 else None, root=0)
+    try:
+        cache_dir = os.path.join(root, ".image_cache")
+        if comm.rank == 0:
+            _create_rank_images(cache_dir, [(255, 0, 0)] * comm.size)
+        comm.barrier()
+        image_path_generator = _image_path_generator(cache_dir, comm.size)
+        image_path = image_path_generator("cell", comm.rank)
+        # A reference left by a previous deduplication is stale, since the current rank stores its own image
+        if comm.rank == 0:
+            with open(image_path + image_cache_tester.image_dedup.reference_suffix, "w") as f:
+                f.write("stale.png\n")
+        digest = image_cache_tester.image_cache_manifest.pixel_digest(np.asarray(PIL.Image.open(image_path)))
+        replaced = image_cache_tester.image_dedup.deduplicate_across_ranks({"cell": digest}, image_path_generator)
+        assert replaced == (0 if comm.rank == 0 else 1)
+        assert os.path.exists(image_path) == (comm.rank == 0)
+        assert os.path.exists(image_path + image_cache_tester.image_dedup.reference_suffix) == (comm.rank != 0)
+        assert image_cache_tester.image_dedup.resolve(image_path) == image_path_generator("cell", 0)
+        comm.barrier()
+    finally:
+        if comm.rank == 0:
+            shutil.rmtree(root)
+
+
+def test_image_dedup_deduplicate_across_ranks_references() -> None:
+    """Test that each rank references the lowest rank with an identical image, and keeps its own otherwise."""
+    with tempfile.TemporaryDirectory() as root:
+        cache_dir = os.path.join(root, ".image_cache")
+        image_paths = _create_rank_images(cache_dir, [(255, 0, 0), (0, 255, 0), (255, 0, 0)])
+        digests = [
+            image_cache_tester.image_cache_manifest.pixel_digest(np.asarray(PIL.Image.open(image_path)))
+            for image_path in image_paths]
+        image_path_generator = _image_path_generator(cache_dir, 3)
+        for rank in (2, 1):
+            comm = _RankComm(
+                rank, [{"cell": digest} for (other_rank, digest) in enumerate(digests) if other_rank != rank])
+            replaced = image_cache_tester.image_dedup.deduplicate_across_ranks(
+                {"cell": digests[rank]}, image_path_generator, comm)  # type: ignore[arg-type]
+            assert replaced == (1 if rank == 2 else 0)
+        assert [os.path.exists(image_path) for image_path in image_paths] == [True, True, False]
+        assert image_cache_tester.image_dedup.resolve(image_paths[2]) == image_paths[0]
@@ -0,0 +1,69 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Tests for image_cache_tester.image_display module."""
+
+import os
+import tempfile
+
+import PIL.Image
+import pytest
+
+import image_cache_tester.compare_images
+import image_cache_tester.image_display
+
+
+def _compare(actual_color: tuple[int, int, int]) -> image_cache_tester.compare_images.ImageComparison:
+    """Compare a 400x200 image of the given color to a black one."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        actual_image_path = os.path.join(tmp_dir, "actual.png")
+        expected_image_path = os.path.join(tmp_dir, "expected.png")
+        PIL.Image.new("RGB", (400, 200)).save(expected_image_path)
+        PIL.Image.new("RGB", (400, 200), actual_color).save(actual_image_path)
+        comparison = image_cache_tester.compare_images._compare_images(actual_image_path, expected_image_path, False)
+        comparison.expected_image.load()
+    return comparison
+
+
+def test_display_items_passed() -> None:
+    """Test that only the actual image is displayed if the verification passed, unless it is hidden."""
+    comparison = _compare((0, 0, 0))
+    items = image_cache_tester.image_display.display_items(comparison)
+    assert items == ["Actual screenshot", comparison.actual_image]
+    assert image_cache_tester.image_display.display_items(comparison, "composite", display_passed=False) == []
+
+
+def test_display_items_passed_composite_title() -> None:
+    """Test that the composite title of a passed verification does not point to full resolution images."""
+    items = image_cache_tester.image_display.display_items(_compare((0, 0, 0)), "composite", thumbnail_size=100)
+    assert items[0] == "Actual screenshot"
+    assert isinstance(items[1], PIL.Image.Image)
+    assert items[1].size == (100, 50)
+
+
+@pytest.mark.parametrize("mode", ["full", "thumbnails", "composite"])
+def test_display_items_failed(mode: str) -> None:
+    """Test that the size of displayed images on failure is bounded by the thumbnail size, except in full mode."""
+    comparison = _compare((255, 0, 0))
+    items = image_cache_tester.image_display.display_items(comparison, mode, thumbnail_size=100)
+    titles = [item for item in items if isinstance(item, str)]
+    sizes = [item.size for item in items if isinstance(item, PIL.Image.Image)]
+    if mode == "full":
+        assert titles == ["Actual screenshot", "Expected screenshot", "Difference between screenshots"]
+        assert sizes == [(400, 200)] * 3
+    elif mode == "thumbnails":
+        assert len(titles) == 3
+        assert sizes == [(100, 50)] * 3
+    else:
+        assert titles == [
+            "Actual screenshot, Expected screenshot, Difference between screenshots "
+            "(call display_full_images for full resolution images)"]
+        assert sizes == [(300, 50)]
+
+
+def test_display_items_invalid_mode() -> None:
+    """Test that an invalid display mode is rejected."""
+    with pytest.raises(ValueError, match="Invalid display mode"):
+        image_cache_tester.image_display.display_items(_compare((0, 0, 0)), "none")
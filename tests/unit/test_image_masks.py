@@ -0,0 +1,98 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Tests for image_cache_tester.image_masks module."""
+
+import os
+import tempfile
+
+import numpy as np
+import PIL.Image
+import pytest
+
+import image_cache_tester.compare_images
+import image_cache_tester.image_masks
+import image_cache_tester.image_pack
+import image_cache_tester.image_trees
+
+
+def test_parse_regions() -> None:
+    """Test parsing of the regions declared through cell markers."""
+    regions = image_cache_tester.image_masks.parse_regions(
+        "# PYTEST_IMAGE_ROI: 0, 0, 40, 30\nplotter.show()\n# PYTEST_IMAGE_IGNORE: 30,20,40,30\n")
+    assert regions == image_cache_tester.image_masks.Regions(((0, 0, 40, 30), ), ((30, 20, 40, 30), ))
+    mask = regions.to_mask(40, 50)
+    assert mask.sum() == 40 * 30 - 10 * 10
+    assert not mask[25, 35] and mask[0, 0] and not mask[35, 45]
+    assert not image_cache_tester.image_masks.parse_regions("plotter.show()")
+    with pytest.raises(ValueError, match="the region is empty"):
+        image_cache_tester.image_masks.parse_regions("# PYTEST_IMAGE_ROI: 10, 0, 10, 30")
+
+
+@pytest.mark.parametrize("packed", [False, True])
+@pytest.mark.parametrize("memory_limit", [None, 2**20])
+def test_mask_stored_next_to_expected_image(packed: bool, memory_limit: int | None) -> None:
+    """Test that the mask stored next to the expected image restricts the comparison, also in strips."""
+    with tempfile.TemporaryDirectory() as root:
+        cache_dir = os.path.join(root, ".image_cache")
+        leaf_dir = os.path.join(cache_dir, "nb", "real", "comm_size=1", "comm_rank=0", "static")
+        os.makedirs(leaf_dir)
+        expected_image_path = os.path.join(leaf_dir, "cell.png")
+        PIL.Image.new("RGB", (50, 40), (0, 0, 255)).save(expected_image_path)
+        actual_image = PIL.Image.new("RGB", (50, 40), (0, 0, 255))
+        actual_image.paste((255, 255, 255), (0, 0, 20, 10))
+        actual_image_path = os.path.join(root, "actual.png")
+        actual_image.save(actual_image_path)
+        mask = PIL.Image.new("RGB", (50, 40), (255, 255, 255))
+        mask.paste((0, 0, 0), (0, 0, 20, 10))
+        mask.save(image_cache_tester.image_masks.mask_path(expected_image_path))
+        if packed:
+            image_cache_tester.image_pack.pack_image_cache(cache_dir, remove=True)
+        assert image_cache_tester.image_trees.list_images(cache_dir) == {
+            os.path.relpath(expected_image_path, cache_dir)}
+        comparison = image_cache_tester.compare_images._compare_images(
+            actual_image_path, expected_image_path, False, memory_limit=memory_limit)
+        assert comparison.passed
+        assert comparison.metrics.differing_fraction == 0
+        comparison = image_cache_tester.compare_images._compare_images(
+            actual_image_path, expected_image_path, False, memory_limit=memory_limit,
+            regions=image_cache_tester.image_masks.Regions(include=((0, 0, 50, 40), ), exclude=((40, 30, 50, 40), )))
+        assert comparison.passed
+        actual_image.putpixel((45, 5), (0, 0, 0))
+        actual_image.save(actual_image_path)
+        comparison = image_cache_tester.compare_images._compare_images(
+            actual_image_path, expected_image_path, False, memory_limit=memory_limit)
+        assert not comparison.passed
+        assert comparison.metrics.differing_pixels == 1
+        assert comparison.difference_image.getbbox() == (45, 5, 46, 6)
+        comparison = image_cache_tester.compare_images._compare_images(
+            actual_image_path, expected_image_path, False, memory_limit=memory_limit,
+            regions=image_cache_tester.image_masks.Regions(exclude=((40, 0, 50, 10), )))
+        assert comparison.passed
+        stored_mask = image_cache_tester.image_masks.build_mask(
+            expected_image_path, image_cache_tester.image_masks.Regions(), 40, 50)
+        assert stored_mask is not None
+        assert np.array_equal(stored_mask, np.asarray(mask).any(axis=2))
+
+
+@pytest.mark.parametrize("packed", [False, True])
+@pytest.mark.parametrize("memory_limit", [None, 2**20])
+def test_mask_with_wrong_size(packed: bool, memory_limit: int | None) -> None:
+    """Test that a mask whose size differs from the one of the image is rejected."""
+    with tempfile.TemporaryDirectory() as root:
+        cache_dir = os.path.join(root, ".image_cache")
+        leaf_dir = os.path.join(cache_dir, "nb", "real", "comm_size=1", "comm_rank=0", "static")
+        os.makedirs(leaf_dir)
+        expected_image_path = os.path.join(leaf_dir, "cell.png")
+        PIL.Image.new("RGB", (50, 40)).save(expected_image_path)
+        PIL.Image.new("RGB", (40, 50), (255, 255, 255)).save(
+            image_cache_tester.image_masks.mask_path(expected_image_path))
+        actual_image_path = os.path.join(root, "actual.png")
+        PIL.Image.new("RGB", (50, 40), (255, 255, 255)).save(actual_image_path)
+        if packed:
+            image_cache_tester.image_pack.pack_image_cache(cache_dir, remove=True)
+        with pytest.raises(ValueError, match=r"is \(40, 50\), while size of the image is \(50, 40\)"):
+            image_cache_tester.compare_images._compare_images(
+                actual_image_path, expected_image_path, False, memory_limit=memory_limit)
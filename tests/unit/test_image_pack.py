@@ -0,0 +1,171 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Tests for image_cache_tester.image_pack module."""
+
+import os
+import tempfile
+
+import numpy as np
+import PIL.Image
+import pytest
+
+import image_cache_tester.compare_images
+import image_cache_tester.image_pack
+import image_cache_tester.image_trees
+
+
+def _create_image_cache(cache_dir: str) -> tuple[str, PIL.Image.Image]:
+    """Create an image cache containing a single image, and return the image path and content."""
+    leaf_dir = os.path.join(cache_dir, "nb", "real", "comm_size=1", "comm_rank=0", "static")
+    os.makedirs(leaf_dir)
+    image = PIL.Image.new("RGB", (50, 40), (0, 0, 255))
+    image.putpixel((3, 4), (255, 0, 0))
+    image_path = os.path.join(leaf_dir, "cell.png")
+    image.save(image_path)
+    return image_path, image
+
+
+@pytest.mark.parametrize("compression", ["raw", "zlib"])
+def test_image_pack_round_trip(compression: str) -> None:
+    """Test that packing and unpacking an image cache preserves its images."""
+    with tempfile.TemporaryDirectory() as root:
+        cache_dir = os.path.join(root, ".image_cache")
+        image_path, image = _create_image_cache(cache_dir)
+        pack_paths = image_cache_tester.image_pack.pack_image_cache(cache_dir, compression, remove=True)
+        assert pack_paths == [os.path.join(cache_dir, "nb.pack")]
+        assert not os.path.exists(image_path)
+        with image_cache_tester.image_pack.ImagePack(pack_paths[0]) as pack:
+            key = "real/comm_size=1/comm_rank=0/static/cell.png"
+            assert list(pack.index) == [key]
+            image_array = pack.load_array(key)
+            assert image_array.shape == (40, 50, 3)
+            assert not image_array.flags.writeable
+            assert np.array_equal(image_array, np.asarray(image))
+            del image_array
+        image_cache_tester.image_pack.unpack_image_cache(cache_dir, remove=True)
+        assert not os.path.exists(pack_paths[0])
+        assert np.array_equal(np.asarray(PIL.Image.open(image_path)), np.asarray(image))
+
+
+def test_image_pack_preserves_existing_images() -> None:
+    """Test that packing again folds new images of the directory layout into the existing pack."""
+    with tempfile.TemporaryDirectory() as root:
+        cache_dir = os.path.join(root, ".image_cache")
+        image_path, _ = _create_image_cache(cache_dir)
+        image_cache_tester.image_pack.pack_image_cache(cache_dir, remove=True)
+        os.makedirs(os.path.dirname(image_path))
+        PIL.Image.new("RGB", (50, 40)).save(image_path.replace("cell.png", "other_cell.png"))
+        pack_path, = image_cache_tester.image_pack.pack_image_cache(cache_dir, remove=True)
+        with image_cache_tester.image_pack.ImagePack(pack_path) as pack:
+            assert sorted(pack.index) == [
+                "real/comm_size=1/comm_rank=0/static/cell.png", "real/comm_size=1/comm_rank=0/static/other_cell.png"]
+
+
+@pytest.mark.parametrize("compression", ["raw", "zlib"])
+def test_image_pack_merges_existing_pack(compression: str) -> None:
+    """Test that images of an existing pack are preserved when packing again, whatever their compression."""
+    with tempfile.TemporaryDirectory() as root:
+        cache_dir = os.path.join(root, ".image_cache")
+        image_path, image = _create_image_cache(cache_dir)
+        image_cache_tester.image_pack.pack_image_cache(cache_dir, "zlib", remove=True)
+        os.makedirs(os.path.dirname(image_path))
+        image.save(image_path.replace("cell.png", "same_cell.png"))
+        PIL.Image.new("RGB", (50, 40)).save(image_path.replace("cell.png", "other_cell.png"))
+        pack_path, = image_cache_tester.image_pack.pack_image_cache(cache_dir, compression, remove=True)
+        assert not os.path.exists(pack_path + ".tmp")
+        key = "real/comm_size=1/comm_rank=0/static/cell.png"
+        with image_cache_tester.image_pack.ImagePack(pack_path) as pack:
+            assert sorted(pack.index) == [key, key.replace("cell", "other_cell"), key.replace("cell", "same_cell")]
+            assert all(entry["compression"] == compression for entry in pack.index.values())
+            assert pack.index[key]["offset"] == pack.index[key.replace("cell", "same_cell")]["offset"]
+            assert pack.index[key]["offset"] != pack.index[key.replace("cell", "other_cell")]["offset"]
+            assert np.array_equal(pack.load_array(key), np.asarray(image))
+            assert not pack.load_array(key.replace("cell", "other_cell")).any()
+
+
+def test_image_pack_failed_write_preserves_existing_pack() -> None:
+    """Test that a pack is left untouched if an image of the directory cannot be decoded."""
+    with tempfile.TemporaryDirectory() as root:
+        cache_dir = os.path.join(root, ".image_cache")
+        image_path, _ = _create_image_cache(cache_dir)
+        pack_path, = image_cache_tester.image_pack.pack_image_cache(cache_dir, remove=True)
+        with open(pack_path, "rb") as f:
+            pack_content = f.read()
+        os.makedirs(os.path.dirname(image_path))
+        with open(image_path.replace("cell.png", "corrupt_cell.png"), "wb") as f:
+            f.write(b"corrupt")
+        with pytest.raises(PIL.UnidentifiedImageError):
+            image_cache_tester.image_pack.pack_image_cache(cache_dir)
+        assert not os.path.exists(pack_path + ".tmp")
+        with open(pack_path, "rb") as f:
+            assert f.read() == pack_content
+
+
+def test_image_pack_open_pack_closes_stale_pack() -> None:
+    """Test that a pack which changed on disk is opened again, closing the previous version when unused."""
+    with tempfile.TemporaryDirectory() as root:
+        cache_dir = os.path.join(root, ".image_cache")
+        _create_image_cache(cache_dir)
+        pack_path, = image_cache_tester.image_pack.pack_image_cache(cache_dir, "raw")
+        key = "real/comm_size=1/comm_rank=0/static/cell.png"
+        pack = image_cache_tester.image_pack.open_pack(pack_path)
+        assert pack is not None
+        assert image_cache_tester.image_pack.open_pack(pack_path) is pack
+        # The previous version is kept open while an array is a view of its memory map
+        image_array = pack.load_array(key)
+        image_cache_tester.image_pack.pack_image_cache(cache_dir, "raw")
+        os.utime(pack_path, ns=(0, 0))
+        other_pack = image_cache_tester.image_pack.open_pack(pack_path)
+        assert other_pack is not None and other_pack is not pack
+        assert not pack._mmap.closed
+        del image_array
+        # The previous version is closed as soon as it is replaced, if unused
+        image_cache_tester.image_pack.pack_image_cache(cache_dir, "raw")
+        os.utime(pack_path, ns=(1, 1))
+        assert image_cache_tester.image_pack.open_pack(pack_path) is not other_pack
+        assert other_pack._mmap.closed
+        image_cache_tester.image_pack._packs.pop(pack_path)[1].close()
+
+
+def test_image_pack_lookup_from_expected_image_path() -> None:
+    """Test that images are read from the pack when the expected image path does not exist."""
+    with tempfile.TemporaryDirectory() as root:
+        cache_dir = os.path.join(root, ".image_cache")
+        image_path, image = _create_image_cache(cache_dir)
+        actual_image_path = os.path.join(root, "actual.png")
+        image.save(actual_image_path)
+        image_cache_tester.image_pack.pack_image_cache(cache_dir, "raw", remove=True)
+        assert image_cache_tester.image_pack.exists(image_path)
+        assert not image_cache_tester.image_pack.exists(image_path.replace("cell.png", "other_cell.png"))
+        assert image_cache_tester.image_trees.list_images(cache_dir) == {os.path.relpath(image_path, cache_dir)}
+        for use_digests in (False, True):
+            comparison = image_cache_tester.compare_images._compare_images(
+                actual_image_path, image_path, False, use_digests=use_digests)
+            assert comparison.passed
+        PIL.Image.new("RGB", (50, 40)).save(actual_image_path)
+        comparison = image_cache_tester.compare_images._compare_images(actual_image_path, image_path, False)
+        assert not comparison.passed
+        assert np.array_equal(np.asarray(comparison.expected_image), np.asarray(image))
+        PIL.Image.new("RGB", (40, 50)).save(actual_image_path)
+        comparison = image_cache_tester.compare_images._compare_images(actual_image_path, image_path, False)
+        assert not comparison.passed
+        assert comparison.difference_image.size == (50, 40)
+
+
+def test_image_pack_invalid_compression() -> None:
+    """Test that an invalid compression raises an error."""
+    with tempfile.TemporaryDirectory() as root, pytest.raises(ValueError, match="Invalid compression"):
+        image_cache_tester.image_pack.write_pack(dict(), os.path.join(root, "nb.pack"), "lzma")
+
+
+def test_image_pack_invalid_magic() -> None:
+    """Test that opening a file which is not a pack raises an error."""
+    with tempfile.TemporaryDirectory() as root:
+        pack_path = os.path.join(root, "nb.pack")
+        with open(pack_path, "wb") as f:
+            f.write(b"\0" * 64)
+        with pytest.raises(RuntimeError, match="is not an image pack"):
+            image_cache_tester.image_pack.ImagePack(pack_path)
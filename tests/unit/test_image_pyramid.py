@@ -0,0 +1,124 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Tests for image_cache_tester.image_pyramid module."""
+
+import os
+import tempfile
+
+import numpy as np
+import PIL.Image
+import pytest
+
+import image_cache_tester.compare_arrays
+import image_cache_tester.compare_images
+import image_cache_tester.decoded_image_cache
+import image_cache_tester.image_cache_manifest
+import image_cache_tester.image_pyramid
+
+
+def test_build_pyramid() -> None:
+    """Test that each level of the pyramid contains the sums over its tiles, including the smaller border ones."""
+    image_array = np.random.default_rng(0).integers(0, 256, (100, 70, 3), dtype=np.uint8)
+    pyramid = image_cache_tester.image_pyramid.build_pyramid(image_array, tile_size=16)
+    assert [level.shape for level in pyramid.levels] == [(7, 5, 3), (4, 3, 3), (2, 2, 3), (1, 1, 3)]
+    assert np.array_equal(pyramid.levels[0][6, 4], image_array[96:, 64:].sum(axis=(0, 1)))
+    assert np.array_equal(pyramid.levels[1][1, 2], image_array[32:64, 64:].sum(axis=(0, 1)))
+    assert np.array_equal(pyramid.levels[-1][0, 0], image_array.sum(axis=(0, 1)))
+    assert pyramid.pixel_counts(0)[6, 4] == 4 * 6
+
+
+@pytest.mark.parametrize("tolerances", [
+    image_cache_tester.compare_arrays.Tolerances(),
+    image_cache_tester.compare_arrays.Tolerances(channel_threshold=10, max_differing_fraction=0.01),
+    image_cache_tester.compare_arrays.Tolerances(max_differing_fraction=1.0, max_rmse=2.0),
+    image_cache_tester.compare_arrays.Tolerances(channel_threshold=255, max_rmse=100.0)
+])
+def test_compare_pyramids_matches_compare_arrays(tolerances: image_cache_tester.compare_arrays.Tolerances) -> None:
+    """Test that comparing tile by tile reaches the same verdict as comparing row by row."""
+    rng = np.random.default_rng(0)
+    actual_array = rng.integers(0, 256, (100, 70, 3), dtype=np.uint8)
+    for (box, value) in (((0, 0, 0, 0), 0), ((3, 5, 5, 6), 7), ((40, 60, 50, 70), 255)):
+        expected_array = actual_array.copy()
+        expected_array[box[1]:box[3], box[0]:box[2]] = value
+        expected_metrics = image_cache_tester.compare_arrays.compare_arrays(
+            actual_array, expected_array, tolerances, block_rows=100)
+        metrics, tiles = image_cache_tester.image_pyramid.compare_pyramids(
+            actual_array, expected_array, tolerances, tile_size=16)
+        assert metrics.passed == expected_metrics.passed
+        if metrics.passed:
+            assert metrics == expected_metrics
+            assert sum(tile.differing_pixels for tile in tiles) == metrics.differing_pixels
+        else:
+            assert metrics.differing_pixels <= expected_metrics.differing_pixels
+            assert metrics.rmse <= expected_metrics.rmse
+        for tile in tiles:
+            assert tile.box[0] < box[2] and box[0] < tile.box[2] and tile.box[1] < box[3] and box[1] < tile.box[3]
+
+
+def test_reject_with_stored_pyramid(capsys: pytest.CaptureFixture[str]) -> None:
+    """Test that grossly different images are rejected without decoding the expected image."""
+    with tempfile.TemporaryDirectory() as root:
+        expected_image_path = os.path.join(root, "expected.png")
+        expected_image = PIL.Image.new("RGB", (200, 100), (0, 0, 255))
+        expected_image.save(expected_image_path)
+        image_cache_tester.image_cache_manifest.record(expected_image_path, np.asarray(expected_image))
+        image_cache_tester.image_pyramid.save_pyramid(expected_image_path, np.asarray(expected_image), 32)
+        assert image_cache_tester.image_pyramid.load_pyramid(expected_image_path, "outdated", 32) is None
+        assert image_cache_tester.image_pyramid.load_pyramid(
+            expected_image_path, image_cache_tester.image_cache_manifest.pixel_digest(np.asarray(expected_image)),
+            16) is None
+        actual_image = expected_image.copy()
+        actual_image.paste((255, 255, 255), (150, 70, 200, 100))
+        actual_image_path = os.path.join(root, "actual.png")
+        actual_image.save(actual_image_path)
+        image_cache_tester.decoded_image_cache.expected_images.clear()
+        comparison = image_cache_tester.compare_images._compare_images(
+            actual_image_path, expected_image_path, True, tile_size=32)
+        assert not comparison.passed
+        assert not comparison.metrics.complete
+        assert image_cache_tester.decoded_image_cache.expected_images.misses == 0
+        assert capsys.readouterr().out.startswith(
+            f"Pyramids of {actual_image_path} and {expected_image_path} differ in tiles [(128, 64, 160, 96), ")
+        assert comparison.tiles is not None
+        assert {tile.box for tile in comparison.tiles} == {
+            (128, 64, 160, 96), (160, 64, 192, 96), (192, 64, 200, 96), (128, 96, 160, 100), (160, 96, 192, 100),
+            (192, 96, 200, 100)}
+        assert all(not tile.exact for tile in comparison.tiles)
+        assert comparison.difference_image.getbbox() == (150, 70, 200, 100)
+        assert image_cache_tester.decoded_image_cache.expected_images.misses == 1
+        comparison = image_cache_tester.compare_images._compare_images(
+            actual_image_path, expected_image_path, False,
+            tolerances=image_cache_tester.compare_arrays.Tolerances(max_differing_fraction=0.1), tile_size=32)
+        assert comparison.passed
+        assert comparison.tiles is not None
+        assert all(tile.exact for tile in comparison.tiles)
+        assert sum(tile.differing_pixels for tile in comparison.tiles) == 50 * 30
+
+
+def test_compare_images_without_up_to_date_pyramid() -> None:
+    """Test that the expected image is decoded if its pyramid is missing, outdated or of a different shape."""
+    with tempfile.TemporaryDirectory() as root:
+        expected_image_path = os.path.join(root, "expected.png")
+        expected_image = PIL.Image.new("RGB", (200, 100), (0, 0, 255))
+        expected_image.save(expected_image_path)
+        actual_image = expected_image.copy()
+        actual_image.paste((255, 255, 255), (150, 70, 200, 100))
+        actual_image_path = os.path.join(root, "actual.png")
+        actual_image.save(actual_image_path)
+        assert image_cache_tester.image_pyramid.load_pyramid(expected_image_path, "digest", 32) is None
+        image_cache_tester.decoded_image_cache.expected_images.clear()
+        for stage in ("no manifest", "no pyramid", "different shape"):
+            if stage == "no pyramid":
+                image_cache_tester.image_cache_manifest.record(expected_image_path, np.asarray(expected_image))
+            elif stage == "different shape":
+                image_cache_tester.image_pyramid.save_pyramid(
+                    expected_image_path, np.asarray(expected_image)[:50], 32)
+            comparison = image_cache_tester.compare_images._compare_images(
+                actual_image_path, expected_image_path, False, tile_size=32)
+            assert not comparison.passed
+            assert comparison.tiles is not None
+            assert image_cache_tester.decoded_image_cache.expected_images.misses == 1
+            image_cache_tester.decoded_image_cache.expected_images.clear()
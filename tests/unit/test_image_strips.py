@@ -0,0 +1,271 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Tests for image_cache_tester.image_strips module."""
+
+import io
+import os
+import tempfile
+import tracemalloc
+
+import numpy as np
+import numpy.typing as npt
+import PIL.Image
+import PIL.PngImagePlugin
+import pytest
+
+import image_cache_tester.compare_arrays
+import image_cache_tester.compare_images
+import image_cache_tester.image_cache_manifest
+import image_cache_tester.image_masks
+import image_cache_tester.image_pack
+import image_cache_tester.image_strips
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L", "LA", "P", "1"])
+@pytest.mark.parametrize("optimize", [False, True])
+def test_iter_file_strips(mode: str, optimize: bool) -> None:
+    """Test that decoding an image in strips matches decoding it at once, for any filter used by the encoder."""
+    image_array = np.random.default_rng(0).integers(0, 256, (37, 23, 3), dtype=np.uint8)
+    image_array[10:20] = 128
+    image = PIL.Image.fromarray(image_array).convert(mode)
+    with tempfile.TemporaryDirectory() as root:
+        image_path = os.path.join(root, "image.png")
+        image.save(image_path, optimize=optimize)
+        expected_array = np.asarray(PIL.Image.open(image_path).convert("RGB"))
+        for strip_rows in (1, 5, 37, 100):
+            strips = list(image_cache_tester.image_strips.iter_file_strips(image_path, strip_rows))
+            assert all(strip.shape[0] <= strip_rows for strip in strips)
+            assert np.array_equal(np.concatenate(strips), expected_array)
+
+
+@pytest.mark.parametrize("compression", ["raw", "zlib"])
+def test_pack_iter_strips(compression: str) -> None:
+    """Test that loading an image from a pack in strips matches loading it at once."""
+    image_array = np.random.default_rng(0).integers(0, 256, (37, 23, 3), dtype=np.uint8)
+    with tempfile.TemporaryDirectory() as root:
+        pack_path = os.path.join(root, "images.pack")
+        image_cache_tester.image_pack.write_pack({"image.png": image_array}, pack_path, compression)
+        with image_cache_tester.image_pack.ImagePack(pack_path) as pack:
+            for strip_rows in (1, 5, 100):
+                # Raw strips are views of the memory map, so they must not outlive the pack
+                assert np.array_equal(np.concatenate(list(pack.iter_strips("image.png", strip_rows))), image_array)
+
+
+@pytest.mark.parametrize("masked", [False, True])
+def test_compare_images_in_strips(masked: bool) -> None:
+    """Test that comparing in strips gives the same metrics as comparing at once."""
+    rng = np.random.default_rng(0)
+    actual_array = rng.integers(0, 256, (120, 90, 3), dtype=np.uint8)
+    expected_array = actual_array.copy()
+    expected_array[50:70, 10:40] += 3
+    expected_array[100:110, 80:90] = 0
+    regions = image_cache_tester.image_masks.Regions(exclude=((75, 95, 90, 120), )) if masked else (
+        image_cache_tester.image_masks.Regions())
+    with tempfile.TemporaryDirectory() as root:
+        actual_image_path = os.path.join(root, "actual.png")
+        expected_image_path = os.path.join(root, "expected.png")
+        PIL.Image.fromarray(actual_array).save(actual_image_path)
+        PIL.Image.fromarray(expected_array).save(expected_image_path)
+        if masked:
+            mask_array = np.full(actual_array.shape, 255, dtype=np.uint8)
+            mask_array[55:60] = 0
+            PIL.Image.fromarray(mask_array).save(image_cache_tester.image_masks.mask_path(expected_image_path))
+        for tolerances in (
+            image_cache_tester.compare_arrays.Tolerances(),
+            image_cache_tester.compare_arrays.Tolerances(channel_threshold=3, max_differing_fraction=0.1)
+        ):
+            expected_comparison = image_cache_tester.compare_images._compare_images(
+                actual_image_path, expected_image_path, False, tolerances=tolerances, regions=regions)
+            comparison = image_cache_tester.compare_images._compare_images(
+                actual_image_path, expected_image_path, False, tolerances=tolerances, regions=regions,
+                memory_limit=64 * 90 * 7)
+            assert comparison.passed == expected_comparison.passed
+            if comparison.metrics.complete:
+                assert comparison.metrics == expected_comparison.metrics
+            assert np.array_equal(
+                np.asarray(comparison.difference_image), np.asarray(expected_comparison.difference_image))
+        with pytest.raises(ValueError, match="cannot be carried out tile by tile"):
+            image_cache_tester.compare_images._compare_images(
+                actual_image_path, expected_image_path, False, tile_size=32, memory_limit=2**20)
+
+
+def test_compare_images_in_strips_bounded_memory() -> None:
+    """Test that the memory used while comparing in strips does not depend on the image size."""
+    image_array = np.zeros((2048, 1024, 3), dtype=np.uint8)
+    image_array[:, :, 0] = np.arange(1024) % 256
+    with tempfile.TemporaryDirectory() as root:
+        actual_image_path = os.path.join(root, "actual.png")
+        expected_image_path = os.path.join(root, "expected.png")
+        PIL.Image.fromarray(image_array).save(actual_image_path)
+        image_array[-1, -1] = 255
+        PIL.Image.fromarray(image_array).save(expected_image_path)
+        del image_array
+        tracemalloc.start()
+        try:
+            comparison = image_cache_tester.compare_images._compare_images(
+                actual_image_path, expected_image_path, False, memory_limit=2**20)
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert not comparison.passed
+        assert comparison.metrics.differing_pixels == 1
+        assert peak_memory < 2 * 2**20
+
+
+def test_iter_file_strips_fallback() -> None:
+    """Test that images which cannot be decoded incrementally are decoded at once, and then split in strips."""
+    image_array = np.random.default_rng(0).integers(0, 256, (37, 23, 3), dtype=np.uint8)
+    with tempfile.TemporaryDirectory() as root:
+        image_path = os.path.join(root, "image.bmp")
+        PIL.Image.fromarray(image_array).save(image_path)
+        with open(image_path, "rb") as f:
+            assert image_cache_tester.image_strips._read_png_header(f) is None
+        strips = list(image_cache_tester.image_strips.iter_file_strips(image_path, 5))
+        assert all(strip.shape[0] <= 5 for strip in strips)
+        assert np.array_equal(np.concatenate(strips), image_array)
+
+
+def test_iter_file_strips_ancillary_chunks() -> None:
+    """Test that chunks which are not required to decode the image are skipped."""
+    image_array = np.random.default_rng(0).integers(0, 256, (37, 23, 3), dtype=np.uint8)
+    png_info = PIL.PngImagePlugin.PngInfo()
+    png_info.add_text("Software", "image_cache_tester")
+    with tempfile.TemporaryDirectory() as root:
+        image_path = os.path.join(root, "image.png")
+        PIL.Image.fromarray(image_array).save(image_path, pnginfo=png_info)
+        strips = list(image_cache_tester.image_strips.iter_file_strips(image_path, 5))
+        assert np.array_equal(np.concatenate(strips), image_array)
+
+
+@pytest.mark.parametrize("png", [
+    image_cache_tester.image_strips._png_signature,
+    image_cache_tester.image_strips._png_signature + image_cache_tester.image_strips._png_chunk(b"IDAT", b"")
+])
+def test_read_png_header_invalid(png: bytes) -> None:
+    """Test that a PNG image truncated before its image data, or without a header chunk, is not decoded in strips."""
+    assert image_cache_tester.image_strips._read_png_header(io.BytesIO(png)) is None
+
+
+def test_iter_file_strips_truncated() -> None:
+    """Test that decoding a PNG image with truncated image data raises an error."""
+    image_array = np.random.default_rng(0).integers(0, 256, (37, 23, 3), dtype=np.uint8)
+    with tempfile.TemporaryDirectory() as root:
+        image_path = os.path.join(root, "image.png")
+        PIL.Image.fromarray(image_array).save(image_path)
+        with open(image_path, "r+b") as f:
+            f.truncate(os.path.getsize(image_path) // 2)
+        with pytest.raises(RuntimeError, match="Truncated PNG image data"):
+            list(image_cache_tester.image_strips.iter_file_strips(image_path, 5))
+
+
+def _save_image_cache(root: str, expected_array: npt.NDArray[np.uint8]) -> tuple[str, str]:
+    """Save the expected image in an image cache, returning the path of its cached copy and of an actual image."""
+    expected_image_path = os.path.join(root, ".image_cache", "notebook", "image.png")
+    os.makedirs(os.path.dirname(expected_image_path))
+    PIL.Image.fromarray(expected_array).save(expected_image_path)
+    return os.path.join(root, "actual.png"), expected_image_path
+
+
+@pytest.mark.parametrize("use_digests", [False, True])
+def test_compare_images_in_strips_packed(use_digests: bool) -> None:
+    """Test that comparing in strips to a packed image gives the same metrics as comparing to the image file."""
+    expected_array = np.random.default_rng(0).integers(0, 256, (120, 90, 3), dtype=np.uint8)
+    with tempfile.TemporaryDirectory() as root:
+        actual_image_path, expected_image_path = _save_image_cache(root, expected_array)
+        for actual_array in (expected_array, 255 - expected_array):
+            PIL.Image.fromarray(actual_array).save(actual_image_path)
+            expected_comparison = image_cache_tester.compare_images._compare_images(
+                actual_image_path, expected_image_path, False, memory_limit=64 * 90 * 7)
+            image_cache_tester.image_pack.pack_image_cache(os.path.join(root, ".image_cache"), remove=True)
+            assert not os.path.exists(expected_image_path)
+            comparison = image_cache_tester.compare_images._compare_images(
+                actual_image_path, expected_image_path, False, use_digests=use_digests, memory_limit=64 * 90 * 7)
+            assert comparison.metrics == expected_comparison.metrics
+            assert np.array_equal(np.asarray(comparison.expected_image), expected_array)
+            image_cache_tester.image_pack.unpack_image_cache(os.path.join(root, ".image_cache"), remove=True)
+
+
+def test_compare_images_in_strips_digests() -> None:
+    """Test that strips are not compared if the pixel digest of the expected image matches the actual one."""
+    expected_array = np.random.default_rng(0).integers(0, 256, (120, 90, 3), dtype=np.uint8)
+    with tempfile.TemporaryDirectory() as root:
+        actual_image_path, expected_image_path = _save_image_cache(root, expected_array)
+        actual_array = 255 - expected_array
+        PIL.Image.fromarray(actual_array).save(actual_image_path)
+        # Record a stale digest on purpose, which is only trusted if digests are used
+        image_cache_tester.image_cache_manifest.record(expected_image_path, actual_array)
+        for use_digests in (False, True):
+            comparison = image_cache_tester.compare_images._compare_images(
+                actual_image_path, expected_image_path, False, use_digests=use_digests, memory_limit=64 * 90 * 7)
+            assert comparison.passed == use_digests
+
+
+def test_compare_images_in_strips_missing(capsys: pytest.CaptureFixture[str]) -> None:
+    """Test that comparing in strips to an expected image which does not exist compares to a black image."""
+    actual_array = np.zeros((120, 90, 3), dtype=np.uint8)
+    actual_array[30:40, 20:25] = 255
+    with tempfile.TemporaryDirectory() as root:
+        actual_image_path = os.path.join(root, "actual.png")
+        expected_image_path = os.path.join(root, "expected.png")
+        PIL.Image.fromarray(actual_array).save(actual_image_path)
+        comparison = image_cache_tester.compare_images._compare_images(
+            actual_image_path, expected_image_path, True, memory_limit=2**20)
+        assert not comparison.passed
+        assert comparison.metrics.differing_pixels == 50
+        assert not os.path.exists(expected_image_path)
+        assert np.array_equal(np.asarray(comparison.expected_image), np.zeros_like(actual_array))
+    output = capsys.readouterr().out
+    assert f"Expected image {expected_image_path} does not exist" in output
+    assert "is (20, 30, 25, 40)\n" in output
+
+
+def test_compare_images_in_strips_size_mismatch(capsys: pytest.CaptureFixture[str]) -> None:
+    """Test that comparing in strips images of different sizes fails without decoding them."""
+    with tempfile.TemporaryDirectory() as root:
+        actual_image_path = os.path.join(root, "actual.png")
+        expected_image_path = os.path.join(root, "expected.png")
+        PIL.Image.new("RGB", (90, 120)).save(actual_image_path)
+        PIL.Image.new("RGB", (120, 90)).save(expected_image_path)
+        comparison = image_cache_tester.compare_images._compare_images(
+            actual_image_path, expected_image_path, True, memory_limit=2**20)
+        assert not comparison.passed
+        assert not comparison.metrics.complete
+        assert comparison.metrics.differing_pixels == 120 * 90
+        assert comparison.difference_image.size == (120, 90)
+    assert "while size of" in capsys.readouterr().out
+
+
+def test_compare_images_in_strips_bbox(capsys: pytest.CaptureFixture[str]) -> None:
+    """Test that the bounding box of the difference is built strip by strip, within the rows compared."""
+    actual_array = np.zeros((120, 90, 3), dtype=np.uint8)
+    with tempfile.TemporaryDirectory() as root:
+        actual_image_path = os.path.join(root, "actual.png")
+        expected_image_path = os.path.join(root, "expected.png")
+        PIL.Image.fromarray(actual_array).save(actual_image_path)
+        expected_array = actual_array.copy()
+        expected_array[10:12, 30:35] = 1
+        expected_array[112:120, 5:10] = 1
+        # Differences in excluded regions do not contribute to the bounding box
+        expected_array[50:52, 80:90] = 1
+        regions = image_cache_tester.image_masks.Regions(exclude=((80, 48, 90, 56), ))
+        PIL.Image.fromarray(expected_array).save(expected_image_path)
+        tolerances = image_cache_tester.compare_arrays.Tolerances(max_differing_fraction=0.001)
+        expected_comparison = image_cache_tester.compare_images._compare_images(
+            actual_image_path, expected_image_path, False, tolerances=tolerances, regions=regions)
+        assert expected_comparison.difference_image.getbbox() == (5, 10, 35, 120)
+        capsys.readouterr()
+        # Tolerances are only exceeded in the last strip, hence all rows are compared
+        comparison = image_cache_tester.compare_images._compare_images(
+            actual_image_path, expected_image_path, True, tolerances=tolerances, regions=regions,
+            memory_limit=64 * 90 * 8)
+        assert not comparison.passed
+        assert comparison.metrics.complete
+        assert "is (5, 10, 35, 120)\n" in capsys.readouterr().out
+        # Differences in the rows following the ones which exceed the tolerances are not compared
+        comparison = image_cache_tester.compare_images._compare_images(
+            actual_image_path, expected_image_path, True, memory_limit=64 * 90 * 8)
+        assert not comparison.metrics.complete
+        assert "is (30, 10, 35, 12) within the first 16 rows\n" in capsys.readouterr().out
@@ -0,0 +1,59 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Tests for image_cache_tester.image_trees module."""
+
+import os
+import tempfile
+
+import PIL.Image
+
+import image_cache_tester.image_trees
+
+
+def save_image(path: str, red_pixel: tuple[int, int] | None = None) -> None:
+    """Save a black image, possibly with a red pixel, creating parent directories if needed."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    image = PIL.Image.new("RGB", (50, 50))
+    if red_pixel is not None:
+        image.putpixel(red_pixel, (255, 0, 0))
+    image.save(path)
+
+
+def test_find_image_trees() -> None:
+    """Test that trees of screenshots are found together with the image cache in the same directory."""
+    with tempfile.TemporaryDirectory() as root:
+        work_dir = os.path.join(root, "notebooks", ".ipynb_pytest", "np_1", "collapse_False")
+        save_image(os.path.join(work_dir, ".image_from_pytest", "nb", "real", "cell.png"))
+        save_image(os.path.join(work_dir, ".image_cache", "nb", "real", "cell.png"))
+        assert image_cache_tester.image_trees.find_image_trees(root) == [
+            (os.path.join(work_dir, ".image_from_pytest"), os.path.join(work_dir, ".image_cache"))]
+
+
+def test_verify_image_tree() -> None:
+    """Test that passed, differing, missing and extra images are reported."""
+    with tempfile.TemporaryDirectory() as root:
+        actual_root = os.path.join(root, ".image_from_pytest")
+        expected_root = os.path.join(root, ".image_cache")
+        leaf_dir = os.path.join("nb", "real", "comm_size=1", "comm_rank=0", "static")
+        other_leaf_dir = os.path.join("nb", "real", "comm_size=2", "comm_rank=0", "static")
+        save_image(os.path.join(actual_root, leaf_dir, "same.png"))
+        save_image(os.path.join(expected_root, leaf_dir, "same.png"))
+        save_image(os.path.join(actual_root, leaf_dir, "different.png"), (1, 1))
+        save_image(os.path.join(expected_root, leaf_dir, "different.png"))
+        save_image(os.path.join(actual_root, leaf_dir, "new.png"))
+        save_image(os.path.join(expected_root, leaf_dir, "old.png"))
+        save_image(os.path.join(expected_root, other_leaf_dir, "not_run.png"))
+        verification = image_cache_tester.image_trees.verify_image_tree(
+            actual_root, expected_root, max_workers=2, executor="thread")
+        assert not verification.successful
+        assert verification.passed == [os.path.join(leaf_dir, "same.png")]
+        assert [result.actual_image_path for result in verification.differing] == [
+            os.path.join(actual_root, leaf_dir, "different.png")]
+        assert verification.missing == [os.path.join(leaf_dir, "new.png")]
+        assert verification.extra == [os.path.join(leaf_dir, "old.png")]
+        summary = verification.to_json()
+        assert summary["differing"][0]["path"] == os.path.join(leaf_dir, "different.png")
+        assert summary["differing"][0]["metrics"]["differing_pixels"] == 1
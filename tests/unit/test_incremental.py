@@ -0,0 +1,65 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Tests for image_cache_tester.incremental module."""
+
+import os
+import tempfile
+
+import pytest
+
+import image_cache_tester.incremental
+
+
+def test_tree_fingerprint() -> None:
+    """Test that the fingerprint of a tree changes when a file is added, modified or removed."""
+    with tempfile.TemporaryDirectory() as root:
+        tree = os.path.join(root, "tree")
+        pack = os.path.join(root, "tree.pack")
+        os.makedirs(os.path.join(tree, "subdir"))
+        paths = [tree, pack]
+        fingerprints = [image_cache_tester.incremental.tree_fingerprint(paths)]
+        with open(os.path.join(tree, "subdir", "image.png"), "wb") as f:
+            f.write(b"image")
+        fingerprints.append(image_cache_tester.incremental.tree_fingerprint(paths))
+        with open(pack, "wb") as f:
+            f.write(b"pack")
+        fingerprints.append(image_cache_tester.incremental.tree_fingerprint(paths))
+        assert image_cache_tester.incremental.tree_fingerprint(paths) == fingerprints[-1]
+        with open(os.path.join(tree, "subdir", "image.png"), "wb") as f:
+            f.write(b"other image")
+        fingerprints.append(image_cache_tester.incremental.tree_fingerprint(paths))
+        os.remove(pack)
+        fingerprints.append(image_cache_tester.incremental.tree_fingerprint(paths))
+    assert len(set(fingerprints)) == len(fingerprints)
+
+
+def test_environment_fingerprint(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that the fingerprint of the environment depends on the pyvista backend."""
+    monkeypatch.setenv("VISKEX_PYVISTA_BACKEND", "static")
+    fingerprint = image_cache_tester.incremental.environment_fingerprint()
+    assert image_cache_tester.incremental.environment_fingerprint() == fingerprint
+    monkeypatch.setenv("VISKEX_PYVISTA_BACKEND", "html")
+    assert image_cache_tester.incremental.environment_fingerprint() != fingerprint
+
+
+def test_incremental_verification_update() -> None:
+    """Test that only notebooks whose collected cells all passed are recorded, and failed ones are forgotten."""
+    incremental = image_cache_tester.incremental.IncrementalVerification({"failed": "old", "unchanged": "same"})
+    for notebook in ("passed", "partial", "failed", "unchanged"):
+        for _ in range(2):
+            incremental.collect(notebook)
+    for when in ("setup", "call", "teardown"):
+        for _ in range(2):
+            incremental.report("passed", when, "passed")
+    incremental.report("partial", "call", "passed")
+    incremental.report("partial", "setup", "skipped")
+    incremental.report("failed", "call", "passed")
+    incremental.report("failed", "call", "failed")
+    assert incremental.is_unchanged("unchanged", "same")
+    assert not incremental.is_unchanged("passed", "new")
+    records = incremental.update({notebook: "new" for notebook in ("passed", "partial", "failed", "unchanged")})
+    assert records == {"passed": "new", "unchanged": "same"}
+    assert incremental.is_unchanged("passed", "new")
@@ -0,0 +1,70 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Tests for image_cache_tester.parallel_notebooks module."""
+
+import multiprocessing
+import os
+import tempfile
+import time
+
+import pytest
+
+import image_cache_tester.parallel_notebooks
+
+
+def test_num_workers() -> None:
+    """Test that the number of workers does not oversubscribe the cores, but is at least one."""
+    assert image_cache_tester.parallel_notebooks.num_workers(1, 8) == 8
+    assert image_cache_tester.parallel_notebooks.num_workers(3, 8) == 2
+    assert image_cache_tester.parallel_notebooks.num_workers(16, 8) == 1
+    num_cores = image_cache_tester.parallel_notebooks.available_cores()
+    assert image_cache_tester.parallel_notebooks.num_workers(1) == num_cores
+
+
+def test_distribution_mode() -> None:
+    """Test that only distribution modes which run all cells of a notebook on the same worker are allowed."""
+    assert image_cache_tester.parallel_notebooks.distribution_mode("no") == "no"
+    assert image_cache_tester.parallel_notebooks.distribution_mode("load") == "loadfile"
+    assert image_cache_tester.parallel_notebooks.distribution_mode("loadgroup") == "loadfile"
+    assert image_cache_tester.parallel_notebooks.distribution_mode("loadscope") == "loadscope"
+    with pytest.raises(ValueError, match="Invalid distribution mode each"):
+        image_cache_tester.parallel_notebooks.distribution_mode("each")
+
+
+def _append_while_locked(lock_path: str, output_path: str, value: str) -> None:
+    """Append two lines to a file while holding a lock, waiting between them."""
+    with image_cache_tester.parallel_notebooks.FileLock(lock_path):
+        with open(output_path, "a") as f:
+            f.write(value + "\n")
+        time.sleep(0.1)
+        with open(output_path, "a") as f:
+            f.write(value + "\n")
+
+
+def test_file_lock() -> None:
+    """Test that a file lock is exclusive across processes."""
+    with tempfile.TemporaryDirectory() as root:
+        lock_path = os.path.join(root, "file.lock")
+        output_path = os.path.join(root, "output.txt")
+        processes = [
+            multiprocessing.get_context("spawn").Process(
+                target=_append_while_locked, args=(lock_path, output_path, str(index)))
+            for index in range(3)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        with open(output_path) as f:
+            lines = f.read().splitlines()
+        assert len(lines) == 6
+        assert all(lines[index] == lines[index + 1] for index in range(0, 6, 2))
+        lock = image_cache_tester.parallel_notebooks.FileLock(lock_path)
+        assert not lock.locked
+        lock.acquire()
+        assert lock.locked
+        lock.release()
+        lock.release()
+        assert not lock.locked
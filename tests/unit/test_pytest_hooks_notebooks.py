@@ -0,0 +1,54 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Tests for image_cache_tester.pytest_hooks_notebooks module."""
+
+import pathlib
+import subprocess
+import sys
+
+import nbformat
+import pytest
+
+_conftest = """import image_cache_tester.pytest_hooks_notebooks
+
+pytest_addoption = image_cache_tester.pytest_hooks_notebooks.addoption
+pytest_collect_file = image_cache_tester.pytest_hooks_notebooks.collect_file
+pytest_sessionstart = image_cache_tester.pytest_hooks_notebooks.sessionstart
+"""
+
+
+def _instrument_notebook(root: pathlib.Path, options: list[str]) -> str:
+    """Instrument a notebook using ipyparallel, and return the code of the cell which verifies images."""
+    (root / "conftest.py").write_text(_conftest)
+    (root / ".image_cache").mkdir()
+    nb = nbformat.v4.new_notebook()  # type: ignore[no-untyped-call]
+    nb.cells = [
+        nbformat.v4.new_code_cell(  # type: ignore[no-untyped-call]
+            'import ipyparallel as ipp\n\ncluster = ipp.Cluster(engines="MPI", profile="mpi", n=2)\n'
+            "cluster.start_and_connect_sync()"),
+        nbformat.v4.new_code_cell(  # type: ignore[no-untyped-call]
+            "%%px --no-stream\nimport pyvista\n\nplotter = pyvista.Plotter(off_screen=True)\nplotter.show()"),
+        nbformat.v4.new_code_cell("cluster.stop_cluster_sync()")  # type: ignore[no-untyped-call]
+    ]
+    nbformat.write(nb, root / "notebook.ipynb")  # type: ignore[no-untyped-call]
+    # Notebooks are only created, hence no test is collected
+    result = subprocess.run(
+        [sys.executable, "-m", "pytest", "-p", "no:cacheprovider", "--coverage-run-allow", "--verify-images",
+         "--ipynb-action=create-notebooks", *options, str(root)],
+        cwd=root, capture_output=True, text=True)
+    assert result.returncode == pytest.ExitCode.NO_TESTS_COLLECTED, result.stdout + result.stderr
+    instrumented_nb = nbformat.read(  # type: ignore[no-untyped-call]
+        root / ".ipynb_pytest" / "np_1" / "collapse_False" / "notebook.ipynb", as_version=4)
+    return next(cell.source for cell in instrumented_nb.cells if cell.get("id") == "image_paths")  # type: ignore[no-any-return]
+
+
+@pytest.mark.parametrize("options,display", [
+    ([], True), (["--image-rank-summary"], False), (["--image-display=composite"], False)
+])
+def test_sessionstart_plotter_display(tmp_path: pathlib.Path, options: list[str], display: bool) -> None:
+    """Test that pyvista displays plotters only when screenshots are displayed at full resolution on each rank."""
+    image_paths_code = _instrument_notebook(tmp_path, options)
+    assert f"display={display})" in image_paths_code
@@ -0,0 +1,81 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Tests for image_cache_tester.rank_verdicts module."""
+
+import io
+import os
+import tempfile
+
+import mpi4py.MPI
+import PIL.Image
+
+import image_cache_tester.compare_images
+import image_cache_tester.rank_verdicts
+
+
+def test_rank_verdicts_make_verdict() -> None:
+    """Test that a thumbnail with the actual, expected and difference images is only attached to failures."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        actual_image_path = os.path.join(tmp_dir, "actual.png")
+        expected_image_path = os.path.join(tmp_dir, "expected.png")
+        PIL.Image.new("RGB", (400, 200)).save(expected_image_path)
+        PIL.Image.new("RGB", (400, 200)).save(actual_image_path)
+        comparison = image_cache_tester.compare_images._compare_images(actual_image_path, expected_image_path, False)
+        verdict = image_cache_tester.rank_verdicts.make_verdict("cell", 0, comparison, False)
+        assert verdict.passed
+        assert verdict.thumbnail is None
+        PIL.Image.new("RGB", (400, 200), (255, 0, 0)).save(actual_image_path)
+        comparison = image_cache_tester.compare_images._compare_images(actual_image_path, expected_image_path, False)
+        verdict = image_cache_tester.rank_verdicts.make_verdict("cell", 0, comparison, False, thumbnail_size=100)
+        assert not verdict.passed
+        assert verdict.thumbnail is not None
+        thumbnail = PIL.Image.open(io.BytesIO(verdict.thumbnail))
+        assert thumbnail.size == (300, 50)
+        assert thumbnail.getpixel((0, 0)) == (255, 0, 0)
+        assert thumbnail.getpixel((150, 0)) == (0, 0, 0)
+        assert thumbnail.getpixel((250, 0)) == (255, 0, 0)
+
+
+def test_rank_verdicts_gather_and_summarize() -> None:
+    """Test that gathered verdicts are summarized by cell."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        actual_image_path = os.path.join(tmp_dir, "actual.png")
+        expected_image_path = os.path.join(tmp_dir, "expected.png")
+        PIL.Image.new("RGB", (50, 50)).save(expected_image_path)
+        PIL.Image.new("RGB", (50, 50), (0, 0, 255)).save(actual_image_path)
+        comparison = image_cache_tester.compare_images._compare_images(actual_image_path, expected_image_path, False)
+    verdicts = [
+        image_cache_tester.rank_verdicts.make_verdict(cell_id, mpi4py.MPI.COMM_WORLD.rank, comparison, False)
+        for cell_id in ("first_cell", "second_cell")]
+    all_verdicts = image_cache_tester.rank_verdicts.gather_verdicts(verdicts, mpi4py.MPI.COMM_WORLD)
+    if mpi4py.MPI.COMM_WORLD.rank == 0:
+        assert all_verdicts is not None
+        assert len(all_verdicts) == 2 * mpi4py.MPI.COMM_WORLD.size
+        summary = image_cache_tester.rank_verdicts.summarize_verdicts(all_verdicts)
+        assert summary.splitlines()[0] == f"{len(all_verdicts)} of {len(all_verdicts)} image verifications failed"
+        assert summary.splitlines()[1].startswith("Cell first_cell failed on ranks 0")
+    else:
+        assert all_verdicts is None
+    # The world communicator is used by default
+    assert (image_cache_tester.rank_verdicts.gather_verdicts(verdicts) is None) == (mpi4py.MPI.COMM_WORLD.rank != 0)
+
+
+class _NonRootComm:
+    """Communicator emulating a rank other than the root, on which gather returns None."""
+
+    rank = 1
+
+    def gather(
+        self, verdicts: list[image_cache_tester.rank_verdicts.Verdict], root: int
+    ) -> list[list[image_cache_tester.rank_verdicts.Verdict]] | None:
+        """Send the verdicts to the root rank."""
+        assert root != self.rank
+        return None
+
+
+def test_rank_verdicts_gather_on_non_root_rank() -> None:
+    """Test that no verdict is returned on ranks other than the root one."""
+    assert image_cache_tester.rank_verdicts.gather_verdicts([], _NonRootComm()) is None  # type: ignore[arg-type]
@@ -0,0 +1,71 @@
+# Copyright (C) 2024-2026 by the viskex authors
+#
+# This file is part of image cache testing for viskex.
+#
+# SPDX-License-Identifier: MIT
+"""Tests for image_cache_tester.timings module."""
+
+import os
+import tempfile
+
+import PIL.Image
+
+import image_cache_tester.compare_images
+import image_cache_tester.timings
+
+
+def test_timings_recorder() -> None:
+    """Test that phases are only timed when recording is enabled, and are attributed to the current cell."""
+    recorder = image_cache_tester.timings.TimingRecorder()
+    with recorder.cell("cell"), recorder.phase("phase", 10):
+        pass
+    assert recorder.cells == {}
+    recorder.enabled = True
+    with recorder.cell("cell"):
+        for _ in range(2):
+            with recorder.phase("phase", 10):
+                pass
+        recorder.add_bytes("phase", 5)
+    with recorder.phase("phase"):
+        pass
+    assert set(recorder.cells) == {"cell", ""}
+    assert recorder.cells["cell"]["phase"].calls == 2
+    assert recorder.cells["cell"]["phase"].bytes == 25
+    assert recorder.cells["cell"]["phase"].seconds > 0
+
+
+def test_timings_write_load_and_merge() -> None:
+    """Test that timings written by each rank are merged taking the maximum time and the total bytes."""
+    with tempfile.TemporaryDirectory() as timings_dir:
+        assert image_cache_tester.timings.load_timings(os.path.join(timings_dir, "missing")) == {}
+        for comm_rank in range(2):
+            recorder = image_cache_tester.timings.TimingRecorder()
+            recorder.cells = {"cell": {"phase": image_cache_tester.timings.PhaseTimings(comm_rank + 1.0, 1, 100)}}
+            recorder.write(image_cache_tester.timings.rank_timings_path(timings_dir, comm_rank))
+        all_timings = image_cache_tester.timings.load_timings(timings_dir)
+    assert list(all_timings) == [0, 1]
+    merged = image_cache_tester.timings.merge_ranks(all_timings)
+    assert merged == {"cell": {"phase": image_cache_tester.timings.PhaseTimings(2.0, 2, 200)}}
+    lines = image_cache_tester.timings.summarize_timings({"notebook.ipynb": merged})
+    assert "  phase: 2.000s in 2 calls, 0.0 MiB" in lines
+    assert "  notebook.ipynb::cell: 0.000s" in lines
+
+
+def test_timings_compare_images_phases() -> None:
+    """Test that comparing images records the decoding and comparison phases."""
+    recorder = image_cache_tester.timings.recorder
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        actual_image_path = os.path.join(tmp_dir, "actual.png")
+        expected_image_path = os.path.join(tmp_dir, "expected.png")
+        PIL.Image.new("RGB", (40, 20)).save(actual_image_path)
+        PIL.Image.new("RGB", (40, 20), (0, 0, 255)).save(expected_image_path)
+        recorder.enabled = True
+        try:
+            with recorder.cell("compare_images"):
+                image_cache_tester.compare_images._compare_images(actual_image_path, expected_image_path, False)
+        finally:
+            recorder.enabled = False
+    phases = recorder.cells.pop("compare_images")
+    assert set(phases) == {"decode_actual", "decode_expected", "compare"}
+    assert phases["decode_actual"].bytes == 40 * 20 * 3
+    assert phases["compare"].bytes == 2 * 40 * 20 * 3